@@ -2,7 +2,87 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     MONGO_URI: str
-    LLM_PROVIDER: str = "GEMINI"  # GEMINI or OPENAI
+    MONGO_DB_NAME: str = "ai_data_analyst"
+    # Connection pool tuning for the shared AsyncIOMotorClient
+    MONGO_MAX_POOL_SIZE: int = 50
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: int = 60000
+    MONGO_CONNECT_TIMEOUT_MS: int = 5000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    MONGO_SOCKET_TIMEOUT_MS: int | None = None
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int | None = 10000
+    MONGO_CREATE_INDEXES: bool = True
+    DATASETS_PAGE_SIZE: int = 50
+    DATASETS_MAX_PAGE_SIZE: int = 200
+    # Import heavy modules and create the LLM client during startup instead of on the first request
+    WARMUP_ON_STARTUP: bool = False
+    # Server-side PNG/SVG rendering of chart specifications
+    CHART_RENDER_WORKERS: int = 2
+    CHART_RENDER_CACHE_SIZE: int = 256
+    # Direct-parsed chart answers by chart id (ETag, 304 on If-None-Match, GET /charts/{chart_id})
+    CHART_CACHE_ENABLED: bool = True
+    CHART_CACHE_MAX_ENTRIES: int = 512
+    CHART_CACHE_TTL_S: int = 7 * 24 * 3600
+    # Materialized group-by rollups for (dimension, measure) pairs charted at least ROLLUP_MIN_REQUESTS times
+    ROLLUPS_ENABLED: bool = True
+    ROLLUP_MIN_REQUESTS: int = 3
+    ROLLUP_MAX_GROUPS: int = 5000
+    # Approximate mode (/analyze?approximate=true): persisted stratified sample for datasets of at least APPROX_MIN_ROWS rows
+    APPROX_MIN_ROWS: int = 200_000
+    APPROX_SAMPLE_ROWS: int = 50_000
+    APPROX_MIN_PER_STRATUM: int = 50
+    APPROX_MAX_STRATA: int = 50
+    # Compression of files stored in GridFS: zstd (needs the zstandard package, gzip otherwise), gzip or none
+    DATASET_COMPRESSION: str = "zstd"
+    DATASET_COMPRESSION_LEVEL: int | None = None  # codec default when unset
+    # Columnar copies of dataset files on local disk, memory-mapped on load and shared by the workers of a host
+    DATASET_DISK_CACHE_ENABLED: bool = True
+    DATASET_DISK_CACHE_DIR: str = "dataset_cache"
+    DATASET_DISK_CACHE_MAX_BYTES: int = 2 * 1024 ** 3
+    # Publish loaded dataset files to shared memory so all uvicorn workers of a host attach to one copy
+    DATASET_SHARED_MEMORY: bool = False
+    DATASET_SHARED_MEMORY_MAX_BYTES: int = 1024 ** 3  # per worker, published and attached each
+    # Joins with the other datasets of an analyze request (dataset_ids)
+    JOIN_MAX_DATASETS: int = 5
+    JOIN_MAX_ROWS: int = 5_000_000
+    JOIN_CACHE_MAX_BYTES: int = 512 * 1024 ** 2  # cached join results per worker
+    # Admission control for /analyze (per worker): concurrent questions, estimated memory of the datasets
+    # they load, and how many may wait and for how long before getting a 503 with Retry-After
+    ANALYZE_MAX_CONCURRENT: int = 8
+    ANALYZE_MEMORY_BUDGET_BYTES: int = 2 * 1024 ** 3
+    ANALYZE_MAX_QUEUED: int = 32
+    ANALYZE_QUEUE_TIMEOUT_S: float = 10.0
+    ANALYZE_RETRY_AFTER_S: int = 5
+    AGENT_MAX_ITERATIONS: int = 5
+    # Approximate token budget for the column list in the agent prompt; columns beyond it
+    # are left out, most relevant to the question first, and found through dataset_info
+    PROMPT_SCHEMA_TOKEN_BUDGET: int = 400
+    PROMPT_FEW_SHOT_EXAMPLE: bool = True
+    # Request tracing: spans exported to none, console, file (JSON lines) or otel, plus a Server-Timing header
+    TRACING_ENABLED: bool = True
+    TRACING_EXPORTER: str = "none"
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    LLM_PROVIDER: str = "GEMINI"  # GEMINI, OPENAI or FAKE (scripted, offline)
+    LLM_MODEL: str | None = None  # provider default when unset
+    # Per query class overrides, e.g. {"schema": "GEMINI:gemini-2.5-flash-lite"}; classes: schema, chart, stats
+    LLM_QUERY_CLASS_MODELS: dict[str, str] = {}
+    LLM_FAKE_SCRIPT_PATH: str | None = None
+    LLM_FAKE_LATENCY_MS: float = 0.0
+    # Rate limiting, retries and circuit breaking around provider calls (per worker)
+    LLM_RESILIENCE_ENABLED: bool = True
+    LLM_RATE_LIMIT_PER_S: float = 5.0
+    LLM_RATE_LIMIT_BURST: int = 10
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY_S: float = 0.5
+    LLM_RETRY_MAX_DELAY_S: float = 8.0
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RESET_S: float = 30.0
+    # Completion cache for temperature-0 calls (in-memory LRU, optionally persisted to Mongo)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 2048
+    LLM_CACHE_TTL_S: int = 24 * 3600
+    LLM_CACHE_MONGO: bool = False
+    LLM_CACHE_NAMESPACE: str = "v1"  # bump to invalidate cached completions after prompt changes
     OPENAI_API_KEY: str | None = None
     GEMINI_API_KEY: str | None = None
     CORS_ORIGINS: list[str] = ["http://localhost:3000", "http://localhost:5173"]
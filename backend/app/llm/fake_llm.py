@@ -0,0 +1,85 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Deterministic stand-in for a chat model that replays scripted ReAct traces, so the
+# whole /analyze pipeline can be load tested without network access or API keys.
+#
+# Script file format (LLM_FAKE_SCRIPT_PATH):
+# {
+#   "traces": [{"match": "average|mean", "steps": ["Thought: ...\nAction: describe\nAction Input: [\"Sales\"]", "Thought: I have the answer\nFinal Answer: ..."]}],
+#   "default": ["...", "..."]
+# }
+# A trace is picked by the first "match" regex found in the question, and the step
+# by the number of observations already in the scratchpad. "{question}" in a step is
+# replaced with the question.
+
+DEFAULT_TRACE = [
+    "Thought: I should look at the dataset structure first\nAction: dataset_info\nAction Input: columns",
+    "Thought: I have the answer\nFinal Answer: Scripted answer for: {question}",
+]
+
+def load_script(path: Optional[str]) -> dict:
+    if not path:
+        return {"traces": [], "default": DEFAULT_TRACE}
+    with open(path, "r", encoding="utf-8") as f:
+        script = json.load(f)
+    script.setdefault("traces", [])
+    script.setdefault("default", DEFAULT_TRACE)
+    return script
+
+class ScriptedChatModel(BaseChatModel):
+    script: dict
+    latency_ms: float = 0.0
+    model_name: str = "scripted"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(m.content) for m in messages)
+        # The ReAct template ends with "Question: {input}\nThought: {agent_scratchpad}"
+        question_at = prompt.rfind("\nQuestion: ")
+        tail = prompt[question_at + 1:] if question_at >= 0 else prompt
+        question = tail.split("\n", 1)[0][len("Question: "):] if question_at >= 0 else ""
+        step = tail.count("\nObservation:")
+
+        steps = self.script["default"]
+        for trace in self.script["traces"]:
+            if re.search(trace["match"], question, re.IGNORECASE):
+                steps = trace["steps"]
+                break
+        text = steps[min(step, len(steps) - 1)].replace("{question}", question)
+
+        # Rough token counts so usage-based metrics behave like a real provider
+        input_tokens = len(prompt) // 4
+        output_tokens = len(text) // 4
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(messages)
@@ -0,0 +1,120 @@
+import datetime
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from ..config import settings
+from ..deps import get_db
+from ..utils.metrics import register_collector
+
+# Completion cache for the chat models behind LLMClient. Keys hash the full prompt
+# (schema, question and scratchpad) together with LangChain's llm_string, which
+# carries the model name/version and call parameters, plus LLM_CACHE_NAMESPACE so a
+# prompt template change can invalidate everything at once.
+
+cache_stats = {"hits": 0, "misses": 0, "mongo_hits": 0}
+register_collector(
+    "llm_cache_requests_total", "LLM completion cache lookups by result", "counter", ("result",),
+    lambda: [(("hit",), cache_stats["hits"]), (("miss",), cache_stats["misses"]), (("mongo_hit",), cache_stats["mongo_hits"])])
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    payload = f"{settings.LLM_CACHE_NAMESPACE}\x00{llm_string}\x00{prompt}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class PromptCache(BaseCache):
+    """In-memory LRU with TTL, optionally backed by the llm_cache Mongo collection"""
+
+    def __init__(self, max_entries: int, ttl_s: int, use_mongo: bool = False):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.use_mongo = use_mongo
+        self._entries = OrderedDict()
+
+    def _get_memory(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: RETURN_VAL_TYPE):
+        self._entries[key] = (time.time() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self._get_memory(cache_key(prompt, llm_string))
+        cache_stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self._set_memory(cache_key(prompt, llm_string), return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self._entries.clear()
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        value = self._get_memory(key)
+        if value is None and self.use_mongo:
+            value = await self._mongo_lookup(key)
+            if value is not None:
+                cache_stats["mongo_hits"] += 1
+                self._set_memory(key, value)
+        cache_stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        self._set_memory(key, return_val)
+        if self.use_mongo:
+            await self._mongo_update(key, return_val)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear()
+        if self.use_mongo:
+            await get_db().llm_cache.delete_many({})
+
+    async def _mongo_lookup(self, key: str):
+        try:
+            doc = await get_db().llm_cache.find_one({"_id": key})
+            if not doc:
+                return None
+            # pymongo hands back naive UTC datetimes
+            expires_at = doc["expires_at"].replace(tzinfo=datetime.timezone.utc)
+            if expires_at.timestamp() < time.time():
+                return None
+            return [loads(g) for g in doc["generations"]]
+        except Exception as e:
+            # A cache read must never fail the LLM call
+            print(f"LLM cache lookup failed: {e}")
+            return None
+
+    async def _mongo_update(self, key: str, return_val: RETURN_VAL_TYPE):
+        try:
+            expires_at = datetime.datetime.fromtimestamp(time.time() + self.ttl_s, tz=datetime.timezone.utc)
+            await get_db().llm_cache.replace_one(
+                {"_id": key},
+                {"_id": key, "generations": [dumps(g) for g in return_val], "expires_at": expires_at},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"LLM cache write failed: {e}")
+
+_cache = None
+def get_llm_cache() -> PromptCache:
+    global _cache
+    if _cache is None:
+        _cache = PromptCache(
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            ttl_s=settings.LLM_CACHE_TTL_S,
+            use_mongo=settings.LLM_CACHE_MONGO,
+        )
+    return _cache
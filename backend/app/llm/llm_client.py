@@ -1,36 +1,38 @@
 from ..config import settings
-from langchain_google_genai import ChatGoogleGenerativeAI
+from .providers import create_chat_model, parse_model_spec
+from .llm_cache import get_llm_cache
+from .resilience import ResilientChatModel
 import os
 
 
 class LLMClient:
-    def __init__(self):
-        provider = settings.LLM_PROVIDER.upper()
+    def __init__(self, provider: str = None, model: str = None, temperature: float = 0.0):
+        provider = (provider or settings.LLM_PROVIDER).upper()
         self.provider = provider
-        if provider == "GEMINI" and not settings.GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY is not set in environment variables.")
-        if provider == "GEMINI":
-            self._client = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=settings.GEMINI_API_KEY, temperature=0.0)
-        elif provider == "OPENAI":
-            # Assuming an OpenAI client would be initialized here if needed
-            # For now, we'll keep it as ChatGoogleGenerativeAI for consistency with the original code's structure
-            # This part would need to be properly implemented if OpenAI is truly intended to be used.
-            self._client = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=settings.GEMINI_API_KEY, temperature=0.0) # Placeholder
-        else:
-            raise ValueError(f"Unsupported LLM_PROVIDER: {provider}")
-        
+        self.model = model or settings.LLM_MODEL
+        self.temperature = temperature
+        # LangChain chat model for the configured provider, see providers.PROVIDERS
+        self._client = create_chat_model(provider, self.model, temperature)
+        if settings.LLM_RESILIENCE_ENABLED:
+            self._client = ResilientChatModel(inner=self._client, provider=provider)
+        # Only deterministic calls are worth caching
+        if settings.LLM_CACHE_ENABLED and temperature == 0:
+            self._client.cache = get_llm_cache()
+
+    @classmethod
+    def for_query_class(cls, query_class: str = None):
+        """Client for a query class, using LLM_QUERY_CLASS_MODELS ("PROVIDER:model") when configured"""
+        spec = settings.LLM_QUERY_CLASS_MODELS.get(query_class) if query_class else None
+        if spec:
+            provider, model = parse_model_spec(spec)
+            return cls(provider=provider, model=model)
+        return cls()
 
     def chat(self, prompt: str, temperature: float = 0.0, max_tokens: int = 1024):
-        if self.provider == "OPENAI":
-            resp = self._client.ChatCompletion.create(
-                model="gpt-4o-mini",  # adapt the model name
-                messages=[{"role":"user","content":prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            return resp["choices"][0]["message"]["content"]
-        elif self.provider == "GEMINI":
-            from langchain_core.messages import HumanMessage
-            message = HumanMessage(content=prompt)
-            resp = self._client.invoke([message], temperature=temperature, max_tokens=max_tokens)
-            return resp.content
\ No newline at end of file
+        from langchain_core.messages import HumanMessage
+        message = HumanMessage(content=prompt)
+        client = self._client
+        if temperature != 0 and client.cache:
+            client = client.model_copy(update={"cache": False})
+        resp = client.invoke([message], temperature=temperature, max_tokens=max_tokens)
+        return resp.content
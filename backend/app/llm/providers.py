@@ -0,0 +1,65 @@
+from ..config import settings
+
+# Registry of chat model providers behind LLMClient. Each factory takes
+# (model, temperature) and returns a LangChain chat model; SDKs are imported
+# inside the factory so only the configured provider is ever loaded.
+
+PROVIDERS = {}
+DEFAULT_MODELS = {}
+
+def register_provider(name: str, default_model: str):
+    def decorator(factory):
+        PROVIDERS[name.upper()] = factory
+        DEFAULT_MODELS[name.upper()] = default_model
+        return factory
+    return decorator
+
+@register_provider("GEMINI", "gemini-2.5-flash")
+def gemini_chat_model(model: str, temperature: float):
+    if not settings.GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY is not set in environment variables.")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=settings.GEMINI_API_KEY,
+        temperature=temperature,
+        # ResilientChatModel does the retrying, don't back off twice
+        max_retries=1 if settings.LLM_RESILIENCE_ENABLED else 6,
+    )
+
+@register_provider("OPENAI", "gpt-4o-mini")
+def openai_chat_model(model: str, temperature: float):
+    if not settings.OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY is not set in environment variables.")
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError:
+        raise ValueError("LLM_PROVIDER=OPENAI requires the langchain-openai package.")
+    return ChatOpenAI(
+        model=model,
+        api_key=settings.OPENAI_API_KEY,
+        temperature=temperature,
+        max_retries=0 if settings.LLM_RESILIENCE_ENABLED else 2,
+    )
+
+@register_provider("FAKE", "scripted")
+def fake_chat_model(model: str, temperature: float):
+    from .fake_llm import ScriptedChatModel, load_script
+    return ScriptedChatModel(
+        script=load_script(settings.LLM_FAKE_SCRIPT_PATH),
+        latency_ms=settings.LLM_FAKE_LATENCY_MS,
+        model_name=model,
+    )
+
+def parse_model_spec(spec: str):
+    """"GEMINI:gemini-2.5-flash-lite" -> ("GEMINI", "gemini-2.5-flash-lite"); a bare model keeps the default provider"""
+    if ":" in spec:
+        provider, model = spec.split(":", 1)
+        return provider.strip().upper(), model.strip() or None
+    return settings.LLM_PROVIDER.upper(), spec.strip() or None
+
+def create_chat_model(provider: str, model: str = None, temperature: float = 0.0):
+    provider = provider.upper()
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unsupported LLM_PROVIDER: {provider}")
+    return PROVIDERS[provider](model or DEFAULT_MODELS[provider], temperature)
@@ -0,0 +1,167 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from ..config import settings
+
+# Client-side protection around provider calls: a token bucket shared by every
+# request in the worker, jittered exponential backoff on rate limit / transient
+# errors, and a circuit breaker that fails fast while the provider is degraded.
+
+class ProviderUnavailableError(Exception):
+    """Raised instead of calling the provider while its circuit breaker is open"""
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: int):
+        self.rate = rate_per_s
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, possibly borrowing against future refills; returns how long to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout_s: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half_open"
+        return "open"
+
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "half_open":
+                # Let a single probe through; it closes or re-opens the breaker
+                self.opened_at = time.monotonic()
+                return True
+            return state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, overload and transient network errors; bad requests are not worth retrying"""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    if name in ("ResourceExhausted", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+                "RateLimitError", "APITimeoutError", "APIConnectionError", "TimeoutError"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "resource exhausted" in message or "timeout" in message
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter keeps retrying workers from synchronizing
+    return random.uniform(0, min(settings.LLM_RETRY_MAX_DELAY_S, settings.LLM_RETRY_BASE_DELAY_S * 2 ** attempt))
+
+_rate_limiters = {}
+_circuit_breakers = {}
+
+def get_rate_limiter(provider: str) -> TokenBucket:
+    if provider not in _rate_limiters:
+        _rate_limiters[provider] = TokenBucket(settings.LLM_RATE_LIMIT_PER_S, settings.LLM_RATE_LIMIT_BURST)
+    return _rate_limiters[provider]
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    if provider not in _circuit_breakers:
+        _circuit_breakers[provider] = CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_S)
+    return _circuit_breakers[provider]
+
+def provider_available(provider: str = None) -> bool:
+    provider = (provider or settings.LLM_PROVIDER).upper()
+    return not settings.LLM_RESILIENCE_ENABLED or not get_circuit_breaker(provider).is_open()
+
+class ResilientChatModel(BaseChatModel):
+    """Wraps a provider chat model with the worker's rate limiter, retries and circuit breaker"""
+    inner: BaseChatModel
+    provider: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        # Keeps the wrapped model's name/parameters in the LLM cache key
+        return {"provider": self.provider, **self.inner._identifying_params}
+
+    def _check_breaker(self) -> CircuitBreaker:
+        breaker = get_circuit_breaker(self.provider)
+        if not breaker.allow():
+            raise ProviderUnavailableError(f"{self.provider} circuit breaker is open")
+        return breaker
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        breaker = self._check_breaker()
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            get_rate_limiter(self.provider).acquire()
+            try:
+                result = self.inner._generate(messages, stop=stop, **kwargs)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                breaker.record_failure()
+                if attempt == settings.LLM_MAX_RETRIES or breaker.is_open():
+                    raise
+                time.sleep(backoff_delay(attempt))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        breaker = self._check_breaker()
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            await get_rate_limiter(self.provider).aacquire()
+            try:
+                result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                breaker.record_failure()
+                if attempt == settings.LLM_MAX_RETRIES or breaker.is_open():
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
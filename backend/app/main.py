@@ -1,15 +1,78 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
-from starlette.responses import HTMLResponse
-from .routers import upload, analyze
-from .config import settings
-import uvicorn
+from .startup import timed, warm_up, print_startup_report, startup_report
+with timed("import app.main"):
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
+    from starlette.responses import HTMLResponse
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    from .routers import upload, analyze, charts
+    from .config import settings
+    from .deps import get_mongo_client, close_mongo_client
+    from .services.mongo_service import ensure_indexes, check_health
+    from .services.chart_render_service import shutdown_executor
+    from .services.shared_datasets import unpublish_all, detach_all
+    from .utils.tracing import start_trace, span, export_trace
+    from .utils.metrics import http_request_duration, render_metrics
+    from fastapi import Request
+    import asyncio
+    import time
+    import uvicorn
 
-app = FastAPI(title="AI Data Analyst")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are created exactly once here; routers only look them up
+    with timed("mongo client"):
+        get_mongo_client()
+    if settings.MONGO_CREATE_INDEXES:
+        try:
+            with timed("mongo indexes"):
+                await ensure_indexes()
+        except Exception as e:
+            # Don't block startup on index creation, lookups still work without them
+            print(f"Index creation failed: {e}")
+    if settings.WARMUP_ON_STARTUP:
+        warm_up()
+    print_startup_report()
+    yield
+    shutdown_executor()
+    unpublish_all()
+    detach_all()
+    close_mongo_client()
+
+app = FastAPI(title="AI Data Analyst", lifespan=lifespan)
+
+def observe_request(request: Request, response, started: float):
+    # Label by route template (/files/{dataset_id}), not the raw path, to keep label cardinality bounded
+    route = request.scope.get("route")
+    http_request_duration.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    started = time.perf_counter()
+    trace = start_trace(f"{request.method} {request.url.path}")
+    if trace is None:
+        response = await call_next(request)
+        observe_request(request, response, started)
+        return response
+    with span(trace.name, method=request.method, path=request.url.path) as attributes:
+        response = await call_next(request)
+        attributes["status_code"] = response.status_code
+    observe_request(request, response, started)
+    response.headers["Server-Timing"] = trace.server_timing()
+    if settings.TRACING_EXPORTER.lower() != "none":
+        # Exporters may write to disk, keep that off the event loop
+        await asyncio.to_thread(export_trace, trace)
+    return response
 
 app.include_router(upload.router)
 app.include_router(analyze.router)
+app.include_router(charts.router)
 
 # Configure CORS for both local development and production
 allowed_origins = [
@@ -29,6 +92,19 @@ app.add_middleware(
     max_age=600
 )
 
+@app.get("/health")
+async def health():
+    result = await check_health()
+    return JSONResponse(status_code=200 if result["status"] == "ok" else 503, content=result)
+
+@app.get("/health/startup")
+async def health_startup():
+    return JSONResponse(status_code=200, content=startup_report)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     return get_swagger_ui_html(openapi_url=app.openapi_url, title=app.title + " - Swagger UI")
@@ -1,8 +1,19 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
 from ..services.dataset_service import load_dataset_to_df, get_user_datasets
 from bson import ObjectId
-from ..deps import get_mongo_client
+from ..deps import get_db
+from ..utils.tracing import span
+from ..utils.metrics import analyze_duration, answer_path
+from ..services.rollup_service import answer_from_rollup, note_chart_request
+from ..services.sample_service import get_sample
+from ..services.join_service import JoinContext
+from ..services.admission import admit, dataset_key, estimate_bytes, WorkerSaturated
+from ..services.query_parser import parse_direct_chart, chart_columns
+from ..services import chart_cache
+from ..config import settings
+import asyncio
+import time
 
 router = APIRouter(prefix="/analyze", tags=["analyze"])
 
@@ -45,48 +56,203 @@ async def options_analyze():
     )
 
 @router.post("/")
-async def analyze(dataset_id: str = Query(...), question: str = Query(...)):
+async def analyze(
+    dataset_id: str = Query(...),
+    question: str = Query(...),
+    approximate: bool = Query(False, description="Answer large datasets from a stratified sample, with 95% confidence intervals"),
+    dataset_ids: list[str] | None = Query(None, description="Other datasets the agent may join with dataset_id"),
+    if_none_match: str | None = Header(None),
+):
     print(f"Analyze endpoint called with dataset_id: {dataset_id}, question: {question}")
     try:
-        db = get_mongo_client().ai_data_analyst
-        dataset_doc = await db.datasets.find_one({"_id": ObjectId(dataset_id)})
+        db = get_db()
+        with span("mongo_lookup"):
+            dataset_doc = await db.datasets.find_one({"_id": ObjectId(dataset_id)})
         if not dataset_doc:
             raise HTTPException(status_code=404, detail="Dataset not found")
+        other_ids = [i for i in dict.fromkeys(dataset_ids or []) if i != dataset_id]
+        if len(other_ids) > settings.JOIN_MAX_DATASETS:
+            raise HTTPException(status_code=400, detail=f"At most {settings.JOIN_MAX_DATASETS} datasets can be joined")
+        other_docs = []
+        for other_id in other_ids:
+            if not ObjectId.is_valid(other_id):
+                raise HTTPException(status_code=400, detail=f"Invalid dataset id {other_id}")
+            with span("mongo_lookup"):
+                other_doc = await db.datasets.find_one({"_id": ObjectId(other_id)})
+            if not other_doc:
+                raise HTTPException(status_code=404, detail=f"Dataset {other_id} not found")
+            other_docs.append(other_doc)
         
-        # Load the dataset
-        df = await load_dataset_to_df(dataset_doc)
+        # Estimates from the sample can't be joined, questions over several datasets are answered exactly
+        use_sample = approximate and not other_docs and dataset_doc.get("rows", 0) >= settings.APPROX_MIN_ROWS
+        parsed = None
+        if not use_sample and not other_docs and dataset_doc.get("columns"):
+            parsed = parse_direct_chart(question, [c["name"] for c in dataset_doc["columns"]])
         
-        # Try to use the agent service
-        try:
-            from ..services.agent_service import analyze_question
-            result = await analyze_question(df, question)
+        # Direct-parsed charts of this dataset version are answered once, re-polls revalidate by chart id
+        chart_id = None
+        if parsed and settings.CHART_CACHE_ENABLED:
+            chart_id = chart_cache.chart_id(dataset_doc, parsed)
+            if chart_cache.etag_matches(if_none_match, chart_id):
+                return Response(
+                    status_code=304,
+                    headers={
+                        **chart_cache.chart_headers(chart_id),
+                        "Access-Control-Allow-Origin": "*",
+                        "Access-Control-Allow-Methods": "POST, OPTIONS",
+                        "Access-Control-Allow-Headers": "*"
+                    }
+                )
+            with span("chart_cache_lookup"):
+                cached = await chart_cache.get_chart(chart_id)
+            if cached:
+                return JSONResponse(
+                    status_code=200,
+                    content={**cached, "chart_id": chart_id},
+                    headers={
+                        **chart_cache.chart_headers(chart_id),
+                        "Access-Control-Allow-Origin": "*",
+                        "Access-Control-Allow-Methods": "POST, OPTIONS",
+                        "Access-Control-Allow-Headers": "*"
+                    }
+                )
+        
+        # Popular charts are served from a materialized rollup without loading the dataset
+        started = time.perf_counter()
+        with span("rollup_lookup"):
+            rollup_result = await answer_from_rollup(dataset_doc, question)
+        if rollup_result:
+            analyze_duration.observe(time.perf_counter() - started, path="rollup")
+            headers = {}
+            if chart_id:
+                await chart_cache.put_chart(chart_id, dataset_doc, rollup_result)
+                rollup_result = {**rollup_result, "chart_id": chart_id}
+                headers = chart_cache.chart_headers(chart_id)
             return JSONResponse(
                 status_code=200,
-                content=result,
+                content=rollup_result,
                 headers={
+                    **headers,
                     "Access-Control-Allow-Origin": "*",
                     "Access-Control-Allow-Methods": "POST, OPTIONS",
                     "Access-Control-Allow-Headers": "*"
                 }
             )
-        except Exception as agent_error:
-            print(f"Agent service failed: {agent_error}")
-            # Fallback to simple response if agent fails
-            fallback_result = {
-                "final_answer": f"Processed question: {question} for dataset: {dataset_doc.get('filename', 'unknown')}. Dataset has {len(df.columns)} columns: {', '.join(df.columns[:5])}...",
-                "chart_image": None,
-                "debug": f"Agent service failed: {str(agent_error)}. Showing basic dataset info instead."
-            }
-            return JSONResponse(
-                status_code=200,
-                content=fallback_result,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "POST, OPTIONS",
-                    "Access-Control-Allow-Headers": "*"
+        
+        # Load the dataset, or only its sample when an approximate answer is good enough
+        sample_design = None
+        join_context = None
+        if parsed:
+            # A direct-parsed chart only needs its columns and the rows passing its filters, and
+            # is admitted for their size; a full load when it can't be answered is admitted below
+            columns = chart_columns(parsed)
+            async with admit({dataset_key(dataset_doc, *columns): estimate_bytes(dataset_doc, columns)}):
+                started = time.perf_counter()
+                with span("dataset_load", projected=True):
+                    df = await load_dataset_to_df(dataset_doc, columns, parsed["filters"])
+                from ..services.agent_service import direct_chart_response, no_rows_response
+                if parsed["filters"] and df.empty:
+                    # Not stored as a chart: there is no chart for /charts to serve
+                    analyze_duration.observe(time.perf_counter() - started, path="fast_path")
+                    return JSONResponse(
+                        status_code=200,
+                        content=no_rows_response(parsed["filters"]),
+                        headers={
+                            "Access-Control-Allow-Origin": "*",
+                            "Access-Control-Allow-Methods": "POST, OPTIONS",
+                            "Access-Control-Allow-Headers": "*"
+                        }
+                    )
+                with span("direct_parse"):
+                    result = direct_chart_response(df, {**parsed, "filters": []})
+                if result:
+                    analyze_duration.observe(time.perf_counter() - started, path="fast_path")
+                    await note_chart_request(dataset_doc, question, df)
+                    headers = {}
+                    if chart_id:
+                        await chart_cache.put_chart(chart_id, dataset_doc, result)
+                        result = {**result, "chart_id": chart_id}
+                        headers = chart_cache.chart_headers(chart_id)
+                    return JSONResponse(
+                        status_code=200,
+                        content=result,
+                        headers={
+                            **headers,
+                            "Access-Control-Allow-Origin": "*",
+                            "Access-Control-Allow-Methods": "POST, OPTIONS",
+                            "Access-Control-Allow-Headers": "*"
+                        }
+                    )
+        
+        # Admitted once this worker has a free slot and memory for the datasets to load
+        if use_sample:
+            datasets = {dataset_key(dataset_doc, "sample"): estimate_bytes(dataset_doc, rows=settings.APPROX_SAMPLE_ROWS)}
+        else:
+            datasets = {dataset_key(dataset_doc): estimate_bytes(dataset_doc)}
+        for doc in other_docs:
+            datasets[dataset_key(doc)] = estimate_bytes(doc)
+        async with admit(datasets):
+            if use_sample:
+                with span("sample_load"):
+                    df, sample_design = await get_sample(dataset_doc)
+            else:
+                with span("dataset_load"):
+                    df = await load_dataset_to_df(dataset_doc)
+            if other_docs:
+                with span("join_datasets_load", datasets=len(other_docs)):
+                    other_dfs = await asyncio.gather(*(load_dataset_to_df(doc) for doc in other_docs))
+                join_context = JoinContext(dataset_doc, list(zip(other_docs, other_dfs)))
+        
+            # Try to use the agent service
+            started = time.perf_counter()
+            try:
+                from ..services.agent_service import analyze_question
+                result = await analyze_question(df, question, sample_design=sample_design, profile=dataset_doc.get("profile"), join_context=join_context)
+                analyze_duration.observe(time.perf_counter() - started, path=answer_path(result))
+                if answer_path(result) == "fast_path" and sample_design is None:
+                    await note_chart_request(dataset_doc, question, df)
+                return JSONResponse(
+                    status_code=200,
+                    content=result,
+                    headers={
+                        "Access-Control-Allow-Origin": "*",
+                        "Access-Control-Allow-Methods": "POST, OPTIONS",
+                        "Access-Control-Allow-Headers": "*"
+                    }
+                )
+            except Exception as agent_error:
+                print(f"Agent service failed: {agent_error}")
+                analyze_duration.observe(time.perf_counter() - started, path="fallback")
+                # Fallback to simple response if agent fails
+                fallback_result = {
+                    "final_answer": f"Processed question: {question} for dataset: {dataset_doc.get('filename', 'unknown')}. Dataset has {len(df.columns)} columns: {', '.join(df.columns[:5])}...",
+                    "chart_image": None,
+                    "debug": f"Agent service failed: {str(agent_error)}. Showing basic dataset info instead."
                 }
-            )
+                return JSONResponse(
+                    status_code=200,
+                    content=fallback_result,
+                    headers={
+                        "Access-Control-Allow-Origin": "*",
+                        "Access-Control-Allow-Methods": "POST, OPTIONS",
+                        "Access-Control-Allow-Headers": "*"
+                    }
+                )
         
+    except WorkerSaturated as e:
+        print(f"Analyze request rejected: {e}")
+        return JSONResponse(
+            status_code=503,
+            content={"error": "The server is busy, please retry shortly"},
+            headers={
+                "Retry-After": str(e.retry_after),
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "POST, OPTIONS",
+                "Access-Control-Allow-Headers": "*"
+            }
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Body, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
+from ..services.chart_render_service import render_chart, MEDIA_TYPES
+from ..services import chart_cache
+
+router = APIRouter(prefix="/charts", tags=["charts"])
+
+@router.options("/render")
+async def options_render():
+    return JSONResponse(
+        status_code=200,
+        content={"message": "OK"},
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST, OPTIONS",
+            "Access-Control-Allow-Headers": "*",
+            "Access-Control-Max-Age": "600"
+        }
+    )
+
+@router.post("/render")
+async def render(
+    chart_specification: dict = Body(..., embed=True),
+    format: str = Query("png", pattern="^(png|svg)$"),
+    width: float = Query(8, gt=0, le=40),
+    height: float = Query(5, gt=0, le=40),
+    dpi: int = Query(100, ge=50, le=300),
+):
+    """Render a chart_specification returned by /analyze to a PNG or SVG image"""
+    if chart_specification.get("error") or not chart_specification.get("type"):
+        raise HTTPException(status_code=400, detail="Invalid chart specification")
+    try:
+        image, cache_hit = await render_chart(chart_specification, format, width=width, height=height, dpi=dpi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(
+        content=image,
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "X-Render-Cache": "hit" if cache_hit else "miss",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST, OPTIONS",
+            "Access-Control-Allow-Headers": "*"
+        }
+    )
+
+@router.options("/{chart_id}")
+async def options_chart(chart_id: str):
+    return JSONResponse(
+        status_code=200,
+        content={"message": "OK"},
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, OPTIONS",
+            "Access-Control-Allow-Headers": "*",
+            "Access-Control-Max-Age": "600"
+        }
+    )
+
+@router.get("/{chart_id}")
+async def get_chart(chart_id: str, if_none_match: str | None = Header(None)):
+    """A chart answer returned by /analyze, by its chart_id; the content of an id never changes"""
+    headers = {
+        **chart_cache.chart_headers(chart_id, immutable=True),
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, OPTIONS",
+        "Access-Control-Allow-Headers": "*"
+    }
+    if chart_cache.etag_matches(if_none_match, chart_id):
+        return Response(status_code=304, headers=headers)
+    result = await chart_cache.get_chart(chart_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Chart not found or expired")
+    return JSONResponse(status_code=200, content={**result, "chart_id": chart_id}, headers=headers)
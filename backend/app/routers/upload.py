@@ -1,6 +1,10 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
 from fastapi.responses import JSONResponse
 from ..services import dataset_service
+from ..services.profile_service import summarize_profile
+from ..services.blob_service import read_upload
+from ..deps import get_db
+from ..config import settings
 from bson import ObjectId
 
 router = APIRouter(prefix="/files", tags=["files"])
@@ -22,10 +26,10 @@ async def options_upload():
 async def upload_csv(file: UploadFile = File(...)):
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=400, detail="Only CSV allowed")
-    content = await file.read()
+    content, content_hash = await read_upload(file)
     # Use a default user ID since authentication is removed
     default_user_id = "default_user"
-    doc = await dataset_service.save_dataset(default_user_id, content, file.filename)
+    doc = await dataset_service.save_dataset(default_user_id, content, file.filename, content_hash)
     return JSONResponse(
         status_code=200,
         content={"status":"ok", "dataset_id": str(doc["_id"]), "filename": file.filename},
@@ -49,28 +53,112 @@ async def options_list():
         }
     )
 
+def serialize_dataset(doc):
+    """Stringify the projected ObjectId and datetime fields of a dataset document"""
+    out = {
+        "_id": str(doc["_id"]),
+        "owner_id": doc.get("owner_id"),
+        "filename": doc.get("filename"),
+        "file_id": str(doc["file_id"]) if doc.get("file_id") is not None else None,
+    }
+    created_at = doc.get("created_at")
+    out["created_at"] = created_at.isoformat() if created_at is not None else None
+    return out
+
 @router.get("/list")
-async def list_files():
+async def list_files(
+    limit: int = Query(settings.DATASETS_PAGE_SIZE, ge=1, le=settings.DATASETS_MAX_PAGE_SIZE),
+    after_id: str | None = Query(None, description="Last dataset _id of the previous page"),
+    include_count: bool = Query(False, description="Also return the user's total dataset count"),
+):
     # Use a default user ID since authentication is removed
     default_user_id = "default_user"
-    ds = await dataset_service.get_user_datasets(default_user_id)
-    # convert objectids and handle datetime serialization
-    serializable_datasets = []
-    for d in ds:
-        # Create a new dict to avoid modifying the original during iteration
-        serializable_doc = {}
-        for key, value in d.items():
-            if key == "_id" or key == "file_id":
-                serializable_doc[key] = str(value)
-            elif hasattr(value, "isoformat"):  # Check if it's a datetime-like object
-                serializable_doc[key] = value.isoformat()
-            else:
-                serializable_doc[key] = value
-        serializable_datasets.append(serializable_doc)
-    
+    if after_id is not None and not ObjectId.is_valid(after_id):
+        raise HTTPException(status_code=400, detail="Invalid after_id")
+    # Fetch one extra document to know whether another page exists
+    ds = await dataset_service.get_user_datasets(
+        default_user_id,
+        projection=dataset_service.DATASET_LIST_PROJECTION,
+        limit=limit + 1,
+        after_id=ObjectId(after_id) if after_id else None
+    )
+    has_more = len(ds) > limit
+    ds = ds[:limit]
+    content = {
+        "datasets": [serialize_dataset(d) for d in ds],
+        "next_after_id": str(ds[-1]["_id"]) if has_more else None,
+    }
+    if include_count:
+        content["count"] = await dataset_service.count_user_datasets(default_user_id)
+
+    return JSONResponse(
+        status_code=200,
+        content=content,
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, OPTIONS",
+            "Access-Control-Allow-Headers": "*"
+        }
+    )
+
+@router.options("/{dataset_id}/append")
+async def options_append(dataset_id: str):
+    return JSONResponse(
+        status_code=200,
+        content={"message": "OK"},
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST, OPTIONS",
+            "Access-Control-Allow-Headers": "*",
+            "Access-Control-Max-Age": "600"
+        }
+    )
+
+async def find_dataset(dataset_id: str):
+    if not ObjectId.is_valid(dataset_id):
+        raise HTTPException(status_code=400, detail="Invalid dataset_id")
+    dataset_doc = await get_db().datasets.find_one({"_id": ObjectId(dataset_id)})
+    if not dataset_doc:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return dataset_doc
+
+@router.post("/{dataset_id}/append")
+async def append_csv(dataset_id: str, file: UploadFile = File(...)):
+    if not file.filename.endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Only CSV allowed")
+    dataset_doc = await find_dataset(dataset_id)
+    content, content_hash = await read_upload(file)
+    try:
+        doc = await dataset_service.append_to_dataset(dataset_doc, content, file.filename, content_hash)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except dataset_service.AppendConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status": "ok",
+            "dataset_id": dataset_id,
+            "version": doc["version"],
+            "rows": doc["rows"],
+            "chunk_rows": doc["chunks"][-1]["rows"],
+            "chunks": len(doc["chunks"]),
+        },
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST, OPTIONS",
+            "Access-Control-Allow-Headers": "*"
+        }
+    )
+
+@router.get("/{dataset_id}/profile")
+async def dataset_profile(dataset_id: str):
+    dataset_doc = await find_dataset(dataset_id)
+    if not dataset_doc.get("profile"):
+        raise HTTPException(status_code=404, detail="Dataset has no profile yet")
     return JSONResponse(
         status_code=200,
-        content={"datasets": serializable_datasets},
+        content={"dataset_id": dataset_id, "version": dataset_doc.get("version", 1), **summarize_profile(dataset_doc["profile"])},
         headers={
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET, OPTIONS",
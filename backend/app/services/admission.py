@@ -0,0 +1,145 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from ..config import settings
+from ..utils.metrics import register_collector
+
+# Admission control for /analyze in this worker. At most ANALYZE_MAX_CONCURRENT
+# questions run at once, and the estimated in-memory size of the datasets they load
+# has to fit in ANALYZE_MEMORY_BUDGET_BYTES. Requests on the same dataset count it
+# once and skip the queue: their loads are single-flight, the first request loads
+# and the others await the same DataFrame. Other requests that don't fit wait in
+# arrival order for up to ANALYZE_QUEUE_TIMEOUT_S; past ANALYZE_MAX_QUEUED waiting
+# or on timeout they are turned away (503 with Retry-After) instead of piling up loads.
+
+# Estimated bytes per value by dtype kind; strings are Python objects
+NUMERIC_VALUE_BYTES = 8
+STRING_VALUE_BYTES = 64
+
+class WorkerSaturated(Exception):
+    """Raised when a request can't be admitted; retry after retry_after seconds"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Worker saturated: {reason}")
+        self.retry_after = settings.ANALYZE_RETRY_AFTER_S
+
+_running = 0
+_reservations = {}  # dataset key -> [estimated bytes, requests holding it]
+_waiters = deque()  # (future, datasets) in arrival order
+_loads = {}  # load key -> task shared by concurrent loaders
+stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+load_stats = {"started": 0, "joined": 0}
+register_collector(
+    "analyze_admission_total", "Analyze requests by admission result", "counter", ("result",),
+    lambda: [((name,), value) for name, value in stats.items()])
+register_collector(
+    "dataset_single_flight_loads_total", "Dataset loads started, or joined while already running", "counter", ("result",),
+    lambda: [((name,), value) for name, value in load_stats.items()])
+register_collector(
+    "analyze_running_requests", "Analyze requests admitted and running", "gauge", (),
+    lambda: [((), _running)])
+register_collector(
+    "analyze_reserved_memory_bytes", "Estimated memory of the datasets used by running analyze requests", "gauge", (),
+    lambda: [((), reserved_bytes())])
+
+def dataset_key(dataset_doc, *parts) -> tuple:
+    """Identifies a load of the dataset's current version; parts tell apart samples and projections"""
+    return (str(dataset_doc["_id"]), dataset_doc.get("version", 1), *parts)
+
+def estimate_bytes(dataset_doc, columns: list = None, rows: int = None) -> int:
+    """In-memory size of the dataset (or of columns, or of rows rows) from its stored schema"""
+    schema = dataset_doc.get("columns") or []
+    if columns is not None:
+        schema = [c for c in schema if c["name"] in columns]
+    rows = dataset_doc.get("rows", 0) if rows is None else rows
+    width = sum(NUMERIC_VALUE_BYTES if c["dtype"].startswith(("int", "uint", "float", "bool", "datetime")) else STRING_VALUE_BYTES
+                for c in schema)
+    # Datasets stored before profiling have no schema; they only take a request slot
+    return rows * width
+
+def reserved_bytes() -> int:
+    return sum(size for size, _ in _reservations.values())
+
+def _fits(datasets: dict) -> bool:
+    if _running >= settings.ANALYZE_MAX_CONCURRENT:
+        return False
+    new = sum(size for key, size in datasets.items() if key not in _reservations)
+    # A dataset larger than the budget still runs, alone
+    return not new or not _reservations or reserved_bytes() + new <= settings.ANALYZE_MEMORY_BUDGET_BYTES
+
+def _take(datasets: dict):
+    global _running
+    _running += 1
+    for key, size in datasets.items():
+        _reservations.setdefault(key, [size, 0])[1] += 1
+
+def _release(datasets: dict):
+    global _running
+    _running -= 1
+    for key in datasets:
+        reservation = _reservations[key]
+        reservation[1] -= 1
+        if reservation[1] == 0:
+            del _reservations[key]
+    _wake()
+
+def _wake():
+    while _waiters and _fits(_waiters[0][1]):
+        future, datasets = _waiters.popleft()
+        if future.done():
+            # Timed out or cancelled
+            continue
+        _take(datasets)
+        future.set_result(None)
+
+async def _acquire(datasets: dict):
+    # Requests on datasets already in use need no more memory and don't queue behind others
+    shared = all(key in _reservations for key in datasets)
+    if (not _waiters or shared) and _fits(datasets):
+        _take(datasets)
+        stats["admitted"] += 1
+        return
+    if len(_waiters) >= settings.ANALYZE_MAX_QUEUED:
+        stats["rejected_queue_full"] += 1
+        raise WorkerSaturated(f"{len(_waiters)} requests already waiting")
+    future = asyncio.get_running_loop().create_future()
+    entry = (future, datasets)
+    _waiters.append(entry)
+    stats["queued"] += 1
+    try:
+        await asyncio.wait_for(future, settings.ANALYZE_QUEUE_TIMEOUT_S)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        if future.done() and not future.cancelled():
+            # Admitted just as the wait ended
+            _release(datasets)
+        elif entry in _waiters:
+            _waiters.remove(entry)
+            # The next waiter may fit now that this one is gone
+            _wake()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        stats["rejected_timeout"] += 1
+        raise WorkerSaturated(f"no capacity within {settings.ANALYZE_QUEUE_TIMEOUT_S:g}s")
+    stats["admitted"] += 1
+
+@asynccontextmanager
+async def admit(datasets: dict):
+    """Run a request once there is a slot and memory for datasets ({dataset_key: estimated bytes})"""
+    await _acquire(datasets)
+    try:
+        yield
+    finally:
+        _release(datasets)
+
+async def single_flight(key, load):
+    """Result of load(), shared with the concurrent callers using the same key"""
+    task = _loads.get(key)
+    if task is None:
+        load_stats["started"] += 1
+        task = asyncio.ensure_future(load())
+        _loads[key] = task
+        task.add_done_callback(lambda _: _loads.pop(key, None))
+    else:
+        load_stats["joined"] += 1
+    # A caller going away doesn't cancel the load for the others
+    return await asyncio.shield(task)
@@ -0,0 +1,108 @@
+import json
+import re
+from .query_parser import classify_query
+from ..utils.metrics import register_collector
+
+# Loop control for the ReAct agent: stops as soon as the LLM repeats a tool call it
+# already made on the same working table (a join starts a new one), or a tool output
+# already answers the question, instead of spending the remaining iterations. The
+# final answer is then synthesized from the observations by enhance_answer like any
+# other run. A repeat whose output enhance_answer can't format gets one more step for
+# the model to answer; a second repeat ends the run.
+
+CHART_TOOLS = ["prepare_bar_chart", "prepare_line_chart", "prepare_pie_chart"]
+STAT_WORDS = ["average", "mean", "median", "statistic", "std", "deviation", "minimum", "maximum", "range", "distribution"]
+
+loop_stats = {"questions": 0, "iterations": 0, "early_exits": {}}
+register_collector(
+    "agent_early_exits_total", "Agent runs stopped before the model gave a final answer", "counter", ("reason",),
+    lambda: [((reason,), count) for reason, count in list(loop_stats["early_exits"].items())])
+
+def _normalize_input(tool_input):
+    """Compare tool inputs modulo JSON formatting and surrounding quotes"""
+    text = str(tool_input).strip().strip("'")
+    try:
+        return json.dumps(json.loads(text), sort_keys=True)
+    except (json.JSONDecodeError, TypeError):
+        return re.sub(r"\s+", " ", text)
+
+def observation_answers_question(question: str, action, observation) -> bool:
+    question_lower = question.lower()
+    query_class = classify_query(question)
+    if action.tool == "dataset_info":
+        return query_class == "schema" and isinstance(observation, str) and '"columns"' in observation
+    if action.tool in CHART_TOOLS:
+        return query_class == "chart" and isinstance(observation, dict) and bool(observation.get("type") and observation.get("data"))
+    if action.tool == "describe":
+        # A single-column summary answers "what is the average/median/... of X"
+        return (
+            isinstance(observation, dict) and len(observation) == 1
+            and str(next(iter(observation))).lower() in question_lower
+            and any(word in question_lower for word in STAT_WORDS)
+        )
+    if action.tool == "correlation":
+        return isinstance(observation, (int, float)) and "correlat" in question_lower
+    return False
+
+def chart_sentence(observation: dict) -> str:
+    title = observation.get("options", {}).get("plugins", {}).get("title", {}).get("text", "")
+    return f"I've generated a {observation.get('type')} chart showing {title.lower()}."
+
+async def run_agent(agent_executor, inputs: dict, question: str, callbacks: list = None, answerable=None) -> dict:
+    """
+    Run the agent step by step. Returns the usual {"output", "intermediate_steps"} plus
+    "iterations" and "early_exit" (None, "repeated_tool_call" or "answered_by_tool").
+
+    answerable(action, observation) tells whether an answer can be built from an
+    observation without the model's Final Answer. A repeated call whose observation
+    isn't answerable gets one more step, so the model sees it again and answers.
+    """
+    intermediate_steps = []
+    seen_calls = set()
+    repeated = False
+    joins = 0
+    early_exit = None
+    output = ""
+
+    iterator = agent_executor.iter(inputs, callbacks=callbacks or None)
+    steps = iterator.__aiter__()
+    try:
+        async for chunk in steps:
+            if "intermediate_step" not in chunk:
+                output = chunk.get("output", "")
+                intermediate_steps = chunk.get("intermediate_steps", intermediate_steps)
+                break
+            for action, observation in chunk["intermediate_step"]:
+                intermediate_steps.append((action, observation))
+                # A join changes the working table, so the same call after it is a new call
+                call = (joins, action.tool, _normalize_input(action.tool_input))
+                if call in seen_calls:
+                    if repeated or answerable is None or answerable(action, observation):
+                        early_exit = "repeated_tool_call"
+                    repeated = True
+                elif observation_answers_question(question, action, observation):
+                    early_exit = "answered_by_tool"
+                    if action.tool in CHART_TOOLS:
+                        output = chart_sentence(observation)
+                seen_calls.add(call)
+                if action.tool == "join" and str(observation).startswith("Joined"):
+                    joins += 1
+            if early_exit:
+                break
+    finally:
+        # Closing the generator ends the chain run without planning another step
+        await steps.aclose()
+
+    # One LLM call per iteration, including the one that produced the final answer
+    iterations = iterator.iterations
+    loop_stats["questions"] += 1
+    loop_stats["iterations"] += iterations
+    if early_exit:
+        loop_stats["early_exits"][early_exit] = loop_stats["early_exits"].get(early_exit, 0) + 1
+    print(f"Agent finished after {iterations} LLM call(s){f', early exit: {early_exit}' if early_exit else ''}")
+    return {
+        "output": output,
+        "intermediate_steps": intermediate_steps,
+        "iterations": iterations,
+        "early_exit": early_exit,
+    }
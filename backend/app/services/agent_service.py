@@ -1,118 +1,398 @@
 from ..llm.llm_client import LLMClient
-from ..services.tools import PandasTool, prepare_bar_chart_data, prepare_line_chart_data, prepare_pie_chart_data
-from ..services.query_parser import parse_chart_query, should_use_direct_parsing
+from ..llm.resilience import ProviderUnavailableError, provider_available
+from ..services.tools import PandasTool, prepare_bar_chart_data, prepare_line_chart_data, prepare_pie_chart_data, default_agg, aggregate_by, apply_filters, filter_mask
+from ..services.stats_service import summarize, describe_summary
+from ..services.query_parser import parse_chart_query, should_use_direct_parsing, classify_query, describe_filters
+from ..services.agent_loop import run_agent
+from ..services.sample_service import ApproximatePandasTool, approximate_label, weighted_chart_frame
+from ..services.prompt_compaction import compact_schema, DTYPE_LEGEND
+from ..config import settings
+from ..utils.tracing import span, langchain_tracing_callbacks
+from ..utils.metrics import usage_callbacks, record_llm_usage
 import json
+import numpy as np
 import pandas as pd
-from langchain.agents import AgentExecutor, create_react_agent
-from langchain_core.prompts import PromptTemplate
-from langchain.tools import Tool
 import re
 
-llm_client = LLMClient()
-llm = llm_client._client
+# Few-shot answer example for the ReAct prompt, can be dropped with PROMPT_FEW_SHOT_EXAMPLE=false
+ANSWER_EXAMPLE = """Example for "What is the average sales?":
+Based on the analysis of 9,994 data points:
 
-async def analyze_question(df: pd.DataFrame, question: str):
-    # First try direct parsing for common chart patterns
-    if should_use_direct_parsing(question):
-        columns = list(df.columns)
-        parsed_params = parse_chart_query(question, columns)
+📊 Average Sales: $229.86
+
+Key Statistics:
+• Median Sales: $54.49 (half of sales are below this value)
+• Minimum Sales: $0.44
+• Maximum Sales: $22,638.48
+• Standard Deviation: $623.25 (indicates high variability)
+
+Insights:
+• The average is significantly higher than the median, suggesting some very high-value sales are pulling the average up
+• There's a wide range between minimum and maximum values
+• 75% of sales are below $209.94
+
+"""
+
+_llm_clients = {}
+def get_llm_client(query_class: str = None) -> LLMClient:
+    """Create the LLM client for a query class on first use instead of at import time"""
+    key = query_class if query_class in settings.LLM_QUERY_CLASS_MODELS else None
+    if key not in _llm_clients:
+        _llm_clients[key] = LLMClient.for_query_class(key)
+    return _llm_clients[key]
+
+def direct_chart_response(df: pd.DataFrame, parsed_params: dict, reasoning: str = None, aggregated: str = None):
+    """
+    Build the chart answer for parsed chart parameters without the LLM; None when it can't.
+    aggregated is the aggregate df already holds per category (rollups, sample estimates).
+    """
+    try:
+        df = apply_filters(df, parsed_params.get("filters"))
+        if parsed_params.get("filters") and df.empty:
+            return no_rows_response(parsed_params["filters"])
+        x_col, y_col = parsed_params["x_col"], parsed_params["y_col"]
+        agg = default_agg(df, x_col, parsed_params.get("agg"), parsed_params.get("grain"))
+        grain = parsed_params.get("grain")
+        if agg or grain:
+            # Aggregate once: the chart shows the top groups, the analysis covers all of them
+            df = aggregate_by(df, x_col, y_col, agg or "sum", grain)
+        # Generate chart directly based on parsed parameters
+        if parsed_params["chart_type"] == "bar":
+            chart_specification = prepare_bar_chart_data(
+                df,
+                x_col=x_col,
+                y_col=y_col,
+                n=parsed_params["n"],
+                title=parsed_params["title"]
+            )
+        elif parsed_params["chart_type"] == "line":
+            chart_specification = prepare_line_chart_data(
+                df,
+                time_col=x_col,
+                value_col=y_col,
+                title=parsed_params["title"]
+            )
+        elif parsed_params["chart_type"] == "pie":
+            chart_specification = prepare_pie_chart_data(
+                df,
+                label_col=x_col,
+                value_col=y_col,
+                n=parsed_params["n"],
+                title=parsed_params["title"]
+            )
+        else:
+            chart_specification = None
         
-        if parsed_params:
+        if chart_specification and not chart_specification.get("error"):
+            ranked = parsed_params["chart_type"] != "line"
+            agg = aggregated or agg
+            summary = summarize(df[x_col].astype(str).to_numpy(), pd.to_numeric(df[y_col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan), agg=agg)
+            detailed_analysis = describe_summary(summary, str(y_col), parsed_params["n"] if ranked else None, ranked, agg)
+            if detailed_analysis:
+                detailed_analysis = f"\n\nDetailed Analysis:\n{detailed_analysis}\n"
+            
+            return {
+                "final_answer": f"I've generated a {parsed_params['chart_type']} chart showing {parsed_params['title'].lower()}.{detailed_analysis}",
+                "reasoning": reasoning or "Used direct query parsing for efficient chart generation with detailed data analysis.",
+                "tool_results": [],
+                "chart_specification": chart_specification
+            }
+    except Exception as e:
+        print(f"Direct parsing failed: {e}")
+    return None
+
+def no_rows_response(filters: list):
+    """Answer for a parsed chart whose filters leave no rows, instead of an empty chart"""
+    return {
+        "final_answer": f"No rows match {describe_filters(filters)}, so there is nothing to chart. Try a less restrictive condition.",
+        "reasoning": "Used direct query parsing; the filters in the question match no rows.",
+        "tool_results": [],
+        "chart_specification": None,
+        "no_rows": True
+    }
+
+def answerable_observation(action, observation, df: pd.DataFrame) -> bool:
+    """Whether the answer can be built from a tool output alone: a chart, or one enhance_answer formats"""
+    if action.tool in ["prepare_bar_chart", "prepare_line_chart", "prepare_pie_chart"]:
+        return isinstance(observation, dict) and bool(observation.get("type") and observation.get("data"))
+    return bool(enhance_answer("", [(action, observation)], df))
+
+def degraded_response(df: pd.DataFrame, question: str):
+    """Answer while the LLM provider is unavailable: any chart the parser can extract, else basic dataset info"""
+    parsed_params = parse_chart_query(question, list(df.columns))
+    if parsed_params:
+        result = direct_chart_response(
+            df,
+            parsed_params,
+            reasoning="The AI service is temporarily unavailable, so the question was answered by direct query parsing."
+        )
+        if result:
+            result["degraded"] = True
+            return result
+    return {
+        "final_answer": (
+            "The AI service is temporarily unavailable, please try again shortly. "
+            f"Meanwhile: the dataset has {len(df):,} rows and {len(df.columns)} columns: "
+            f"{', '.join(map(str, df.columns[:10]))}{'...' if len(df.columns) > 10 else ''}"
+        ),
+        "reasoning": "LLM provider circuit breaker is open; skipped the AI agent.",
+        "tool_results": [],
+        "chart_specification": None,
+        "degraded": True
+    }
+
+def enhance_answer(final_answer: str, intermediate_steps: list, df: pd.DataFrame) -> str:
+    """Post-process answer to add more details and formatting"""
+    
+    # Check if answer is already detailed (has bullet points or multiple lines)
+    if '•' in final_answer or '**' in final_answer or len(final_answer.split('\n')) > 3:
+        return final_answer
+    
+    # Try to enhance based on tool outputs
+    for action, observation in intermediate_steps:
+        action_name = action.tool if hasattr(action, 'tool') else str(action)
+        
+        # Enhance dataset_info outputs
+        if action_name == "dataset_info":
             try:
-                # Generate chart directly based on parsed parameters
-                if parsed_params["chart_type"] == "bar":
-                    chart_specification = prepare_bar_chart_data(
-                        df,
-                        x_col=parsed_params["x_col"],
-                        y_col=parsed_params["y_col"],
-                        n=parsed_params["n"],
-                        title=parsed_params["title"]
-                    )
-                elif parsed_params["chart_type"] == "line":
-                    chart_specification = prepare_line_chart_data(
-                        df,
-                        time_col=parsed_params["x_col"],
-                        value_col=parsed_params["y_col"],
-                        title=parsed_params["title"]
-                    )
-                elif parsed_params["chart_type"] == "pie":
-                    chart_specification = prepare_pie_chart_data(
-                        df,
-                        label_col=parsed_params["x_col"],
-                        value_col=parsed_params["y_col"],
-                        n=parsed_params["n"],
-                        title=parsed_params["title"]
-                    )
+                if isinstance(observation, str):
+                    info = json.loads(observation)
                 else:
-                    chart_specification = None
+                    info = observation
                 
-                if chart_specification and not chart_specification.get("error"):
-                    # Extract actual data from chart for detailed analysis
-                    chart_data = chart_specification.get("data", {})
-                    labels = chart_data.get("labels", [])
-                    datasets = chart_data.get("datasets", [])
+                if "columns" in info:
+                    columns = info["columns"]
+                    enhanced = f"📊 **Dataset Overview**\n\n"
+                    enhanced += f"This dataset contains **{len(columns)} columns** and **{info.get('row_count', len(df))} rows**.\n\n"
+                    enhanced += f"**Available Columns:**\n"
                     
-                    detailed_analysis = ""
-                    if labels and datasets:
-                        dataset = datasets[0]
-                        data_values = dataset.get("data", [])
-                        y_label = dataset.get("label", "Value")
+                    # Group columns by type if dtypes available
+                    if "dtypes" in info:
+                        dtypes = info["dtypes"]
+                        numeric_cols = [col for col in columns if dtypes.get(col, "").startswith(("int", "float"))]
+                        text_cols = [col for col in columns if dtypes.get(col, "") == "object"]
+                        
+                        if numeric_cols:
+                            enhanced += f"\n**Numeric Columns** ({len(numeric_cols)}):\n"
+                            for col in numeric_cols:
+                                enhanced += f"• {col}\n"
                         
-                        if data_values and labels:
-                            # Generate detailed analysis
-                            detailed_analysis = f"\n\nDetailed Analysis:\n"
-                            detailed_analysis += f"• Total items analyzed: {len(labels)}\n"
-                            
-                            if parsed_params["n"] and parsed_params["n"] < len(labels):
-                                detailed_analysis += f"• Showing top {parsed_params['n']} items by {y_label.lower()}\n"
-                            
-                            # Top performers
-                            if len(data_values) >= 3:
-                                top_3 = list(zip(labels, data_values))[:3]
-                                detailed_analysis += f"• Top 3 performers:\n"
-                                for i, (label, value) in enumerate(top_3, 1):
-                                    detailed_analysis += f"  {i}. {label}: {value:,.2f}\n"
-                            
-                            # Total and average
-                            total_value = sum(data_values)
-                            avg_value = total_value / len(data_values)
-                            detailed_analysis += f"• Total {y_label.lower()}: {total_value:,.2f}\n"
-                            detailed_analysis += f"• Average {y_label.lower()}: {avg_value:,.2f}\n"
-                            
-                            # Range
-                            if len(data_values) > 1:
-                                max_val = max(data_values)
-                                min_val = min(data_values)
-                                detailed_analysis += f"• Range: {min_val:,.2f} to {max_val:,.2f}\n"
+                        if text_cols:
+                            enhanced += f"\n**Text/Categorical Columns** ({len(text_cols)}):\n"
+                            for col in text_cols:
+                                enhanced += f"• {col}\n"
+                    else:
+                        # Simple list if no type info
+                        for i, col in enumerate(columns, 1):
+                            enhanced += f"{i}. {col}\n"
+                    
+                    enhanced += f"\n💡 **Tip:** You can now ask questions like:\n"
+                    enhanced += f"• 'What is the average Sales?'\n"
+                    enhanced += f"• 'Show me top 10 States by Profit'\n"
+                    enhanced += f"• 'Create a bar chart of Sales by Region'\n"
+                    
+                    return enhanced
+            except (json.JSONDecodeError, KeyError):
+                pass
+        
+        # Enhance describe tool outputs
+        if action_name == "describe" and isinstance(observation, dict):
+            for col_name, stats in observation.items():
+                if isinstance(stats, dict):
+                    count = stats.get('count', 0)
+                    mean = stats.get('mean', 0)
+                    median = stats.get('50%', 0)
+                    std = stats.get('std', 0)
+                    min_val = stats.get('min', 0)
+                    max_val = stats.get('max', 0)
+                    q25 = stats.get('25%', 0)
+                    q75 = stats.get('75%', 0)
+                    
+                    # Create enhanced answer
+                    enhanced = f"📊 **Analysis of {col_name}** (Based on {int(count):,} data points)\n\n"
+                    enhanced += f"**Key Metrics:**\n"
+                    enhanced += f"• Average: ${mean:,.2f}\n"
+                    enhanced += f"• Median: ${median:,.2f}\n"
+                    enhanced += f"• Range: ${min_val:,.2f} to ${max_val:,.2f}\n"
+                    enhanced += f"• Standard Deviation: ${std:,.2f}\n\n"
+                    enhanced += f"**Distribution:**\n"
+                    enhanced += f"• 25th Percentile: ${q25:,.2f} (25% of values are below this)\n"
+                    enhanced += f"• 50th Percentile (Median): ${median:,.2f}\n"
+                    enhanced += f"• 75th Percentile: ${q75:,.2f} (75% of values are below this)\n\n"
+                    
+                    # Add insights
+                    if mean > median * 1.5:
+                        enhanced += f"**💡 Insight:** The average (${mean:,.2f}) is significantly higher than the median (${median:,.2f}), "
+                        enhanced += f"indicating that some high-value outliers are pulling the average up. The median might be a better "
+                        enhanced += f"representation of typical {col_name.lower()}.\n"
+                    elif std > mean:
+                        enhanced += f"**💡 Insight:** High variability detected (standard deviation > mean). "
+                        enhanced += f"This suggests {col_name.lower()} values vary widely across the dataset.\n"
+                    else:
+                        enhanced += f"**💡 Insight:** The data shows moderate variability with most values "
+                        enhanced += f"clustering around the average of ${mean:,.2f}.\n"
                     
-                    return {
-                        "final_answer": f"I've generated a {parsed_params['chart_type']} chart showing {parsed_params['title'].lower()}.{detailed_analysis}",
-                        "reasoning": "Used direct query parsing for efficient chart generation with detailed data analysis.",
-                        "tool_results": [],
-                        "chart_specification": chart_specification
-                    }
-            except Exception as e:
-                print(f"Direct parsing failed: {e}, falling back to AI agent")
+                    return enhanced
+        
+        # Enhance top_n outputs
+        elif action_name == "top_n" and isinstance(observation, list):
+            if len(observation) > 0:
+                enhanced = f"📊 **Top {len(observation)} Results:**\n\n"
+                for i, item in enumerate(observation[:10], 1):
+                    if isinstance(item, dict):
+                        # Format each item nicely
+                        enhanced += f"**{i}.** "
+                        for key, value in item.items():
+                            if isinstance(value, (int, float)):
+                                enhanced += f"{key}: ${value:,.2f}  "
+                            else:
+                                enhanced += f"{key}: {value}  "
+                        enhanced += "\n"
+                return enhanced
+        
+        # Enhance group_agg outputs with statistics over every group
+        elif action_name == "group_agg" and isinstance(observation, list) and len(observation) > 1:
+            groups = pd.DataFrame(observation)
+            value_cols = [col for col in groups.columns if pd.api.types.is_numeric_dtype(groups[col])]
+            key_cols = [col for col in groups.columns if col not in value_cols]
+            try:
+                # Whether the groups add up to a total depends on the aggregate used
+                agg = json.loads(action.tool_input)["agg"].get(value_cols[0]) if len(value_cols) == 1 else None
+            except (json.JSONDecodeError, TypeError, AttributeError, KeyError):
+                agg = None
+            if len(value_cols) == 1 and key_cols and isinstance(agg, str):
+                labels = groups[key_cols].astype(str).agg(" / ".join, axis=1).to_numpy()
+                summary = summarize(labels, groups[value_cols[0]].to_numpy(dtype="float64", na_value=np.nan), agg=agg)
+                return (f"{final_answer}\n\n📊 **{value_cols[0]} by {', '.join(map(str, key_cols))}**\n\n"
+                        f"{describe_summary(summary, str(value_cols[0]), agg=agg)}")
+        
+        # Enhance correlation outputs
+        elif action_name == "correlation" and isinstance(observation, (int, float)):
+            # PandasTool.correlation returns a bare coefficient, the column names are in the tool input
+            try:
+                args = json.loads(action.tool_input)
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                args = {}
+            observation = {"correlation": float(observation), "col_x": args.get("x", "X"), "col_y": args.get("y", "Y")}
+        if action_name == "correlation" and isinstance(observation, dict):
+            corr_value = observation.get('correlation', 0)
+            col_x = observation.get('col_x', 'X')
+            col_y = observation.get('col_y', 'Y')
+            
+            enhanced = f"📊 **Correlation Analysis: {col_x} vs {col_y}**\n\n"
+            enhanced += f"**Correlation Coefficient:** {corr_value:.4f}\n\n"
+            enhanced += f"**Interpretation:**\n"
+            
+            if abs(corr_value) >= 0.7:
+                strength = "Strong"
+            elif abs(corr_value) >= 0.4:
+                strength = "Moderate"
+            else:
+                strength = "Weak"
+            
+            direction = "positive" if corr_value > 0 else "negative"
+            
+            enhanced += f"• {strength} {direction} correlation detected\n"
+            
+            if corr_value > 0:
+                enhanced += f"• As {col_x} increases, {col_y} tends to increase as well\n"
+            else:
+                enhanced += f"• As {col_x} increases, {col_y} tends to decrease\n"
+            
+            if abs(corr_value) >= 0.7:
+                enhanced += f"• This indicates a strong relationship between the two variables\n"
+            elif abs(corr_value) < 0.3:
+                enhanced += f"• The relationship between these variables is minimal\n"
+            
+            return enhanced
+    
+    return final_answer
+
+async def analyze_question(df: pd.DataFrame, question: str, sample_design: dict = None, profile: dict = None, join_context=None):
+    """
+    Answer a question about df. With sample_design, df is the dataset's stratified
+    sample: the answer is estimated and labelled approximate with 95% intervals.
+    A join_context offers the request's other datasets to the agent's join tool.
+    """
+    if sample_design is None:
+        return await answer_question(df, question, join_context=join_context)
+    bounds = []
+    result = await answer_question(df, question, sample_design, profile, bounds)
+    if "final_answer" in result:
+        result["final_answer"] = f"{approximate_label(sample_design, bounds)}\n\n{result['final_answer']}"
+        result["approximate"] = {
+            "sample_rows": sample_design["rows"],
+            "population_rows": sample_design["population"],
+            "strata_column": sample_design["strata_col"],
+            "confidence": 0.95,
+        }
+    return result
+
+async def answer_question(df: pd.DataFrame, question: str, sample_design: dict = None, profile: dict = None, bounds: list = None, join_context=None):
+    def chart_input(x_col, y_col, agg=None, grain=None, filters=None):
+        """(frame, agg) for the chart functions; a sample is aggregated with its weights first"""
+        if sample_design is None:
+            return apply_filters(df, filters), agg
+        agg = agg or "sum"
+        sample = df
+        if filters:
+            # Filtered-out rows stay in the sample with a missing value, so the estimates are over that domain
+            sample = df.assign(**{y_col: df[y_col].where(filter_mask(df, filters))})
+        return weighted_chart_frame(sample, sample_design, x_col, y_col, agg, grain, bounds), None
+
+    # First try direct parsing for common chart patterns
+    if should_use_direct_parsing(question):
+        with span("direct_parse"):
+            parsed_params = parse_chart_query(question, list(df.columns))
+            result = None
+            if parsed_params and sample_design is not None:
+                frame, _ = chart_input(parsed_params["x_col"], parsed_params["y_col"], parsed_params.get("agg"), parsed_params.get("grain"), parsed_params["filters"])
+                result = direct_chart_response(frame, {**parsed_params, "agg": None, "grain": None, "filters": []},
+                                               aggregated=parsed_params.get("agg") or "sum")
+            elif parsed_params:
+                result = direct_chart_response(df, parsed_params)
+        if result:
+            return result
+        if parsed_params:
+            print("Direct parsing failed, falling back to AI agent")
     
     # Fall back to AI agent for complex queries
-    tool = PandasTool(df)
+    # langchain is imported lazily, the direct parsing path above never needs it
+    from langchain.agents import AgentExecutor, create_react_agent
+    from langchain_core.prompts import PromptTemplate
+    from langchain.tools import Tool
+
+    llm_client = get_llm_client(classify_query(question))
+    # Don't spend an agent run on a provider that is known to be failing
+    if not provider_available(llm_client.provider):
+        return degraded_response(df, question)
+    llm = llm_client._client
+    tool = ApproximatePandasTool(df, sample_design, profile, bounds) if sample_design else PandasTool(df)
+    row_count = sample_design["population"] if sample_design else len(df)
 
     # Add dataset_info tool for non-chart queries
     def get_dataset_info(query_type: str = "columns"):
         """Returns basic dataset information"""
         info = {}
+        # "columns matching <text>" looks up columns left out of the compacted prompt schema
+        match = re.search(r"match(?:ing|es)?\s+(.+)", query_type, re.IGNORECASE)
+        if match:
+            term = match.group(1).strip().strip('"\'').lower()
+            matching = [col for col in df.columns if term in str(col).lower()]
+            info["matching_columns"] = {col: str(df[col].dtype) for col in matching}
+            return json.dumps(info, indent=2)
         if "column" in query_type.lower() or not query_type.strip():
             info["columns"] = list(df.columns)
             info["count"] = len(df.columns)
         if "row" in query_type.lower() or "shape" in query_type.lower():
-            info["rows"] = len(df)
+            info["rows"] = row_count
         if "type" in query_type.lower() or "dtype" in query_type.lower():
             info["dtypes"] = df.dtypes.astype(str).to_dict()
         if not info:  # Default: return everything
             info = {
                 "columns": list(df.columns),
                 "column_count": len(df.columns),
-                "row_count": len(df),
+                "row_count": row_count,
                 "dtypes": df.dtypes.astype(str).to_dict()
             }
         return json.dumps(info, indent=2)
@@ -132,11 +412,38 @@ async def analyze_question(df: pd.DataFrame, question: str):
             else:
                 raise
 
+    def bar_chart_tool(args):
+        args = safe_json_parse(args)
+        frame, agg = chart_input(args["x"], args["y"], args.get("agg"))
+        return prepare_bar_chart_data(frame, x_col=args["x"], y_col=args["y"], n=int(args.get("n", 7)), title=args.get("title", None), agg=agg)
+
+    def line_chart_tool(args):
+        args = safe_json_parse(args)
+        frame, agg = chart_input(args["time_col"], args["value_col"])
+        return prepare_line_chart_data(frame, time_col=args["time_col"], value_col=args["value_col"], title=args.get("title", None), agg=agg)
+
+    def pie_chart_tool(args):
+        args = safe_json_parse(args)
+        frame, agg = chart_input(args["label"], args["value"], args.get("agg"))
+        return prepare_pie_chart_data(frame, label_col=args["label"], value_col=args["value"], n=int(args.get("n", 7)), title=args.get("title", None), agg=agg)
+
+    def join_tool(args):
+        # Later tools work on the joined table
+        nonlocal df, tool, row_count
+        try:
+            df = join_context.join(safe_json_parse(args), df)
+        except (ValueError, KeyError, NameError, SyntaxError) as e:
+            # Bad alias, columns or filter: tell the model so it can fix its input
+            return f"Join failed: {e}"
+        tool = PandasTool(df)
+        row_count = len(df)
+        return f"Joined: the working table now has {len(df):,} rows and columns {list(df.columns)}"
+
     tools = [
         Tool(
             name="dataset_info",
             func=get_dataset_info,
-            description="""Get dataset column names and structure. Use for: "what are the columns", "list columns", "column names", "dataset info".""",
+            description="""Get dataset column names and structure. Use for: "what are the columns", "list columns", "column names", "dataset info". Input: columns, dtypes, rows, or "columns matching <text>" to find a column not listed above.""",
         ),
         Tool(
             name="describe",
@@ -175,40 +482,25 @@ async def analyze_question(df: pd.DataFrame, question: str):
         ),
         Tool(
             name="prepare_bar_chart",
-            func=lambda args: prepare_bar_chart_data(
-                df,
-                x_col=safe_json_parse(args)["x"],
-                y_col=safe_json_parse(args)["y"],
-                n=int(safe_json_parse(args).get("n", 7)),
-                title=safe_json_parse(args).get("title", None)
-            ),
-            description="""Create bar chart. ONLY for explicit visualization requests. Input: {"x": "State", "y": "Profit", "n": 5}""",
+            func=bar_chart_tool,
+            description="""Create bar chart. ONLY for explicit visualization requests. Input: {"x": "State", "y": "Profit", "n": 5}, add "agg": "sum"/"mean"/"count" to aggregate per x""",
         ),
         Tool(
             name="prepare_line_chart",
-            func=lambda args: prepare_line_chart_data(
-                df,
-                time_col=safe_json_parse(args)["time_col"],
-                value_col=safe_json_parse(args)["value_col"],
-                title=safe_json_parse(args).get("title", None)
-            ),
+            func=line_chart_tool,
             description="""Create line chart. ONLY for explicit visualization requests. Input: {"time_col": "Date", "value_col": "Sales"}""",
         ),
         Tool(
             name="prepare_pie_chart",
-            func=lambda args: prepare_pie_chart_data(
-                df,
-                label_col=safe_json_parse(args)["label"],
-                value_col=safe_json_parse(args)["value"],
-                n=int(safe_json_parse(args).get("n", 7)),
-                title=safe_json_parse(args).get("title", None)
-            ),
-            description="""Create pie chart. ONLY for explicit visualization requests. Input: {"label": "Category", "value": "Sales"}""",
+            func=pie_chart_tool,
+            description="""Create pie chart. ONLY for explicit visualization requests. Input: {"label": "Category", "value": "Sales"}, add "agg": "sum"/"mean"/"count" to aggregate per label""",
         ),
     ]
+    if join_context is not None:
+        tools.append(Tool(name="join", func=join_tool, description=join_context.tool_description()))
 
     # MINIMAL PROMPT - Less is more!
-    template = """Answer questions about a dataset with columns: {columns_list}
+    template = """Answer questions about a dataset with columns ({dtype_legend}): {columns_list}
 
 Tools: {tools}
 
@@ -232,23 +524,7 @@ ANSWER FORMAT: Provide detailed, well-formatted responses:
 - Compare with other metrics when relevant (min, max, median)
 - Use clear section headers
 
-Example for "What is the average sales?":
-Based on the analysis of 9,994 data points:
-
-📊 Average Sales: $229.86
-
-Key Statistics:
-• Median Sales: $54.49 (half of sales are below this value)
-• Minimum Sales: $0.44
-• Maximum Sales: $22,638.48
-• Standard Deviation: $623.25 (indicates high variability)
-
-Insights:
-• The average is significantly higher than the median, suggesting some very high-value sales are pulling the average up
-• There's a wide range between minimum and maximum values
-• 75% of sales are below $209.94
-
-Format:
+{answer_example}Format:
 Question: the question
 Thought: which tool to use and why
 Action: tool name from [{tool_names}]
@@ -263,7 +539,10 @@ Begin!
 Question: {input}
 Thought: {agent_scratchpad}"""
 
-    prompt = PromptTemplate.from_template(template)
+    prompt = PromptTemplate.from_template(template).partial(
+        dtype_legend=DTYPE_LEGEND,
+        answer_example=ANSWER_EXAMPLE if settings.PROMPT_FEW_SHOT_EXAMPLE else ""
+    )
     
     # Create the ReAct agent
     agent = create_react_agent(llm, tools, prompt)
@@ -273,160 +552,27 @@ Thought: {agent_scratchpad}"""
         verbose=True, 
         handle_parsing_errors=True,
         return_intermediate_steps=True,
-        max_iterations=5  # Limit iterations to prevent runaway
+        max_iterations=settings.AGENT_MAX_ITERATIONS  # Limit iterations to prevent runaway
     )
 
-    columns = list(df.columns)
-    
-    def enhance_answer(final_answer: str, intermediate_steps: list) -> str:
-        """Post-process answer to add more details and formatting"""
-        
-        # Check if answer is already detailed (has bullet points or multiple lines)
-        if '•' in final_answer or '**' in final_answer or len(final_answer.split('\n')) > 3:
-            return final_answer
-        
-        # Try to enhance based on tool outputs
-        for action, observation in intermediate_steps:
-            action_name = action.tool if hasattr(action, 'tool') else str(action)
-            
-            # Enhance dataset_info outputs
-            if action_name == "dataset_info":
-                try:
-                    if isinstance(observation, str):
-                        info = json.loads(observation)
-                    else:
-                        info = observation
-                    
-                    if "columns" in info:
-                        columns = info["columns"]
-                        enhanced = f"📊 **Dataset Overview**\n\n"
-                        enhanced += f"This dataset contains **{len(columns)} columns** and **{info.get('row_count', len(df))} rows**.\n\n"
-                        enhanced += f"**Available Columns:**\n"
-                        
-                        # Group columns by type if dtypes available
-                        if "dtypes" in info:
-                            dtypes = info["dtypes"]
-                            numeric_cols = [col for col in columns if dtypes.get(col, "").startswith(("int", "float"))]
-                            text_cols = [col for col in columns if dtypes.get(col, "") == "object"]
-                            
-                            if numeric_cols:
-                                enhanced += f"\n**Numeric Columns** ({len(numeric_cols)}):\n"
-                                for col in numeric_cols:
-                                    enhanced += f"• {col}\n"
-                            
-                            if text_cols:
-                                enhanced += f"\n**Text/Categorical Columns** ({len(text_cols)}):\n"
-                                for col in text_cols:
-                                    enhanced += f"• {col}\n"
-                        else:
-                            # Simple list if no type info
-                            for i, col in enumerate(columns, 1):
-                                enhanced += f"{i}. {col}\n"
-                        
-                        enhanced += f"\n💡 **Tip:** You can now ask questions like:\n"
-                        enhanced += f"• 'What is the average Sales?'\n"
-                        enhanced += f"• 'Show me top 10 States by Profit'\n"
-                        enhanced += f"• 'Create a bar chart of Sales by Region'\n"
-                        
-                        return enhanced
-                except (json.JSONDecodeError, KeyError):
-                    pass
-            
-            # Enhance describe tool outputs
-            if action_name == "describe" and isinstance(observation, dict):
-                for col_name, stats in observation.items():
-                    if isinstance(stats, dict):
-                        count = stats.get('count', 0)
-                        mean = stats.get('mean', 0)
-                        median = stats.get('50%', 0)
-                        std = stats.get('std', 0)
-                        min_val = stats.get('min', 0)
-                        max_val = stats.get('max', 0)
-                        q25 = stats.get('25%', 0)
-                        q75 = stats.get('75%', 0)
-                        
-                        # Create enhanced answer
-                        enhanced = f"📊 **Analysis of {col_name}** (Based on {int(count):,} data points)\n\n"
-                        enhanced += f"**Key Metrics:**\n"
-                        enhanced += f"• Average: ${mean:,.2f}\n"
-                        enhanced += f"• Median: ${median:,.2f}\n"
-                        enhanced += f"• Range: ${min_val:,.2f} to ${max_val:,.2f}\n"
-                        enhanced += f"• Standard Deviation: ${std:,.2f}\n\n"
-                        enhanced += f"**Distribution:**\n"
-                        enhanced += f"• 25th Percentile: ${q25:,.2f} (25% of values are below this)\n"
-                        enhanced += f"• 50th Percentile (Median): ${median:,.2f}\n"
-                        enhanced += f"• 75th Percentile: ${q75:,.2f} (75% of values are below this)\n\n"
-                        
-                        # Add insights
-                        if mean > median * 1.5:
-                            enhanced += f"**💡 Insight:** The average (${mean:,.2f}) is significantly higher than the median (${median:,.2f}), "
-                            enhanced += f"indicating that some high-value outliers are pulling the average up. The median might be a better "
-                            enhanced += f"representation of typical {col_name.lower()}.\n"
-                        elif std > mean:
-                            enhanced += f"**💡 Insight:** High variability detected (standard deviation > mean). "
-                            enhanced += f"This suggests {col_name.lower()} values vary widely across the dataset.\n"
-                        else:
-                            enhanced += f"**💡 Insight:** The data shows moderate variability with most values "
-                            enhanced += f"clustering around the average of ${mean:,.2f}.\n"
-                        
-                        return enhanced
-            
-            # Enhance top_n outputs
-            elif action_name == "top_n" and isinstance(observation, list):
-                if len(observation) > 0:
-                    enhanced = f"📊 **Top {len(observation)} Results:**\n\n"
-                    for i, item in enumerate(observation[:10], 1):
-                        if isinstance(item, dict):
-                            # Format each item nicely
-                            enhanced += f"**{i}.** "
-                            for key, value in item.items():
-                                if isinstance(value, (int, float)):
-                                    enhanced += f"{key}: ${value:,.2f}  "
-                                else:
-                                    enhanced += f"{key}: {value}  "
-                            enhanced += "\n"
-                    return enhanced
-            
-            # Enhance correlation outputs
-            elif action_name == "correlation" and isinstance(observation, dict):
-                corr_value = observation.get('correlation', 0)
-                col_x = observation.get('col_x', 'X')
-                col_y = observation.get('col_y', 'Y')
-                
-                enhanced = f"📊 **Correlation Analysis: {col_x} vs {col_y}**\n\n"
-                enhanced += f"**Correlation Coefficient:** {corr_value:.4f}\n\n"
-                enhanced += f"**Interpretation:**\n"
-                
-                if abs(corr_value) >= 0.7:
-                    strength = "Strong"
-                elif abs(corr_value) >= 0.4:
-                    strength = "Moderate"
-                else:
-                    strength = "Weak"
-                
-                direction = "positive" if corr_value > 0 else "negative"
-                
-                enhanced += f"• {strength} {direction} correlation detected\n"
-                
-                if corr_value > 0:
-                    enhanced += f"• As {col_x} increases, {col_y} tends to increase as well\n"
-                else:
-                    enhanced += f"• As {col_x} increases, {col_y} tends to decrease\n"
-                
-                if abs(corr_value) >= 0.7:
-                    enhanced += f"• This indicates a strong relationship between the two variables\n"
-                elif abs(corr_value) < 0.3:
-                    enhanced += f"• The relationship between these variables is minimal\n"
-                
-                return enhanced
-        
-        return final_answer
+    # Only the columns most relevant to the question go into the prompt, it is resent on every step
+    columns_list, hidden_columns = compact_schema(df, question, settings.PROMPT_SCHEMA_TOKEN_BUDGET)
+    if hidden_columns:
+        print(f"Prompt schema compacted: {hidden_columns} of {len(df.columns)} columns left to dataset_info")
     
     try:
-        response = await agent_executor.ainvoke({
-            "input": question,
-            "columns_list": ", ".join(columns)
-        })
+        usage = usage_callbacks()
+        try:
+            with span("agent"):
+                response = await run_agent(
+                    agent_executor,
+                    {"input": question, "columns_list": columns_list},
+                    question,
+                    callbacks=langchain_tracing_callbacks() + [usage],
+                    answerable=lambda action, observation: answerable_observation(action, observation, df)
+                )
+        finally:
+            record_llm_usage(usage, llm_client.provider)
         
         final_answer = response.get("output", "")
         chart_specification = None
@@ -437,7 +583,7 @@ Thought: {agent_scratchpad}"""
         
         # Enhance the answer with more details
         if "intermediate_steps" in response and response["intermediate_steps"]:
-            enhanced_answer = enhance_answer(final_answer, response["intermediate_steps"])
+            enhanced_answer = enhance_answer(final_answer, response["intermediate_steps"], df)
             final_answer = enhanced_answer
         
         # IMPROVED: More precise chart extraction
@@ -479,9 +625,15 @@ Thought: {agent_scratchpad}"""
             "final_answer": final_answer,
             "reasoning": "See agent execution log for detailed reasoning.",
             "tool_results": [],
-            "chart_specification": chart_specification
+            "chart_specification": chart_specification,
+            "agent_iterations": response["iterations"]
         }
+    except ProviderUnavailableError:
+        return degraded_response(df, question)
     except Exception as e:
+        if not provider_available(llm_client.provider):
+            # Retries ran out and tripped the breaker during this run
+            return degraded_response(df, question)
         import traceback
         traceback.print_exc()
         return {
@@ -0,0 +1,90 @@
+import hashlib
+import pandas as pd
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from ..deps import get_db
+from ..utils import metrics
+from .mongo_service import upload_file_to_gridfs, get_gridfs_bucket
+
+# Content-addressed storage of uploaded CSVs. Uploads are hashed (sha256) while they
+# are read and each distinct content is stored once in GridFS. The `blobs` collection
+# maps the hash to that file, counts the datasets and chunks referencing it, and keeps
+# the artifacts derived from the content (columns, profile, stratified sample) so a
+# re-upload of the same export skips parsing, profiling and sampling. The LLM cache is
+# keyed by prompt, so identical content also hits the same cached completions.
+
+UPLOAD_READ_SIZE = 1 << 20
+
+async def read_upload(file) -> tuple:
+    """(content, sha256 hex digest) of an UploadFile, hashed as it is read"""
+    digest = hashlib.sha256()
+    parts = []
+    while True:
+        part = await file.read(UPLOAD_READ_SIZE)
+        if not part:
+            break
+        digest.update(part)
+        parts.append(part)
+    return b"".join(parts), digest.hexdigest()
+
+def content_hash_of(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+async def acquire_blob(content_hash: str, file_bytes: bytes, filename: str, metadata: dict):
+    """(blob, reused): the stored blob for the content, with one more reference taken"""
+    blobs = get_db().blobs
+    blob = await blobs.find_one_and_update(
+        {"_id": content_hash},
+        {"$inc": {"refcount": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if blob:
+        metrics.blob_uploads.inc(result="reused")
+        return blob, True
+    file_id = await upload_file_to_gridfs(file_bytes, filename, {**metadata, "sha256": content_hash})
+    blob = {
+        "_id": content_hash,
+        "file_id": file_id,
+        "size": len(file_bytes),
+        "refcount": 1,
+        "created_at": pd.Timestamp.utcnow().to_pydatetime(),
+    }
+    try:
+        await blobs.insert_one(blob)
+    except DuplicateKeyError:
+        # The same content was uploaded concurrently; keep the copy that won
+        await get_gridfs_bucket().delete(file_id)
+        return await acquire_blob(content_hash, file_bytes, filename, metadata)
+    metrics.blob_uploads.inc(result="stored")
+    return blob, False
+
+async def release_blob(content_hash: str):
+    """Drop one reference; the last one deletes the file and the blob's artifacts"""
+    blobs = get_db().blobs
+    blob = await blobs.find_one_and_update(
+        {"_id": content_hash},
+        {"$inc": {"refcount": -1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not blob or blob["refcount"] > 0:
+        return
+    # Only delete if nobody took a new reference in the meantime
+    res = await blobs.delete_one({"_id": content_hash, "refcount": {"$lte": 0}})
+    if res.deleted_count == 0:
+        return
+    file_ids = [blob["file_id"]]
+    sample = (blob.get("artifacts") or {}).get("sample")
+    if sample and sample.get("file_id"):
+        file_ids.append(sample["file_id"])
+    for file_id in file_ids:
+        try:
+            await get_gridfs_bucket().delete(file_id)
+        except Exception as e:
+            print(f"Could not delete blob file {file_id}: {e}")
+
+async def set_blob_artifacts(content_hash: str, **artifacts):
+    """Record artifacts derived from the blob's content for later uploads of it"""
+    await get_db().blobs.update_one(
+        {"_id": content_hash},
+        {"$set": {f"artifacts.{name}": value for name, value in artifacts.items()}},
+    )
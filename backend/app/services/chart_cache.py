@@ -0,0 +1,95 @@
+import datetime
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from ..config import settings
+from ..deps import get_db
+from ..utils.metrics import register_collector
+
+# Direct-parsed chart answers by chart id. The id hashes the dataset, its version and
+# the parsed chart parameters: an append creates a new version and so new ids, and
+# an id always names the same answer, which makes it a strong ETag. Answers are kept
+# in an in-memory LRU and in the `charts` collection, expiring after
+# CHART_CACHE_TTL_S, so any worker can serve GET /charts/{chart_id} and conditional
+# re-polls are answered with 304 without loading anything.
+
+# Parsed parameters that determine a chart answer
+CHART_PARAMS = ("chart_type", "x_col", "y_col", "n", "agg", "grain", "filters", "title")
+
+_entries = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0, "mongo_hits": 0, "not_modified": 0}
+register_collector(
+    "chart_cache_requests_total", "Chart answer cache lookups by result", "counter", ("result",),
+    lambda: [((name,), value) for name, value in cache_stats.items()])
+
+def chart_id(dataset_doc, parsed_params: dict) -> str:
+    payload = json.dumps({
+        "dataset": str(dataset_doc["_id"]),
+        "version": dataset_doc.get("version", 1),
+        "params": {name: parsed_params.get(name) for name in CHART_PARAMS},
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def etag(chart_id: str) -> str:
+    return f'"{chart_id}"'
+
+def etag_matches(if_none_match: str, chart_id: str) -> bool:
+    """Whether an If-None-Match header names the chart (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if any(tag.removeprefix("W/") == etag(chart_id) for tag in tags):
+        cache_stats["not_modified"] += 1
+        return True
+    return False
+
+def chart_headers(chart_id: str, immutable: bool = False) -> dict:
+    """ETag and Cache-Control for a chart; a chart id's content never changes, the chart a question maps to may"""
+    cache_control = f"private, max-age={settings.CHART_CACHE_TTL_S}, immutable" if immutable else "private, no-cache"
+    return {"ETag": etag(chart_id), "Cache-Control": cache_control}
+
+def _set_memory(chart_id: str, result: dict):
+    _entries[chart_id] = (time.time() + settings.CHART_CACHE_TTL_S, result)
+    _entries.move_to_end(chart_id)
+    while len(_entries) > settings.CHART_CACHE_MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+async def get_chart(chart_id: str):
+    """The stored answer of a chart id, or None"""
+    entry = _entries.get(chart_id)
+    if entry is not None and entry[0] >= time.time():
+        _entries.move_to_end(chart_id)
+        cache_stats["hits"] += 1
+        return entry[1]
+    try:
+        doc = await get_db().charts.find_one({"_id": chart_id})
+    except Exception as e:
+        # A cache read must never fail the request
+        print(f"Chart cache lookup failed: {e}")
+        doc = None
+    # pymongo hands back naive UTC datetimes
+    if doc and doc["expires_at"].replace(tzinfo=datetime.timezone.utc).timestamp() >= time.time():
+        cache_stats["mongo_hits"] += 1
+        _set_memory(chart_id, doc["result"])
+        return doc["result"]
+    cache_stats["misses"] += 1
+    return None
+
+async def put_chart(chart_id: str, dataset_doc, result: dict):
+    _set_memory(chart_id, result)
+    try:
+        expires_at = datetime.datetime.fromtimestamp(time.time() + settings.CHART_CACHE_TTL_S, tz=datetime.timezone.utc)
+        await get_db().charts.replace_one(
+            {"_id": chart_id},
+            {
+                "_id": chart_id,
+                "dataset_id": dataset_doc["_id"],
+                "version": dataset_doc.get("version", 1),
+                "result": result,
+                "expires_at": expires_at,
+            },
+            upsert=True,
+        )
+    except Exception as e:
+        print(f"Chart cache write failed: {e}")
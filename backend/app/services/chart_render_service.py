@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from ..config import settings
+from ..utils.metrics import register_collector
+
+# Server-side rendering of the Chart.js specifications built by prepare_*_chart_data,
+# for clients that can't run Chart.js (email reports, exports)
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+_executor = None
+_cache = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0}
+register_collector(
+    "chart_render_cache_requests_total", "Rendered chart cache lookups by result", "counter", ("result",),
+    lambda: [(("hit",), cache_stats["hits"]), (("miss",), cache_stats["misses"])])
+
+def _to_mpl_color(color):
+    """Convert a Chart.js 'rgba(r, g, b, a)' / 'rgb(r, g, b)' string into a matplotlib color"""
+    if not isinstance(color, str):
+        return None
+    match = re.match(r"rgba?\(([^)]*)\)", color.strip())
+    if not match:
+        return color
+    parts = [float(p) for p in match.group(1).split(",")]
+    r, g, b = (min(max(p / 255.0, 0.0), 1.0) for p in parts[:3])
+    alpha = parts[3] if len(parts) > 3 else 1.0
+    return (r, g, b, alpha)
+
+def _to_mpl_colors(colors, count):
+    if colors is None:
+        return None
+    if isinstance(colors, list):
+        converted = [_to_mpl_color(c) for c in colors]
+        # Chart.js cycles through the palette when there are more points than colors
+        return [converted[i % len(converted)] for i in range(count)] if converted else None
+    return _to_mpl_color(colors)
+
+def render_chart_spec(chart_spec: dict, fmt: str = "png", width: float = 8, height: float = 5, dpi: int = 100) -> bytes:
+    """
+    Draw a Chart.js specification (bar, line or pie) with the object-oriented Figure API.
+    Runs inside the render process pool, so it must stay a picklable module-level function.
+    """
+    from .tools import new_figure, figure_to_bytes, rotate_xticklabels
+
+    chart_type = chart_spec.get("type")
+    data = chart_spec.get("data", {})
+    labels = [str(label) for label in data.get("labels", [])]
+    datasets = data.get("datasets", [])
+    options = chart_spec.get("options", {})
+
+    fig = new_figure(figsize=(width, height))
+    ax = fig.add_subplot()
+
+    if chart_type == "pie":
+        dataset = datasets[0] if datasets else {}
+        ax.pie(
+            dataset.get("data", []),
+            labels=labels,
+            colors=_to_mpl_colors(dataset.get("backgroundColor"), len(labels)),
+            autopct="%1.1f%%",
+            startangle=90,
+        )
+        ax.axis("equal")
+    elif chart_type in ("bar", "line"):
+        for dataset in datasets:
+            values = dataset.get("data", [])
+            if chart_type == "bar":
+                ax.bar(
+                    labels,
+                    values,
+                    color=_to_mpl_colors(dataset.get("backgroundColor"), len(values)),
+                    edgecolor=_to_mpl_colors(dataset.get("borderColor"), len(values)),
+                    linewidth=dataset.get("borderWidth", 1),
+                    label=dataset.get("label"),
+                )
+            else:
+                color = _to_mpl_color(dataset.get("borderColor"))
+                ax.plot(labels, values, marker="o", markersize=3, color=color, label=dataset.get("label"))
+                if dataset.get("fill"):
+                    ax.fill_between(range(len(values)), values, color=_to_mpl_color(dataset.get("backgroundColor")))
+        scales = options.get("scales", {})
+        ax.set_xlabel(scales.get("x", {}).get("title", {}).get("text", ""))
+        ax.set_ylabel(scales.get("y", {}).get("title", {}).get("text", ""))
+        # Long time series would otherwise print every single label
+        if len(labels) > 20:
+            from matplotlib.ticker import MaxNLocator
+            ax.xaxis.set_major_locator(MaxNLocator(20))
+        rotate_xticklabels(ax)
+    else:
+        raise ValueError(f"Unsupported chart type: {chart_type}")
+
+    plugins = options.get("plugins", {})
+    title = plugins.get("title", {})
+    if title.get("display", True) and title.get("text"):
+        ax.set_title(title["text"])
+    if plugins.get("legend", {}).get("display") and chart_type != "pie" and datasets:
+        ax.legend()
+
+    fig.tight_layout()
+    return figure_to_bytes(fig, fmt, dpi=dpi)
+
+def chart_spec_hash(chart_spec: dict, fmt: str, **render_options) -> str:
+    payload = json.dumps({"spec": chart_spec, "format": fmt, "options": render_options}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn rather than fork: the parent runs an event loop and Mongo client threads
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.CHART_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def render_chart(chart_spec: dict, fmt: str = "png", width: float = 8, height: float = 5, dpi: int = 100):
+    """
+    Render a chart specification to PNG/SVG bytes in the process pool.
+    Returns (image_bytes, cache_hit); images are cached by the hash of the spec and options.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    key = chart_spec_hash(chart_spec, fmt, width=width, height=height, dpi=dpi)
+    cached = _cache.get(key)
+    if cached is not None:
+        _cache.move_to_end(key)
+        cache_stats["hits"] += 1
+        return cached, True
+
+    cache_stats["misses"] += 1
+    loop = asyncio.get_running_loop()
+    image = await loop.run_in_executor(get_executor(), render_chart_spec, chart_spec, fmt, width, height, dpi)
+    _cache[key] = image
+    while len(_cache) > settings.CHART_RENDER_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return image, False
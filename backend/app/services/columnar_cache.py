@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from ..config import settings
+from ..utils.metrics import register_collector
+
+# Local disk copies of parsed dataset files, so a restarted or evicted worker doesn't
+# download and parse them from GridFS again. Each GridFS file gets a directory named
+# after its file_id (files are never modified, so entries never go stale) holding one
+# .npy file per column and a manifest.json written last. String columns are stored as
+# int32 codes plus the array of distinct values. Numeric columns are memory-mapped
+# copy-on-write, so the uvicorn workers of a host share the page cache for them.
+# Least recently read entries are deleted once the directory exceeds
+# DATASET_DISK_CACHE_MAX_BYTES. Reads can select columns, and the manifest keeps the
+# min/max of each numeric column per row group so simple filters skip whole groups.
+
+MANIFEST = "manifest.json"
+ROW_GROUP_ROWS = 65536
+
+cache_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+register_collector(
+    "dataset_disk_cache_requests_total", "Columnar disk cache operations by result", "counter", ("result",),
+    lambda: [((name,), value) for name, value in cache_stats.items()])
+
+def cache_root() -> Path:
+    return Path(settings.DATASET_DISK_CACHE_DIR)
+
+def entry_path(file_id) -> Path:
+    return cache_root() / str(file_id)
+
+def encode_column(series: pd.Series):
+    """(kind, {suffix: array}) for a column, or None when it can't be stored losslessly"""
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuf":
+        return "numeric", {"": series.to_numpy()}
+    if pd.api.types.is_string_dtype(series.dtype):
+        codes, uniques = pd.factorize(series)
+        if pd.api.types.infer_dtype(uniques, skipna=True) not in ("string", "empty"):
+            return None
+        return "codes", {".codes": codes.astype(np.int32), ".values": np.asarray(uniques, dtype=str)}
+    return None
+
+def decode_column(column: dict, arrays: dict):
+    """Column values from encode_column's arrays; numeric arrays are used as they are"""
+    if column["kind"] == "numeric":
+        return arrays[""]
+    codes = arrays[".codes"]
+    values = arrays[".values"].astype(object).take(codes)
+    values[codes < 0] = np.nan
+    return pd.array(values, dtype=column["dtype"])
+
+def row_group_stats(values: np.ndarray):
+    """[[min, max], ...] per row group of a numeric column; None for a group without values"""
+    stats = []
+    for start in range(0, len(values), ROW_GROUP_ROWS):
+        group = values[start:start + ROW_GROUP_ROWS].astype(np.float64)
+        group = group[~np.isnan(group)]
+        stats.append([float(group.min()), float(group.max())] if len(group) else None)
+    return stats
+
+def group_may_match(bounds, op: str, value: float) -> bool:
+    if bounds is None:
+        # Only missing values, which match no comparison
+        return False
+    low, high = bounds
+    if op == ">":
+        return high > value
+    if op == ">=":
+        return high >= value
+    if op == "<":
+        return low < value
+    if op == "<=":
+        return low <= value
+    if op == "==":
+        return low <= value <= high
+    return True
+
+def matching_groups(manifest: dict, filters) -> np.ndarray:
+    """Indices of the row groups that may hold rows matching all filters"""
+    count = -(-manifest["rows"] // ROW_GROUP_ROWS)
+    keep = np.ones(count, dtype=bool)
+    by_name = {column["name"]: column for column in manifest["columns"]}
+    for col, op, value in filters or []:
+        stats = by_name.get(col, {}).get("stats")
+        if stats is None:
+            # Entries written before row group stats, or a string column: read every group
+            continue
+        keep &= [group_may_match(bounds, op, value) for bounds in stats]
+    return np.flatnonzero(keep)
+
+def write_entry(file_id, df: pd.DataFrame):
+    """Store df as the columnar copy of file_id; bytes written, or None if a column isn't supported"""
+    root = cache_root()
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = root / f".tmp-{file_id}-{uuid.uuid4().hex}"
+    tmp.mkdir()
+    try:
+        columns = []
+        for i, col in enumerate(df.columns):
+            stored = encode_column(df[col])
+            if stored is None:
+                print(f"Not caching {file_id}: column '{col}' has dtype {df[col].dtype}")
+                return None
+            kind, arrays = stored
+            for suffix, array in arrays.items():
+                np.save(tmp / f"{i}{suffix}.npy", array, allow_pickle=False)
+            column = {"name": str(col), "dtype": str(df[col].dtype), "kind": kind}
+            if kind == "numeric":
+                column["stats"] = row_group_stats(arrays[""])
+            columns.append(column)
+        size = sum(f.stat().st_size for f in tmp.iterdir())
+        with open(tmp / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump({"rows": len(df), "columns": columns, "bytes": size}, f)
+        try:
+            os.replace(tmp, entry_path(file_id))
+        except OSError:
+            # Another worker cached the same file first
+            return None
+        cache_stats["writes"] += 1
+        return size
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _take_groups(array: np.ndarray, groups: np.ndarray, count: int) -> np.ndarray:
+    if len(groups) == count:
+        return array
+    return np.concatenate([array[g * ROW_GROUP_ROWS:(g + 1) * ROW_GROUP_ROWS] for g in groups]) if len(groups) else array[:0]
+
+def read_entry(file_id, columns: list = None, filters: list = None):
+    """The cached DataFrame of file_id, or None on a miss.
+
+    columns limits the columns read; filters ([column, op, number]) skip the row
+    groups that can't match, the rows of the groups kept still need filtering.
+    """
+    path = entry_path(file_id)
+    try:
+        with open(path / MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+        groups = matching_groups(manifest, filters)
+        count = -(-manifest["rows"] // ROW_GROUP_ROWS)
+        data = {}
+        for i, column in enumerate(manifest["columns"]):
+            if columns is not None and column["name"] not in columns:
+                continue
+            if column["kind"] == "numeric":
+                # Plain ndarray view of the mapping, pandas shouldn't see the memmap subclass
+                arrays = {"": _take_groups(np.load(path / f"{i}.npy", mmap_mode="c").view(np.ndarray), groups, count)}
+            else:
+                codes = _take_groups(np.load(path / f"{i}.codes.npy", mmap_mode="r"), groups, count)
+                arrays = {".codes": codes, ".values": np.load(path / f"{i}.values.npy")}
+            data[column["name"]] = decode_column(column, arrays)
+        os.utime(path / MANIFEST)
+    except FileNotFoundError:
+        # Not cached, or evicted by another worker while reading
+        cache_stats["misses"] += 1
+        return None
+    cache_stats["hits"] += 1
+    return pd.DataFrame(data, copy=False)
+
+def evict(max_bytes: int = None):
+    """Delete least recently read entries until the cache fits in max_bytes"""
+    max_bytes = settings.DATASET_DISK_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for path in cache_root().iterdir():
+        try:
+            manifest_path = path / MANIFEST
+            with open(manifest_path, encoding="utf-8") as f:
+                size = json.load(f)["bytes"]
+            entries.append((manifest_path.stat().st_mtime, size, path))
+        except (FileNotFoundError, NotADirectoryError, ValueError, KeyError):
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        # Workers that already mapped the files keep reading them after the unlink
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        cache_stats["evictions"] += 1
+
+def spill(file_id, df: pd.DataFrame):
+    if write_entry(file_id, df) is not None:
+        evict()
@@ -1,28 +1,29 @@
-from ..services.mongo_service import upload_file_to_gridfs, download_file_from_gridfs, get_gridfs_bucket
-from ..deps import get_mongo_client
+from ..services.mongo_service import open_gridfs_reader
+from ..deps import get_db
+from ..utils.tracing import span
+from ..utils import metrics
+from .rollup_service import merge_chunk_into_rollups
+from .sample_service import store_sample
+from . import columnar_cache, shared_datasets
+from .admission import single_flight
+from .tools import apply_filters
+from .blob_service import acquire_blob, release_blob, set_blob_artifacts, content_hash_of
+from ..config import settings
+from .profile_service import compute_profile, merge_profiles, check_schema_compatible, schema_columns
 from bson import ObjectId
+from pymongo import DESCENDING
 import pandas as pd
+import asyncio
 import io
+import time
 
-db = get_mongo_client().ai_data_analyst
+# Fields the dashboard shows for each dataset in /files/list
+DATASET_LIST_PROJECTION = {"_id": 1, "owner_id": 1, "filename": 1, "file_id": 1, "created_at": 1}
 
-async def save_dataset(user_id: str, file_bytes: bytes, filename: str):
-    metadata = {"owner_id": user_id, "filename": filename}
-    file_id = await upload_file_to_gridfs(file_bytes, filename, metadata)
-    doc = {
-        "owner_id": user_id,
-        "filename": filename,
-        "file_id": file_id,
-        "created_at": pd.Timestamp.utcnow().to_pydatetime()
-    }
-    res = await db.datasets.insert_one(doc)
-    doc["_id"] = res.inserted_id
-    return doc
+class AppendConflictError(Exception):
+    """Raised when another append changed the dataset while this one was being processed"""
 
-async def load_dataset_to_df(dataset_doc):
-    # dataset_doc contains file_id
-    file_id = dataset_doc["file_id"]
-    content = await download_file_from_gridfs(file_id)
+def parse_csv(content: bytes) -> pd.DataFrame:
     # read bytes into pandas
     try:
         # Try different encodings
@@ -32,8 +33,9 @@ async def load_dataset_to_df(dataset_doc):
         
         for encoding in encodings:
             try:
-                decoded_content = content.decode(encoding)
-                df = pd.read_csv(io.StringIO(decoded_content))
+                with span("csv_parse", encoding=encoding):
+                    # pandas decodes while parsing, no decoded copy of the whole file
+                    df = pd.read_csv(io.BytesIO(content), encoding=encoding)
                 break
             except UnicodeDecodeError as e:
                 last_error = e
@@ -51,6 +53,242 @@ async def load_dataset_to_df(dataset_doc):
         raise e
     return df
 
-async def get_user_datasets(user_id: str):
-    cursor = db.datasets.find({"owner_id": user_id})
+# Encodings tried by read_csv_from_gridfs; latin-1 decodes any byte, so it is the last resort
+STREAM_ENCODINGS = ("utf-8", "latin-1")
+
+async def read_csv_from_gridfs(file_id, columns: list = None):
+    """
+    (DataFrame, bytes read) of a stored CSV, parsed in a worker thread while it
+    downloads instead of after buffering the whole file. columns limits the columns
+    parsed; names the file doesn't have are ignored.
+    """
+    usecols = None if columns is None else (lambda name: name in columns)
+    last_error = None
+    for encoding in STREAM_ENCODINGS:
+        reader = await open_gridfs_reader(file_id)
+        try:
+            with span("csv_parse", encoding=encoding, streamed=True, projected=columns is not None):
+                df = await asyncio.to_thread(pd.read_csv, reader, encoding=encoding, usecols=usecols)
+            return df, reader.bytes_read
+        except UnicodeDecodeError as e:
+            # Not this encoding; download again rather than keeping a copy of the file
+            last_error = e
+        finally:
+            reader.close()
+    raise last_error
+
+async def save_dataset(user_id: str, file_bytes: bytes, filename: str, content_hash: str = None):
+    """
+    Store an uploaded CSV as a new dataset. Content already uploaded before reuses the
+    stored file and its columns, profile and sample instead of parsing it again.
+    """
+    content_hash = content_hash or content_hash_of(file_bytes)
+    metadata = {"owner_id": user_id, "filename": filename}
+    blob, reused = await acquire_blob(content_hash, file_bytes, filename, metadata)
+    file_id = blob["file_id"]
+    created_at = pd.Timestamp.utcnow().to_pydatetime()
+    doc = {
+        "owner_id": user_id,
+        "filename": filename,
+        "file_id": file_id,
+        "content_hash": content_hash,
+        "created_at": created_at,
+        "version": 1,
+    }
+    artifacts = blob.get("artifacts") or {}
+    df = None
+    if reused and artifacts.get("profile"):
+        print(f"Reusing stored content {content_hash[:12]} for {filename}")
+        doc.update({
+            "chunks": [{"file_id": file_id, "rows": artifacts["rows"], "created_at": created_at, "content_hash": content_hash}],
+            "columns": artifacts["columns"],
+            "profile": artifacts["profile"],
+            "rows": artifacts["rows"],
+        })
+        if artifacts.get("sample"):
+            doc["sample"] = artifacts["sample"]
+    else:
+        try:
+            # Profile the first chunk now so later appends only have to merge
+            df = await asyncio.to_thread(parse_csv, file_bytes)
+            profile = compute_profile(df)
+            doc.update({
+                "chunks": [{"file_id": file_id, "rows": len(df), "created_at": created_at, "content_hash": content_hash}],
+                "columns": schema_columns(df),
+                "profile": profile,
+                "rows": len(df),
+            })
+            await set_blob_artifacts(content_hash, columns=doc["columns"], profile=profile, rows=len(df))
+        except Exception as e:
+            # Keep accepting uploads pandas can't parse, as before; they are profiled on first append
+            print(f"Could not profile {filename}: {e}")
+    res = await get_db().datasets.insert_one(doc)
+    doc["_id"] = res.inserted_id
+    if df is not None and doc.get("rows", 0) >= settings.APPROX_MIN_ROWS:
+        try:
+            _, doc["sample"] = await store_sample(doc, df, content_hash)
+            await set_blob_artifacts(content_hash, sample=doc["sample"])
+        except Exception as e:
+            # Built on the first approximate question instead
+            print(f"Could not sample {filename}: {e}")
+    return doc
+
+def dataset_file_ids(dataset_doc) -> list:
+    """GridFS files holding the dataset's rows, oldest chunk first"""
+    chunks = dataset_doc.get("chunks")
+    if chunks:
+        return [chunk["file_id"] for chunk in chunks]
+    return [dataset_doc["file_id"]]
+
+def _project(df: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    return df if columns is None else df[[c for c in df.columns if c in columns]]
+
+async def load_file_to_df(file_id, columns: list = None, filters: list = None):
+    """
+    (DataFrame, bytes downloaded) of one dataset file, from shared memory, the disk
+    cache or GridFS, in that order; a download fills the caches.
+
+    columns limits the columns returned. The disk cache also skips the row groups
+    that can't match filters, the returned rows still need filtering.
+    """
+    if settings.DATASET_SHARED_MEMORY:
+        with span("shared_memory_attach") as attributes:
+            df = await asyncio.to_thread(shared_datasets.attach, file_id)
+            attributes["hit"] = df is not None
+        if df is not None:
+            return _project(df, columns), 0
+    df = None
+    size = 0
+    # Shared memory publishes whole files; otherwise read only what was asked for
+    partial = not settings.DATASET_SHARED_MEMORY
+    if settings.DATASET_DISK_CACHE_ENABLED:
+        with span("disk_cache_read", projected=partial and columns is not None) as attributes:
+            if partial:
+                df = await asyncio.to_thread(columnar_cache.read_entry, file_id, columns, filters)
+            else:
+                df = await asyncio.to_thread(columnar_cache.read_entry, file_id)
+            attributes["hit"] = df is not None
+        if df is not None and partial:
+            return df, 0
+    if df is None:
+        # The disk cache keeps whole files too
+        partial = partial and not settings.DATASET_DISK_CACHE_ENABLED
+        with span("gridfs_download") as attributes:
+            df, size = await read_csv_from_gridfs(file_id, columns if partial else None)
+            attributes["bytes"] = size
+        if settings.DATASET_DISK_CACHE_ENABLED:
+            try:
+                with span("disk_cache_write"):
+                    await asyncio.to_thread(columnar_cache.spill, file_id, df)
+            except Exception as e:
+                print(f"Could not cache {file_id} on disk: {e}")
+    if settings.DATASET_SHARED_MEMORY:
+        try:
+            with span("shared_memory_publish"):
+                if await asyncio.to_thread(shared_datasets.publish, file_id, df):
+                    # Use the shared copy from now on so this worker doesn't hold a second one
+                    df = await asyncio.to_thread(shared_datasets.attach, file_id)
+        except Exception as e:
+            print(f"Could not publish {file_id} to shared memory: {e}")
+    return _project(df, columns), size
+
+async def load_dataset_to_df(dataset_doc, columns: list = None, filters: list = None):
+    """
+    The dataset's rows. columns (the columns a chart or plan needs) and filters
+    ([column, op, number], all must hold) let the loaders skip the rest; the
+    result only has the rows matching filters.
+
+    Concurrent loads of the same version, columns and filters share one load and
+    return the same DataFrame (copy-on-write, so callers can't change each other's).
+    """
+    key = ("dataset", str(dataset_doc["_id"]), dataset_doc.get("version", 1),
+           None if columns is None else tuple(columns), tuple(map(tuple, filters or [])))
+    return await single_flight(key, lambda: _load_dataset_to_df(dataset_doc, columns, filters))
+
+async def _load_dataset_to_df(dataset_doc, columns: list = None, filters: list = None):
+    started = time.perf_counter()
+    frames = []
+    total_bytes = 0
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys([*columns, *(col for col, _, _ in filters or [])]))
+    for file_id in dataset_file_ids(dataset_doc):
+        df, size = await load_file_to_df(file_id, read_columns, filters)
+        total_bytes += size
+        frames.append(_project(apply_filters(df, filters), columns))
+    # Appended chunks are aligned on column names, in the first chunk's column order
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    metrics.dataset_load_duration.observe(time.perf_counter() - started)
+    if total_bytes:
+        metrics.dataset_load_bytes.observe(total_bytes)
+    metrics.dataset_memory_bytes.observe(df.memory_usage(deep=False).sum())
+    metrics.dataset_rows.observe(len(df))
+    return df
+
+async def append_to_dataset(dataset_doc, file_bytes: bytes, filename: str, content_hash: str = None):
+    """
+    Add the rows of a CSV to an existing dataset as a new GridFS chunk. The stored
+    profile is updated by merging the chunk's profile, never by rescanning old chunks.
+    Raises ValueError when the chunk's columns don't match the dataset's.
+    """
+    df = await asyncio.to_thread(parse_csv, file_bytes)
+    profile = dataset_doc.get("profile")
+    columns = dataset_doc.get("columns")
+    if not profile or not columns:
+        # Dataset saved before profiles existed: profile its current rows once
+        existing = await load_dataset_to_df(dataset_doc)
+        profile = compute_profile(existing)
+        columns = schema_columns(existing)
+    check_schema_compatible(columns, df)
+    profile = merge_profiles(profile, compute_profile(df))
+    columns = [{"name": c["name"], "dtype": profile["columns"][c["name"]]["dtype"]} for c in columns]
+
+    chunks = dataset_doc.get("chunks") or [
+        {"file_id": dataset_doc["file_id"], "rows": profile["rows"] - len(df), "created_at": dataset_doc.get("created_at")}
+    ]
+    content_hash = content_hash or content_hash_of(file_bytes)
+    metadata = {"owner_id": dataset_doc.get("owner_id"), "filename": filename, "dataset_id": dataset_doc["_id"], "chunk": len(chunks)}
+    blob, _ = await acquire_blob(content_hash, file_bytes, filename, metadata)
+    file_id = blob["file_id"]
+    now = pd.Timestamp.utcnow().to_pydatetime()
+    update = {
+        "chunks": chunks + [{"file_id": file_id, "rows": len(df), "created_at": now, "content_hash": content_hash}],
+        "columns": columns,
+        "profile": profile,
+        "rows": profile["rows"],
+        "version": dataset_doc.get("version", 1) + 1,
+        "updated_at": now,
+    }
+    # Only apply on top of the version that was profiled; a missing version matches None
+    res = await get_db().datasets.update_one(
+        {"_id": dataset_doc["_id"], "version": dataset_doc.get("version")},
+        {"$set": update},
+    )
+    if res.matched_count == 0:
+        await release_blob(content_hash)
+        raise AppendConflictError("Dataset was modified by a concurrent append, please retry")
+    await merge_chunk_into_rollups(dataset_doc["_id"], dataset_doc.get("version", 1), update["version"], df)
+    return {**dataset_doc, **update}
+
+async def get_user_datasets(user_id: str, projection: dict = None, limit: int = None, after_id: ObjectId = None):
+    """
+    Newest-first page of a user's datasets, served by the (owner_id, created_at, _id) index.
+    after_id is the last _id of the previous page; the next page starts right after it.
+    """
+    db = get_db()
+    query = {"owner_id": user_id}
+    if after_id is not None:
+        anchor = await db.datasets.find_one({"_id": after_id, "owner_id": user_id}, {"created_at": 1})
+        if not anchor:
+            return []
+        query["$or"] = [
+            {"created_at": {"$lt": anchor["created_at"]}},
+            {"created_at": anchor["created_at"], "_id": {"$lt": after_id}},
+        ]
+    cursor = db.datasets.find(query, projection).sort([("created_at", DESCENDING), ("_id", DESCENDING)])
+    if limit:
+        cursor = cursor.limit(limit)
     return [doc async for doc in cursor]
+
+async def count_user_datasets(user_id: str):
+    return await get_db().datasets.count_documents({"owner_id": user_id})
@@ -0,0 +1,160 @@
+import re
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from ..config import settings
+from ..utils.metrics import register_collector
+from ..utils.tracing import span
+
+# Joins between the dataset being analyzed and the other datasets of the request,
+# exposed to the agent as the join tool. Filters and column selections are applied
+# to each side before joining. Keys are factorized per side and only the distinct
+# values are matched across sides (strings trimmed and case-insensitive), giving
+# shared integer codes. A unique build side is then probed with a hash index
+# (Index.get_indexer); other cardinalities use a merge on the codes. Results are
+# cached per (left lineage, right dataset version, join spec), up to
+# JOIN_CACHE_MAX_BYTES of results.
+
+JOIN_HOWS = ("inner", "left")
+
+_cache = OrderedDict()  # (lineage, spec) -> (joined, bytes), least recently used first
+cache_stats = {"hits": 0, "misses": 0}
+register_collector(
+    "join_cache_requests_total", "Join result cache lookups by result", "counter", ("result",),
+    lambda: [(("hit",), cache_stats["hits"]), (("miss",), cache_stats["misses"])])
+
+def _put(key, joined: pd.DataFrame):
+    size = int(joined.memory_usage(index=True, deep=True).sum())
+    if size > settings.JOIN_CACHE_MAX_BYTES:
+        # Would evict everything else and not fit anyway
+        return
+    _cache[key] = (joined, size)
+    while sum(cached for _, cached in _cache.values()) > settings.JOIN_CACHE_MAX_BYTES:
+        _cache.popitem(last=False)
+
+def dataset_alias(filename: str) -> str:
+    stem = re.sub(r"\.csv$", "", filename or "dataset", flags=re.IGNORECASE)
+    return re.sub(r"\W+", "_", stem).strip("_").lower() or "dataset"
+
+def _normalized_key(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_string_dtype(series.dtype):
+        return series.astype("str").str.strip().str.casefold()
+    return series
+
+def _remap(codes: np.ndarray, mapping: np.ndarray) -> np.ndarray:
+    out = np.full(len(codes), -1, dtype=np.int64)
+    present = codes >= 0
+    out[present] = mapping[codes[present]]
+    return out
+
+def _column_codes(left: pd.Series, right: pd.Series):
+    """Shared codes of one key column; only the distinct values of each side are normalized and hashed together"""
+    left_codes, left_uniques = pd.factorize(left)
+    right_codes, right_uniques = pd.factorize(right)
+    uniques = pd.concat([_normalized_key(pd.Series(left_uniques)), _normalized_key(pd.Series(right_uniques))], ignore_index=True)
+    shared, distinct = pd.factorize(uniques)
+    return _remap(left_codes, shared[:len(left_uniques)]), _remap(right_codes, shared[len(left_uniques):]), len(distinct)
+
+def key_codes(left: pd.DataFrame, right: pd.DataFrame, left_on: list, right_on: list):
+    """int64 codes of the join keys, equal across both sides for equal keys; -1 for a null key"""
+    codes = np.zeros(len(left) + len(right), dtype=np.int64)
+    null = np.zeros(len(codes), dtype=bool)
+    for left_col, right_col in zip(left_on, right_on):
+        left_codes, right_codes, distinct = _column_codes(left[left_col], right[right_col])
+        column_codes = np.concatenate([left_codes, right_codes])
+        null |= column_codes < 0
+        # One code per distinct combination of the key columns so far, renumbered to stay small
+        codes = pd.factorize(codes * (distinct + 1) + column_codes + 1)[0].astype(np.int64)
+    codes[null] = -1
+    return codes[:len(left)], codes[len(left):]
+
+def hash_join(left: pd.DataFrame, right: pd.DataFrame, left_on: list, right_on: list, how: str = "inner", suffix: str = "_right") -> pd.DataFrame:
+    if how not in JOIN_HOWS:
+        raise ValueError(f"Unsupported join '{how}', use one of {', '.join(JOIN_HOWS)}")
+    left_codes, right_codes = key_codes(left, right, left_on, right_on)
+    # The right keys equal the left ones; other clashing names get the suffix
+    payload = right.drop(columns=right_on)
+    payload = payload.rename(columns={c: f"{c}{suffix}" for c in payload.columns if c in left.columns})
+    right_rows = np.flatnonzero(right_codes >= 0)
+    build = pd.Index(right_codes[right_rows])
+    if build.is_unique:
+        # Lookup table join: each left row matches at most one right row, found through the hash index
+        found = build.get_indexer(left_codes)
+        positions = np.full(len(left), -1, dtype=np.int64)
+        positions[found >= 0] = right_rows[found[found >= 0]]
+        if how == "inner":
+            left, positions = left[positions >= 0], positions[positions >= 0]
+        # take with allow_fill leaves unmatched left rows empty
+        right_part = pd.DataFrame({c: payload[c].array.take(positions, allow_fill=True) for c in payload.columns})
+        return pd.concat([left.reset_index(drop=True), right_part], axis=1)
+    estimate = _merge_size(left_codes, right_codes)
+    if estimate > settings.JOIN_MAX_ROWS:
+        raise ValueError(f"Join would produce about {estimate:,} rows, more than {settings.JOIN_MAX_ROWS:,}; filter first or join on more columns")
+    # Null keys never match
+    left_keyed = left.reset_index(drop=True).assign(_join_code=np.where(left_codes >= 0, left_codes, -2))
+    right_keyed = payload.reset_index(drop=True).assign(_join_code=np.where(right_codes >= 0, right_codes, -3))
+    return left_keyed.merge(right_keyed, on="_join_code", how=how, sort=False).drop(columns="_join_code")
+
+def _merge_size(left_codes: np.ndarray, right_codes: np.ndarray) -> int:
+    left_counts = pd.Series(left_codes[left_codes >= 0]).value_counts()
+    right_counts = pd.Series(right_codes[right_codes >= 0]).value_counts()
+    return int((left_counts * right_counts.reindex(left_counts.index, fill_value=0)).sum())
+
+class JoinContext:
+    """The other datasets of an analyze request and the lineage of the agent's working table"""
+
+    def __init__(self, dataset_doc, others: list):
+        self.lineage = (str(dataset_doc["_id"]), dataset_doc.get("version", 1))
+        self.datasets = {}
+        for doc, df in others:
+            alias = dataset_alias(doc.get("filename"))
+            while alias in self.datasets:
+                alias += "_2"
+            self.datasets[alias] = (doc, df)
+
+    def tool_description(self) -> str:
+        listed = "; ".join(f"{alias} ({', '.join(map(str, df.columns))})" for alias, (_, df) in self.datasets.items())
+        return (
+            "Join another dataset into the working table; later tools use the joined table. "
+            f"Datasets: {listed}. "
+            'Input: {"dataset": "targets", "on": {"Region": "region"}, "columns": ["target"], "filter": "year == 2024", "how": "left"} '
+            '("on" maps working-table columns to dataset columns; "columns", "filter" on the dataset and "how" inner/left are optional)'
+        )
+
+    def join(self, args: dict, left: pd.DataFrame) -> pd.DataFrame:
+        alias = str(args.get("dataset", "")).lower()
+        if alias not in self.datasets:
+            raise ValueError(f"Unknown dataset '{args.get('dataset')}', use one of {', '.join(self.datasets)}")
+        doc, right = self.datasets[alias]
+        on = args.get("on")
+        if isinstance(on, str):
+            on = {on: on}
+        if not on:
+            raise ValueError("Missing join columns in 'on'")
+        left_on, right_on = list(on.keys()), list(on.values())
+        missing = [c for c in left_on if c not in left.columns] + [c for c in right_on if c not in right.columns]
+        if missing:
+            raise ValueError(f"Unknown join columns: {', '.join(missing)}")
+        columns = args.get("columns") or [c for c in right.columns if c not in right_on]
+        how = args.get("how", "inner")
+        spec = (alias, str(doc["_id"]), doc.get("version", 1), tuple(left_on), tuple(right_on), tuple(columns),
+                args.get("filter"), args.get("left_filter"), how)
+        key = (self.lineage, spec)
+        entry = _cache.get(key)
+        if entry is not None:
+            cache_stats["hits"] += 1
+            _cache.move_to_end(key)
+            joined = entry[0]
+        else:
+            cache_stats["misses"] += 1
+            with span("join", dataset=alias, how=how):
+                # Filters and projections below the join
+                if args.get("left_filter"):
+                    left = left.query(args["left_filter"])
+                if args.get("filter"):
+                    right = right.query(args["filter"])
+                right = right[list(dict.fromkeys(right_on + list(columns)))]
+                joined = hash_join(left, right, left_on, right_on, how, suffix=f"_{alias}")
+            _put(key, joined)
+        self.lineage = key
+        return joined
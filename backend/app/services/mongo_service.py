@@ -1,42 +1,204 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from ..config import settings
-from ..deps import get_mongo_client
+from ..deps import get_db
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 import aiofiles
+import asyncio
+import time
+import gzip
+import zlib
 import io
 
-def get_db():
-    return get_mongo_client().ai_data_analyst
+# Indexes backing get_user_datasets (owner filter + newest-first sort, _id as the
+# cursor tie-breaker) and file lookups
+DATASET_INDEXES = [
+    IndexModel([("owner_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("file_id", ASCENDING)]),
+]
+
+# GridFS only creates its own indexes on the first write into an empty bucket,
+# so make sure they exist up front as well
+GRIDFS_FILES_INDEXES = [
+    IndexModel([("filename", ASCENDING), ("uploadDate", ASCENDING)]),
+    IndexModel([("metadata.owner_id", ASCENDING)]),
+]
+GRIDFS_CHUNKS_INDEXES = [
+    IndexModel([("files_id", ASCENDING), ("n", ASCENDING)], unique=True),
+]
 
 def get_gridfs_bucket():
-    client: AsyncIOMotorClient = get_mongo_client()
-    db = client.ai_data_analyst
-    return AsyncIOMotorGridFSBucket(db)
+    return AsyncIOMotorGridFSBucket(get_db())
+
+# Expired LLM cache entries are removed by Mongo's TTL monitor
+LLM_CACHE_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+]
+
+# Cached chart answers expire through the TTL monitor as well
+CHART_CACHE_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+]
+
+ROLLUP_INDEXES = [
+    IndexModel([("dataset_id", ASCENDING), ("dimension", ASCENDING), ("measure", ASCENDING), ("grain", ASCENDING)], unique=True),
+]
+
+async def ensure_indexes():
+    db = get_db()
+    await db.datasets.create_indexes(DATASET_INDEXES)
+    await db["fs.files"].create_indexes(GRIDFS_FILES_INDEXES)
+    await db["fs.chunks"].create_indexes(GRIDFS_CHUNKS_INDEXES)
+    await db.rollups.create_indexes(ROLLUP_INDEXES)
+    if settings.CHART_CACHE_ENABLED:
+        await db.charts.create_indexes(CHART_CACHE_INDEXES)
+    if settings.LLM_CACHE_MONGO:
+        await db.llm_cache.create_indexes(LLM_CACHE_INDEXES)
+
+async def check_health():
+    """Ping Mongo and touch the datasets and GridFS collections, with latencies in ms"""
+    db = get_db()
+    health = {"status": "ok"}
+    checks = {
+        "mongo": lambda: db.command("ping"),
+        "datasets": lambda: db.datasets.find_one({}, {"_id": 1}),
+        "gridfs": lambda: db["fs.files"].find_one({}, {"_id": 1}),
+    }
+    for name, check in checks.items():
+        start = time.perf_counter()
+        try:
+            await check()
+            health[name] = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+        except Exception as e:
+            health[name] = {"ok": False, "error": str(e)}
+            health["status"] = "degraded"
+    health["pool"] = {
+        "max_pool_size": settings.MONGO_MAX_POOL_SIZE,
+        "min_pool_size": settings.MONGO_MIN_POOL_SIZE,
+        "wait_queue_timeout_ms": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
+    return health
+
+# Files are compressed on upload with the codec recorded in their GridFS metadata;
+# files without it were stored raw and are read as is.
+
+def compression_codec() -> str:
+    codec = settings.DATASET_COMPRESSION.lower()
+    if codec == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            return "gzip"
+    return codec
+
+def compress_bytes(data: bytes):
+    """(stored bytes, codec); raw bytes when compression doesn't make them smaller"""
+    codec = compression_codec()
+    level = settings.DATASET_COMPRESSION_LEVEL
+    if codec == "zstd":
+        import zstandard
+        compressed = zstandard.ZstdCompressor(level=level if level is not None else 3).compress(data)
+    elif codec == "gzip":
+        compressed = gzip.compress(data, compresslevel=level if level is not None else 6)
+    else:
+        return data, "none"
+    if len(compressed) >= len(data):
+        return data, "none"
+    return compressed, codec
+
+def decompressor(codec: str):
+    """Object whose decompress(chunk) returns the next decompressed bytes"""
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj()
+    if codec == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if codec not in (None, "none"):
+        raise ValueError(f"Unknown GridFS file compression '{codec}'")
+    return None
 
 async def upload_file_to_gridfs(file_bytes: bytes, filename: str, metadata: dict):
     bucket = get_gridfs_bucket()
-    stream = io.BytesIO(file_bytes)
+    stored, codec = await asyncio.to_thread(compress_bytes, file_bytes)
+    metadata = {**metadata, "compression": codec, "raw_size": len(file_bytes)}
+    stream = io.BytesIO(stored)
     file_id = await bucket.upload_from_stream(filename, stream, metadata=metadata)
     return file_id  # ObjectId
 
 async def download_file_from_gridfs(file_id):
+    """File contents, decompressed chunk by chunk as they arrive"""
     bucket = get_gridfs_bucket()
-    out = io.BytesIO()
-    await bucket.download_to_stream(file_id, out)
-    out.seek(0)
-    return out.read()
+    grid_out = await bucket.open_download_stream(file_id)
+    codec = (grid_out.metadata or {}).get("compression")
+    inflate = decompressor(codec)
+    out = bytearray()
+    while True:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        out += inflate.decompress(chunk) if inflate else chunk
+    if inflate:
+        out += inflate.flush()
+    return bytes(out)
+
+class GridFSReader(io.RawIOBase):
+    """
+    Blocking file object over a GridFS download, for parsers running in a worker
+    thread. Chunks are fetched on the event loop one ahead of the reader and
+    decompressed in the reader's thread, so parsing overlaps with the download.
+    """
+
+    def __init__(self, grid_out, loop):
+        super().__init__()
+        self._grid_out = grid_out
+        self._loop = loop
+        self._inflate = decompressor((grid_out.metadata or {}).get("compression"))
+        self._buffer = memoryview(b"")
+        self._eof = False
+        self._pending = self._fetch()
+        self.bytes_read = 0
+
+    def _fetch(self):
+        return asyncio.run_coroutine_threadsafe(self._grid_out.readchunk(), self._loop)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            chunk = self._pending.result()
+            if not chunk:
+                self._eof = True
+                self._buffer = memoryview(self._inflate.flush() if self._inflate else b"")
+                break
+            self._pending = self._fetch()
+            self._buffer = memoryview(self._inflate.decompress(chunk) if self._inflate else chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        self.bytes_read += n
+        return n
+
+    def close(self):
+        if not self._eof:
+            self._pending.cancel()
+        super().close()
+
+async def open_gridfs_reader(file_id) -> GridFSReader:
+    grid_out = await get_gridfs_bucket().open_download_stream(file_id)
+    return GridFSReader(grid_out, asyncio.get_running_loop())
 
 class MongoService:
     def __init__(self, mongo_client: AsyncIOMotorClient):
         self.client = mongo_client
 
     async def get_user_by_id(self, user_id: str):
-        db = self.client.ai_data_analyst
+        db = self.client[settings.MONGO_DB_NAME]
         user = await db.users.find_one({"_id": ObjectId(user_id)})
         return user
 
     async def update_user(self, user_id: str, update_data: dict):
-        db = self.client.ai_data_analyst
+        db = self.client[settings.MONGO_DB_NAME]
         result = await db.users.update_one(
             {"_id": ObjectId(user_id)},
             {"$set": update_data}
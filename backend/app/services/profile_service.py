@@ -0,0 +1,106 @@
+import math
+import pandas as pd
+
+# Per-column dataset profile made only of mergeable aggregates (counts, sums, sums of
+# squares, min, max), so appending a chunk merges the chunk's profile into the stored
+# one instead of rescanning the whole history.
+
+def compute_profile(df: pd.DataFrame) -> dict:
+    profile = {"rows": len(df), "columns": {}}
+    for col in df.columns:
+        series = df[col]
+        stats = {
+            "dtype": str(series.dtype),
+            "count": int(series.count()),
+            "nulls": int(series.isna().sum()),
+        }
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            values = series.dropna().astype("float64")
+            stats.update({
+                "sum": float(values.sum()),
+                "sumsq": float((values * values).sum()),
+                "min": float(values.min()) if len(values) else None,
+                "max": float(values.max()) if len(values) else None,
+            })
+        profile["columns"][str(col)] = stats
+    return profile
+
+def _merge_extreme(a, b, pick):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return pick(a, b)
+
+def merge_dtypes(a: str, b: str) -> str:
+    if a == b:
+        return a
+    if is_numeric_dtype_name(a) and is_numeric_dtype_name(b):
+        return "float64"
+    return "object"
+
+def is_numeric_dtype_name(dtype: str) -> bool:
+    return dtype.startswith(("int", "uint", "float"))
+
+def merge_profiles(base: dict, delta: dict) -> dict:
+    """Profile of the concatenation of the two profiled tables"""
+    merged = {"rows": base["rows"] + delta["rows"], "columns": {}}
+    for col, stats in base["columns"].items():
+        other = delta["columns"].get(col)
+        if other is None:
+            merged["columns"][col] = dict(stats)
+            continue
+        dtype = merge_dtypes(stats["dtype"], other["dtype"])
+        combined = {
+            "dtype": dtype,
+            "count": stats["count"] + other["count"],
+            "nulls": stats["nulls"] + other["nulls"],
+        }
+        if is_numeric_dtype_name(dtype):
+            combined.update({
+                "sum": stats.get("sum", 0.0) + other.get("sum", 0.0),
+                "sumsq": stats.get("sumsq", 0.0) + other.get("sumsq", 0.0),
+                "min": _merge_extreme(stats.get("min"), other.get("min"), min),
+                "max": _merge_extreme(stats.get("max"), other.get("max"), max),
+            })
+        merged["columns"][col] = combined
+    return merged
+
+def summarize_profile(profile: dict) -> dict:
+    """Profile with mean and standard deviation derived from the stored sums"""
+    summary = {"rows": profile["rows"], "columns": {}}
+    for col, stats in profile["columns"].items():
+        out = {k: v for k, v in stats.items() if k not in ("sum", "sumsq")}
+        n = stats["count"]
+        if "sum" in stats and n:
+            mean = stats["sum"] / n
+            out["sum"] = stats["sum"]
+            out["mean"] = mean
+            # Sample variance from sums; clamp the rounding error of nearly constant columns
+            out["std"] = math.sqrt(max(stats["sumsq"] - n * mean * mean, 0.0) / (n - 1)) if n > 1 else None
+        summary["columns"][col] = out
+    return summary
+
+def check_schema_compatible(columns: list, df: pd.DataFrame):
+    """
+    Raise ValueError unless df has exactly the dataset's columns and every column
+    that is numeric in the dataset is still numeric (or empty) in df.
+    """
+    expected = [c["name"] for c in columns]
+    incoming = [str(c) for c in df.columns]
+    missing = [c for c in expected if c not in incoming]
+    extra = [c for c in incoming if c not in expected]
+    if missing or extra:
+        details = []
+        if missing:
+            details.append(f"missing columns: {', '.join(missing)}")
+        if extra:
+            details.append(f"unexpected columns: {', '.join(extra)}")
+        raise ValueError(f"Schema mismatch ({'; '.join(details)})")
+    for column in columns:
+        series = df[column["name"]]
+        if is_numeric_dtype_name(column["dtype"]) and series.notna().any() and not pd.api.types.is_numeric_dtype(series):
+            raise ValueError(f"Column '{column['name']}' is {column['dtype']} in the dataset but {series.dtype} in the appended rows")
+
+def schema_columns(df: pd.DataFrame) -> list:
+    return [{"name": str(col), "dtype": str(dtype)} for col, dtype in df.dtypes.items()]
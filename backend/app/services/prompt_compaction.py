@@ -0,0 +1,79 @@
+import math
+import re
+from typing import List, Tuple
+import pandas as pd
+
+# Compact schema rendering for the agent prompt. Wide datasets would otherwise put
+# every column name into each ReAct step; instead the columns most relevant to the
+# question are listed with abbreviated dtypes and the rest stay behind dataset_info.
+
+DTYPE_LEGEND = "i=int, f=float, s=text, b=bool, dt=date, c=category"
+
+def abbreviate_dtype(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "b"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "i"
+    if pd.api.types.is_float_dtype(dtype):
+        return "f"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "dt"
+    if isinstance(dtype, pd.CategoricalDtype):
+        return "c"
+    return "s"
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting"""
+    return math.ceil(len(text) / 4)
+
+def _words(text: str) -> List[str]:
+    # Split snake_case, kebab-case and camelCase names into lowercase words
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    # Crude singularization so "states" matches "State"
+    return [w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words]
+
+def rank_columns(question: str, columns: List[str]) -> List[str]:
+    """Order columns by how strongly the question refers to them, keeping dataset order on ties"""
+    question_lower = question.lower()
+    question_words = set(_words(question))
+    scored = []
+    for index, column in enumerate(columns):
+        column_words = _words(column)
+        score = 0
+        if str(column).lower() in question_lower:
+            score += 10
+        for word in column_words:
+            if word in question_words:
+                score += 3
+            elif len(word) >= 4 and any(q.startswith(word[:4]) for q in question_words):
+                score += 1
+        scored.append((-score, index, column))
+    return [column for _, _, column in sorted(scored)]
+
+def compact_schema(df: pd.DataFrame, question: str, token_budget: int) -> Tuple[str, int]:
+    """
+    Render "name:type" entries for as many columns as fit in token_budget, most relevant first.
+    Returns (schema_text, hidden_column_count).
+    """
+    columns = list(df.columns)
+    dtypes = df.dtypes
+    entries = {column: f"{column}:{abbreviate_dtype(dtypes[column])}" for column in columns}
+
+    full = ", ".join(entries[column] for column in columns)
+    if estimate_tokens(full) <= token_budget:
+        return full, 0
+
+    shown = []
+    used = 0
+    for column in rank_columns(question, columns):
+        cost = estimate_tokens(entries[column] + ", ")
+        if used + cost > token_budget and shown:
+            break
+        shown.append(entries[column])
+        used += cost
+    hidden = len(columns) - len(shown)
+    schema = ", ".join(shown)
+    if hidden:
+        schema += f" (+{hidden} more columns, use dataset_info to find them)"
+    return schema, hidden
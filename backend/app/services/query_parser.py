@@ -1,12 +1,48 @@
 import re
 from typing import Dict, Any, Optional
 
+AGG_PATTERNS = {
+    "mean": [r"\baverage\b", r"\bavg\b", r"\bmean\b"],
+    "count": [r"\bnumber of\b", r"\bcount of\b", r"\bhow many\b"],
+    "sum": [r"\btotal\b", r"\bsum of\b"],
+    "max": [r"\bhighest single\b", r"\bmaximum\b"],
+    "min": [r"\blowest single\b", r"\bminimum\b"],
+}
+
+# Comparison words of simple numeric filters ("where profit > 100", "with sales over 500")
+FILTER_OPS = {
+    ">=": ">=", "<=": "<=", "==": "==", ">": ">", "<": "<", "=": "==",
+    "greater than": ">", "more than": ">", "above": ">", "over": ">", "at least": ">=",
+    "less than": "<", "below": "<", "under": "<", "at most": "<=",
+}
+
+# "over 2 years" is a time span, not a filter; also keeps "25 years" from matching as "2"
+TIME_UNITS = r"(?:days?|weeks?|months?|quarters?|years?)"
+NOT_A_SPAN = rf"(?!\d|\.\d|\s*{TIME_UNITS}\b)"
+
+def parse_filters(question_lower: str, available_columns: list):
+    """([column, op, number] filters, question with the filter phrases removed)"""
+    ops = "|".join(re.escape(op) for op in sorted(FILTER_OPS, key=len, reverse=True))
+    filters = []
+    for col in sorted(available_columns, key=len, reverse=True):
+        name = re.escape(col.lower()).replace("_", "[ _]")
+        pattern = rf"(?:\b(?:where|with|when|and)\s+)?\b{name}\s+(?:is\s+|of\s+)?({ops})\s*(-?\d+(?:\.\d+)?){NOT_A_SPAN}"
+        for match in re.finditer(pattern, question_lower):
+            filters.append([col, FILTER_OPS[match.group(1)], float(match.group(2))])
+        question_lower = re.sub(pattern, " ", question_lower)
+    return filters, question_lower
+
+def describe_filters(filters: list) -> str:
+    return " and ".join(f"{col} {op} {int(value) if value.is_integer() else value}" for col, op, value in filters)
+
 def parse_chart_query(question: str, available_columns: list) -> Optional[Dict[str, Any]]:
     """
     Parse chart queries to extract chart parameters directly.
     This bypasses the AI agent for common patterns.
     """
     question_lower = question.lower().strip()
+    # Filter phrases name columns too, keep them out of the x/y detection below
+    filters, question_lower = parse_filters(question_lower, available_columns)
     
     # Default values
     result = {
@@ -14,7 +50,10 @@ def parse_chart_query(question: str, available_columns: list) -> Optional[Dict[s
         "x_col": None,
         "y_col": None,
         "n": 7,
-        "title": None
+        "title": None,
+        "agg": None,
+        "grain": None,
+        "filters": filters
     }
     
     # Extract chart type
@@ -93,6 +132,21 @@ def parse_chart_query(question: str, available_columns: list) -> Optional[Dict[s
             if result["x_col"]:
                 break
     
+    # "sales by month", "monthly profit": chart the date column bucketed by month
+    if re.search(r"\bmonth(ly|s)?\b", question_lower) and (not result["x_col"] or "date" in result["x_col"].lower()):
+        date_col = result["x_col"] or next((col for col in available_columns if "date" in col.lower()), None)
+        if date_col:
+            result["x_col"] = date_col
+            result["grain"] = "month"
+            if result["chart_type"] == "bar" and not re.search(r"\bbar\b", question_lower):
+                result["chart_type"] = "line"
+    
+    # Aggregate named in the question; without one, repeated categories are summed
+    for agg, patterns in AGG_PATTERNS.items():
+        if any(re.search(pattern, question_lower) for pattern in patterns):
+            result["agg"] = agg
+            break
+    
     # Generate title if not provided
     if not result["title"]:
         if result["chart_type"] == "pie":
@@ -108,7 +162,10 @@ def parse_chart_query(question: str, available_columns: list) -> Optional[Dict[s
                     x_display = x_col_name + 's' if not x_col_name.endswith('s') else x_col_name
                 result["title"] = f"Top {result['n']} {x_display} by {result['y_col'] or 'Value'}"
             else:
-                result["title"] = f"{result['y_col'] or 'Value'} by {result['x_col'] or 'Category'}"
+                result["title"] = f"{result['y_col'] or 'Value'} by {'Month' if result['grain'] else result['x_col'] or 'Category'}"
+    
+    if filters:
+        result["title"] += " where " + describe_filters(filters)
     
     # Validate that we have essential columns
     if not result["x_col"] or not result["y_col"]:
@@ -116,6 +173,46 @@ def parse_chart_query(question: str, available_columns: list) -> Optional[Dict[s
     
     return result
 
+def parse_direct_chart(question: str, available_columns: list) -> Optional[Dict[str, Any]]:
+    """Chart parameters when the question is answered by direct parsing, else None"""
+    if not should_use_direct_parsing(question):
+        return None
+    return parse_chart_query(question, available_columns)
+
+def chart_columns(parsed_params: dict) -> list:
+    """Columns a parsed chart reads, filters included"""
+    filter_cols = [col for col, _, _ in parsed_params.get("filters") or []]
+    return list(dict.fromkeys([parsed_params["x_col"], parsed_params["y_col"], *filter_cols]))
+
+# Questions about the dataset itself rather than its values
+NON_CHART_PATTERNS = [
+    r"what are the columns",
+    r"what columns",
+    r"list the columns",
+    r"show me the columns",
+    r"describe the dataset",
+    r"what is in the dataset",
+    r"how many columns",
+    r"column names",
+    r"schema",
+    r"structure"
+]
+
+CHART_WORDS = ["chart", "graph", "plot", "visualize", "visualise"]
+
+def classify_query(question: str) -> str:
+    """
+    Coarse query class used to pick an LLM per class (LLM_QUERY_CLASS_MODELS):
+    "schema" for questions about the dataset structure, "chart" for visualization
+    requests and "stats" for everything else.
+    """
+    question_lower = question.lower().strip()
+    if any(re.search(pattern, question_lower) for pattern in NON_CHART_PATTERNS):
+        return "schema"
+    if any(word in question_lower for word in CHART_WORDS):
+        return "chart"
+    return "stats"
+
 def should_use_direct_parsing(question: str) -> bool:
     """
     Determine if we should use direct parsing instead of AI agent.
@@ -123,22 +220,8 @@ def should_use_direct_parsing(question: str) -> bool:
     """
     question_lower = question.lower().strip()
     
-    # Exclude non-chart queries
-    non_chart_patterns = [
-        r"what are the columns",
-        r"what columns",
-        r"list the columns",
-        r"show me the columns",
-        r"describe the dataset",
-        r"what is in the dataset",
-        r"how many columns",
-        r"column names",
-        r"schema",
-        r"structure"
-    ]
-    
     # If it's a non-chart query, don't use direct parsing
-    if any(re.search(pattern, question_lower) for pattern in non_chart_patterns):
+    if any(re.search(pattern, question_lower) for pattern in NON_CHART_PATTERNS):
         return False
     
     # Patterns that are good candidates for direct parsing
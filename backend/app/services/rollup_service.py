@@ -0,0 +1,149 @@
+import asyncio
+import pandas as pd
+from pymongo import ReturnDocument
+from ..config import settings
+from ..deps import get_db
+from ..utils import metrics
+from .query_parser import parse_chart_query, should_use_direct_parsing
+from .tools import CHART_AGGS, default_agg, group_keys
+
+# Materialized group-by rollups for frequently charted (dimension, measure) pairs.
+# Every direct-parsed chart request is counted per dataset in the `rollups`
+# collection; once a pair reaches ROLLUP_MIN_REQUESTS the partial aggregates (sum,
+# count, min, max per group) are stored, from which any of CHART_AGGS is derived.
+# Later charts of that pair are answered from the rollup without loading the
+# dataset, and appends merge the new chunk's partials instead of recomputing.
+
+PARTIALS = ("sum", "count", "min", "max")
+
+def rollup_key(dataset_id, dimension: str, measure: str, grain: str = None) -> dict:
+    return {"dataset_id": dataset_id, "dimension": dimension, "measure": measure, "grain": grain}
+
+def build_rollup(df: pd.DataFrame, dimension: str, measure: str, grain: str = None) -> list:
+    """Partial aggregates of measure per dimension value, as BSON-ready rows"""
+    keys = group_keys(df, dimension, grain).rename("key")
+    grouped = df[measure].groupby(keys).agg(list(PARTIALS)).reset_index()
+    grouped["key"] = grouped["key"].map(lambda v: v.item() if hasattr(v, "item") else v)
+    return [
+        {"key": row["key"], "sum": float(row["sum"]), "count": int(row["count"]),
+         "min": None if pd.isna(row["min"]) else float(row["min"]),
+         "max": None if pd.isna(row["max"]) else float(row["max"])}
+        for row in grouped.to_dict(orient="records")
+    ]
+
+def merge_rollups(base: list, delta: list) -> list:
+    merged = {row["key"]: dict(row) for row in base}
+    for row in delta:
+        current = merged.get(row["key"])
+        if current is None:
+            merged[row["key"]] = dict(row)
+            continue
+        current["sum"] += row["sum"]
+        current["count"] += row["count"]
+        for field, pick in (("min", min), ("max", max)):
+            values = [v for v in (current[field], row[field]) if v is not None]
+            current[field] = pick(values) if values else None
+    return list(merged.values())
+
+def rollup_to_frame(groups: list, dimension: str, measure: str, agg: str) -> pd.DataFrame:
+    """Aggregated table with the same columns the chart functions expect"""
+    frame = pd.DataFrame(groups, columns=["key", *PARTIALS])
+    if agg == "mean":
+        values = frame["sum"] / frame["count"].where(frame["count"] > 0)
+    else:
+        values = frame[agg]
+    return pd.DataFrame({dimension: frame["key"], measure: values})
+
+async def record_chart_request(dataset_doc, parsed_params: dict, agg: str, df: pd.DataFrame = None):
+    """Count a chart request; materialize the rollup once the pair is popular and df is at hand"""
+    key = rollup_key(dataset_doc["_id"], parsed_params["x_col"], parsed_params["y_col"], parsed_params.get("grain"))
+    doc = await get_db().rollups.find_one_and_update(
+        key,
+        {"$inc": {"requests": 1, f"aggs.{agg}": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    version = dataset_doc.get("version", 1)
+    if df is None or doc["requests"] < settings.ROLLUP_MIN_REQUESTS:
+        return
+    if doc.get("groups") is not None and doc.get("version") == version:
+        return
+    if doc.get("too_many_groups_at") == version:
+        return
+    groups = await asyncio.to_thread(build_rollup, df, key["dimension"], key["measure"], key["grain"])
+    if len(groups) > settings.ROLLUP_MAX_GROUPS:
+        # Not worth storing, the rollup would be about as big as the dataset
+        await get_db().rollups.update_one(key, {"$set": {"too_many_groups_at": version}})
+        return
+    await get_db().rollups.update_one(key, {"$set": {"groups": groups, "version": version}})
+    print(f"Materialized rollup {key['measure']} by {key['dimension']}{' per ' + key['grain'] if key['grain'] else ''}: {len(groups)} groups")
+
+async def find_rollup(dataset_doc, dimension: str, measure: str, grain: str = None):
+    doc = await get_db().rollups.find_one(rollup_key(dataset_doc["_id"], dimension, measure, grain))
+    if doc and doc.get("groups") is not None and doc.get("version") == dataset_doc.get("version", 1):
+        return doc
+    return None
+
+def parse_rollup_question(dataset_doc, question: str):
+    """Chart parameters for a direct-parsed chart question, from the stored schema"""
+    if not settings.ROLLUPS_ENABLED or not dataset_doc.get("columns") or not should_use_direct_parsing(question):
+        return None
+    parsed = parse_chart_query(question, [c["name"] for c in dataset_doc["columns"]])
+    if not parsed or (parsed.get("agg") and parsed["agg"] not in CHART_AGGS):
+        return None
+    if parsed.get("filters"):
+        # Rollups aggregate every row
+        return None
+    return parsed
+
+async def answer_from_rollup(dataset_doc, question: str):
+    """Chart answer from a materialized rollup, or None to load the dataset as usual"""
+    parsed = parse_rollup_question(dataset_doc, question)
+    if not parsed:
+        return None
+    doc = await find_rollup(dataset_doc, parsed["x_col"], parsed["y_col"], parsed.get("grain"))
+    if doc is None:
+        metrics.rollup_lookups.inc(result="miss")
+        return None
+    metrics.rollup_lookups.inc(result="hit")
+    # Rollups are only recorded for aggregated charts, so a plain "X by Y" means the default sum
+    agg = parsed.get("agg") or "sum"
+    await record_chart_request(dataset_doc, parsed, agg)
+    frame = rollup_to_frame(doc["groups"], parsed["x_col"], parsed["y_col"], agg)
+    from .agent_service import direct_chart_response
+    return direct_chart_response(
+        frame,
+        {**parsed, "agg": None, "grain": None},
+        reasoning="Answered from a precomputed rollup of this dataset.",
+        aggregated=agg,
+    )
+
+async def note_chart_request(dataset_doc, question: str, df: pd.DataFrame):
+    """Track a direct-parsed chart answered from the full dataset; never fails the request"""
+    try:
+        parsed = parse_rollup_question(dataset_doc, question)
+        if not parsed or parsed["x_col"] not in df.columns or parsed["y_col"] not in df.columns:
+            return
+        agg = default_agg(df, parsed["x_col"], parsed.get("agg"), parsed.get("grain"))
+        if agg is None:
+            # One row per category, charted as is
+            return
+        await record_chart_request(dataset_doc, parsed, agg, df)
+    except Exception as e:
+        print(f"Rollup tracking failed: {e}")
+
+async def merge_chunk_into_rollups(dataset_id, old_version: int, new_version: int, chunk_df: pd.DataFrame):
+    """Bring the dataset's up-to-date rollups forward to the appended version"""
+    db = get_db()
+    cursor = db.rollups.find({"dataset_id": dataset_id, "groups": {"$ne": None}, "version": old_version})
+    async for doc in cursor:
+        try:
+            delta = await asyncio.to_thread(build_rollup, chunk_df, doc["dimension"], doc["measure"], doc.get("grain"))
+            groups = merge_rollups(doc["groups"], delta)
+            update = {"$set": {"groups": groups, "version": new_version}}
+            if len(groups) > settings.ROLLUP_MAX_GROUPS:
+                update = {"$set": {"version": None, "too_many_groups_at": new_version}, "$unset": {"groups": ""}}
+            await db.rollups.update_one({"_id": doc["_id"], "version": old_version}, update)
+        except Exception as e:
+            # A stale rollup is never served (version mismatch), it is rebuilt on demand
+            print(f"Could not merge appended rows into rollup {doc['_id']}: {e}")
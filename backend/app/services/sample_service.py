@@ -0,0 +1,320 @@
+import asyncio
+import math
+import numpy as np
+import pandas as pd
+from ..config import settings
+from ..deps import get_db
+from ..utils.tracing import span
+from .mongo_service import upload_file_to_gridfs, get_gridfs_bucket
+from .tools import CHART_AGGS, PandasTool, group_keys
+from .admission import single_flight
+
+# Approximate query mode. Each large dataset keeps a persisted stratified sample
+# (proportional allocation over its best categorical column, with a floor per
+# stratum) and ApproximatePandasTool answers from it with design-based estimators:
+# stratified totals/means with finite population correction, domain estimates for
+# group_agg, and a weighted correlation with a delete-a-group jackknife interval.
+# Intervals are 95%.
+
+Z_95 = 1.96
+
+def choose_strata_column(df: pd.DataFrame):
+    """Categorical column with the most distinct values up to APPROX_MAX_STRATA"""
+    best, best_count = None, 1
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+            continue
+        count = df[col].nunique(dropna=False)
+        if best_count < count <= settings.APPROX_MAX_STRATA:
+            best, best_count = col, count
+    return best
+
+def build_stratified_sample(df: pd.DataFrame, sample_rows: int, seed: int = 0):
+    """(sample DataFrame, design) with proportional allocation and at least APPROX_MIN_PER_STRATUM rows per stratum"""
+    rng = np.random.default_rng(seed)
+    strata_col = choose_strata_column(df)
+    keys = df[strata_col].astype(str) if strata_col else pd.Series("all", index=df.index)
+    population = len(df)
+    chosen = []
+    strata = []
+    for value, positions in keys.groupby(keys, sort=True).indices.items():
+        size = len(positions)
+        take = min(size, max(settings.APPROX_MIN_PER_STRATUM, round(sample_rows * size / population)))
+        chosen.append(rng.choice(positions, size=take, replace=False))
+        strata.append({"value": str(value), "population": int(size), "sampled": int(take)})
+    positions = np.sort(np.concatenate(chosen)) if chosen else np.array([], dtype=int)
+    design = {
+        "strata_col": strata_col,
+        "strata": strata,
+        "population": population,
+        "rows": int(len(positions)),
+        "seed": seed,
+    }
+    return df.iloc[positions].reset_index(drop=True), design
+
+def _strata_keys(sample: pd.DataFrame, design: dict) -> pd.Series:
+    if design["strata_col"]:
+        return sample[design["strata_col"]].astype(str)
+    return pd.Series("all", index=sample.index)
+
+def row_weights(sample: pd.DataFrame, design: dict) -> pd.Series:
+    """Population rows each sampled row stands for"""
+    weights = {s["value"]: s["population"] / s["sampled"] for s in design["strata"] if s["sampled"]}
+    return _strata_keys(sample, design).map(weights).astype("float64")
+
+def estimate_total(values: pd.Series, sample: pd.DataFrame, design: dict):
+    """Stratified estimate of the population total of values (NaN counts as 0) and its variance"""
+    values = values.fillna(0).astype("float64")
+    grouped = values.groupby(_strata_keys(sample, design))
+    means = grouped.mean()
+    variances = grouped.var(ddof=1).fillna(0.0)
+    total = 0.0
+    variance = 0.0
+    for s in design["strata"]:
+        if s["value"] not in means.index or not s["sampled"]:
+            continue
+        N, n = s["population"], s["sampled"]
+        total += N * means[s["value"]]
+        variance += N * N * (1 - n / N) * variances[s["value"]] / n
+    return total, variance
+
+def estimate_ratio(numerator: pd.Series, denominator: pd.Series, sample: pd.DataFrame, design: dict):
+    """Ratio of two totals (e.g. a mean) with its linearized variance"""
+    num_total, _ = estimate_total(numerator, sample, design)
+    den_total, _ = estimate_total(denominator, sample, design)
+    if not den_total:
+        return float("nan"), float("nan")
+    ratio = num_total / den_total
+    residuals = numerator.fillna(0) - ratio * denominator.fillna(0)
+    _, residual_variance = estimate_total(residuals, sample, design)
+    return ratio, residual_variance / (den_total * den_total)
+
+def interval(estimate: float, variance: float):
+    half = Z_95 * math.sqrt(max(variance, 0.0))
+    return [estimate - half, estimate + half]
+
+def estimate_mean(values: pd.Series, sample: pd.DataFrame, design: dict):
+    present = values.notna().astype("float64")
+    mean, variance = estimate_ratio(values.where(values.notna(), 0), present, sample, design)
+    return mean, interval(mean, variance)
+
+def domain_estimates(values: pd.Series, agg: str, keys: pd.DataFrame, sample: pd.DataFrame, design: dict) -> pd.DataFrame:
+    """
+    Per-group (domain) estimates of sum, count or mean with 95% intervals, vectorized
+    over (stratum, group) cells: each group's total is a stratified total of the
+    variable zeroed outside the group, and a mean is the ratio of two such totals.
+    """
+    present = values.notna().astype("float64")
+    y = values.fillna(0).astype("float64") if agg in ("sum", "mean") else present
+    if agg == "size":
+        y = pd.Series(1.0, index=values.index)
+    frame = pd.DataFrame({"y": y, "y2": y * y, "p": present, "py": present * y})
+    by = [_strata_keys(sample, design).rename("_stratum")] + [keys[c] for c in keys.columns]
+    cells = frame.groupby(by, sort=False).sum()
+    strata = pd.DataFrame(design["strata"]).set_index("value")
+    N = strata["population"].reindex(cells.index.get_level_values(0)).to_numpy(dtype="float64")
+    n = strata["sampled"].reindex(cells.index.get_level_values(0)).to_numpy(dtype="float64")
+    group_levels = list(range(1, cells.index.nlevels))
+    scale = N / n
+    variance_factor = N * N * (1 - n / N) / n
+
+    def cell_variance(sum_z, sum_z2):
+        # Sample variance within the stratum of a variable that is 0 outside the cell
+        return np.where(n > 1, (sum_z2 - sum_z * sum_z / n) / np.maximum(n - 1, 1), 0.0)
+
+    def by_group(array):
+        return pd.Series(array, index=cells.index).groupby(level=group_levels, sort=False).sum()
+
+    if agg == "mean":
+        num = by_group(scale * cells["y"].to_numpy())
+        den = by_group(scale * cells["p"].to_numpy())
+        ratio = num / den.where(den > 0)
+        r = ratio.reindex(cells.index.droplevel(0)).to_numpy()
+        # Residual e = p * (y - R) per row, summed per cell
+        sum_e = cells["y"].to_numpy() - r * cells["p"].to_numpy()
+        sum_e2 = cells["y2"].to_numpy() - 2 * r * cells["py"].to_numpy() + r * r * cells["p"].to_numpy()
+        variance = by_group(variance_factor * cell_variance(sum_e, sum_e2)) / (den * den)
+        estimate = ratio
+    else:
+        estimate = by_group(scale * cells["y"].to_numpy())
+        variance = by_group(variance_factor * cell_variance(cells["y"].to_numpy(), cells["y2"].to_numpy()))
+    half = Z_95 * np.sqrt(variance.clip(lower=0))
+    return pd.DataFrame({"estimate": estimate, "low": estimate - half, "high": estimate + half})
+
+def weighted_quantiles(values: pd.Series, weights: pd.Series, quantiles):
+    mask = values.notna()
+    order = np.argsort(values[mask].to_numpy())
+    sorted_values = values[mask].to_numpy()[order]
+    cumulative = np.cumsum(weights[mask].to_numpy()[order])
+    if not len(cumulative):
+        return [float("nan")] * len(quantiles)
+    return [float(sorted_values[min(np.searchsorted(cumulative, q * cumulative[-1]), len(sorted_values) - 1)]) for q in quantiles]
+
+def weighted_correlation(x: np.ndarray, y: np.ndarray, w: np.ndarray) -> float:
+    mx, my = np.average(x, weights=w), np.average(y, weights=w)
+    dx, dy = x - mx, y - my
+    return float(np.sum(w * dx * dy) / math.sqrt(np.sum(w * dx * dx) * np.sum(w * dy * dy)))
+
+def estimate_correlation(x: pd.Series, y: pd.Series, weights: pd.Series, sampling_fraction: float = 0.0, groups: int = 20):
+    """
+    Weighted correlation with a delete-a-group jackknife interval, which unlike a
+    Fisher-z interval holds up for the skewed, heavy-tailed measures of sales data
+    """
+    mask = (x.notna() & y.notna()).to_numpy()
+    x = x.to_numpy(dtype="float64")[mask]
+    y = y.to_numpy(dtype="float64")[mask]
+    w = weights.to_numpy(dtype="float64")[mask]
+    if len(x) < 2 * groups:
+        return float("nan"), [float("nan"), float("nan")]
+    r = weighted_correlation(x, y, w)
+    group_of = np.random.default_rng(0).permutation(len(x)) % groups
+    replicates = np.array([weighted_correlation(x[group_of != g], y[group_of != g], w[group_of != g]) for g in range(groups)])
+    variance = (groups - 1) / groups * np.sum((replicates - replicates.mean()) ** 2) * (1 - sampling_fraction)
+    low, high = interval(r, variance)
+    return r, [max(low, -1.0), min(high, 1.0)]
+
+def weighted_chart_frame(sample: pd.DataFrame, design: dict, x_col, y_col, agg: str, grain=None, bounds: list = None) -> pd.DataFrame:
+    """Estimated per-category aggregate of y_col for the chart functions; intervals go to bounds"""
+    if agg not in CHART_AGGS:
+        raise ValueError(f"Unsupported aggregate '{agg}', use one of {', '.join(CHART_AGGS)}")
+    keys = group_keys(sample, x_col, grain).rename(x_col)
+    if agg in ("min", "max"):
+        # Extremes can't be scaled up; the sample's are a lower/upper bound estimate
+        return sample[y_col].groupby(keys).agg(agg).reset_index()
+    estimates = domain_estimates(sample[y_col], agg, keys.to_frame(), sample, design)
+    if bounds is not None:
+        for key, row in estimates.sort_values("estimate", ascending=False).head(10).iterrows():
+            line = f"{agg} of {y_col} for {key}: {_fmt(row['low'])} to {_fmt(row['high'])}"
+            if line not in bounds:
+                bounds.append(line)
+    return estimates["estimate"].rename(y_col).rename_axis(x_col).reset_index()
+
+def _fmt(value):
+    return f"{value:,.4g}" if abs(value) < 1 else f"{value:,.2f}"
+
+class ApproximatePandasTool(PandasTool):
+    """
+    PandasTool over a stratified sample. describe, group_agg and correlation return
+    population estimates in the usual shapes; their 95% intervals are collected in
+    self.bounds for the answer. Exact column stats come from the dataset profile.
+    """
+    def __init__(self, sample: pd.DataFrame, design: dict, profile: dict = None, bounds: list = None):
+        super().__init__(sample)
+        self.design = design
+        self.profile = profile or {}
+        self.weights = row_weights(self.df, design)
+        self.bounds = bounds if bounds is not None else []
+
+    def describe(self, cols=None):
+        cols = cols or [c for c in self.df.columns if pd.api.types.is_numeric_dtype(self.df[c])]
+        out = {}
+        for col in cols:
+            values = self.df[col]
+            if not pd.api.types.is_numeric_dtype(values):
+                out[col] = {"count": int(values.count()), "unique (sample)": int(values.nunique())}
+                continue
+            exact = self.profile.get("columns", {}).get(col)
+            q25, q50, q75 = weighted_quantiles(values, self.weights, [0.25, 0.5, 0.75])
+            stats = {"25%": q25, "50%": q50, "75%": q75}
+            if exact and exact.get("count"):
+                # Count, mean, std, min and max are exact from the stored profile
+                n = exact["count"]
+                mean = exact["sum"] / n
+                stats.update({
+                    "count": n,
+                    "mean": mean,
+                    "std": math.sqrt(max(exact["sumsq"] - n * mean * mean, 0.0) / (n - 1)) if n > 1 else 0.0,
+                    "min": exact["min"],
+                    "max": exact["max"],
+                })
+            else:
+                mean, mean_ci = estimate_mean(values, self.df, self.design)
+                self.bounds.append(f"mean of {col}: {_fmt(mean_ci[0])} to {_fmt(mean_ci[1])}")
+                stats.update({
+                    "count": float(self.weights[values.notna()].sum()),
+                    "mean": float(mean),
+                    "std": float(math.sqrt(np.average((values.dropna() - mean) ** 2, weights=self.weights[values.notna()]))),
+                    "min": float(values.min()),
+                    "max": float(values.max()),
+                })
+            out[col] = {k: stats[k] for k in ("count", "mean", "std", "min", "25%", "50%", "75%", "max")}
+        return out
+
+    def group_agg(self, groupby_cols, agg_cols):
+        groupby_cols = [groupby_cols] if isinstance(groupby_cols, str) else list(groupby_cols)
+        groups = self.df.groupby(groupby_cols, sort=True).size().index
+        records = [dict(zip(groupby_cols, key if isinstance(key, tuple) else (key,))) for key in groups]
+        for col, agg in agg_cols.items():
+            values = self.df[col]
+            if agg not in ("sum", "mean", "count", "size"):
+                # Order statistics can't be scaled up, report the sample's
+                sample_values = values.groupby([self.df[c] for c in groupby_cols]).agg(agg).reindex(groups)
+                for record, value in zip(records, sample_values):
+                    record[col] = value
+                continue
+            estimates = domain_estimates(values, agg, self.df[groupby_cols], self.df, self.design).reindex(groups)
+            for record, key, (estimate, low, high) in zip(records, groups, estimates.itertuples(index=False)):
+                record[col] = estimate
+                if len(self.bounds) < 20:
+                    self.bounds.append(f"{agg} of {col} for {key}: {_fmt(low)} to {_fmt(high)}")
+        return records
+
+    def correlation(self, col_x, col_y):
+        if col_x not in self.df.columns or col_y not in self.df.columns:
+            raise ValueError("missing columns")
+        r, (low, high) = estimate_correlation(self.df[col_x], self.df[col_y], self.weights, self.design["rows"] / self.design["population"])
+        self.bounds.append(f"correlation of {col_x} and {col_y}: {low:.4f} to {high:.4f}")
+        return r
+
+def approximate_label(design: dict, bounds: list) -> str:
+    label = (
+        f"⚠️ Approximate answer: estimated from a stratified sample of {design['rows']:,} of "
+        f"{design['population']:,} rows"
+        f"{' (stratified by ' + str(design['strata_col']) + ')' if design['strata_col'] else ''}."
+    )
+    if bounds:
+        label += "\n95% confidence intervals:\n" + "\n".join(f"• {b}" for b in bounds)
+    else:
+        label += " Counts, means, standard deviations, minima and maxima of whole columns are exact; percentiles are estimated."
+    return label
+
+# Persistence: the sample is stored as a CSV in GridFS, its design on the dataset document
+
+async def store_sample(dataset_doc, df: pd.DataFrame, content_hash: str = None):
+    """
+    Build and store the dataset's sample. With content_hash the sample belongs to that
+    blob and is shared by every dataset uploaded with the same content.
+    """
+    sample, design = await asyncio.to_thread(build_stratified_sample, df, settings.APPROX_SAMPLE_ROWS)
+    content = sample.to_csv(index=False).encode("utf-8")
+    metadata = {"owner_id": dataset_doc.get("owner_id"), "dataset_id": dataset_doc["_id"], "kind": "sample"}
+    design["file_id"] = await upload_file_to_gridfs(content, f"sample-{dataset_doc.get('filename', 'dataset')}", metadata)
+    design["version"] = dataset_doc.get("version", 1)
+    if content_hash:
+        design["content_hash"] = content_hash
+    old = dataset_doc.get("sample")
+    await get_db().datasets.update_one({"_id": dataset_doc["_id"]}, {"$set": {"sample": design}})
+    # A blob's sample is deleted with the blob, other datasets may still use it
+    if old and old.get("file_id") and not old.get("content_hash"):
+        try:
+            await get_gridfs_bucket().delete(old["file_id"])
+        except Exception as e:
+            print(f"Could not delete old sample {old['file_id']}: {e}")
+    print(f"Stored stratified sample of {design['rows']} rows for dataset {dataset_doc['_id']}")
+    return sample, design
+
+async def get_sample(dataset_doc):
+    """(sample, design) for the dataset's current version, building it from the full data if needed"""
+    # Concurrent requests share one download, or one build instead of each storing a sample
+    key = ("sample", str(dataset_doc["_id"]), dataset_doc.get("version", 1))
+    return await single_flight(key, lambda: _get_sample(dataset_doc))
+
+async def _get_sample(dataset_doc):
+    from .dataset_service import load_dataset_to_df, read_csv_from_gridfs
+    design = dataset_doc.get("sample")
+    if design and design.get("version") == dataset_doc.get("version", 1):
+        with span("sample_download", rows=design["rows"]):
+            sample, _ = await read_csv_from_gridfs(design["file_id"])
+        return sample, design
+    df = await load_dataset_to_df(dataset_doc)
+    return await store_sample(dataset_doc, df)
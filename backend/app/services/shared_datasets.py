@@ -0,0 +1,258 @@
+import json
+import os
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+from ..config import settings
+from ..utils.metrics import register_collector
+from .columnar_cache import encode_column, decode_column
+
+# Shared memory mode (DATASET_SHARED_MEMORY=true) for several uvicorn workers on one
+# host. The first worker to load a dataset file publishes its columns, encoded as in
+# columnar_cache, into POSIX shared memory segments named after the file_id, with a
+# manifest segment written last. The other workers attach to the segments instead of
+# holding their own copy. Numeric columns are read-only views of the segments, so
+# their memory is held once per host whatever the number of workers; string columns
+# are rebuilt from the shared codes. A worker unlinks the segments it published when
+# the budget DATASET_SHARED_MEMORY_MAX_BYTES is exceeded and on shutdown. Each worker
+# also keeps at most that many bytes attached, detaching the least recently used
+# datasets, and detaches a dataset once its publication is gone. A detached mapping
+# is closed as soon as no frame handed out still uses it.
+#
+# The manifest header holds the payload length, written last to mark the publication
+# complete, and the publisher's pid: a zero-length manifest whose publisher died
+# mid-publish is reclaimed by the next worker that publishes the file.
+
+PREFIX = "ada_"
+LENGTH_SIZE = 8
+HEADER_SIZE = 16  # payload length, publisher pid
+
+_published = OrderedDict()  # file_id -> (segment names, bytes), published by this worker
+_attached = OrderedDict()  # file_id -> (segments, frame, bytes), least recently used first
+_closing = []  # detached segments still mapped by frames in use
+stats = {"attached": 0, "detached": 0, "published": 0, "unpublished": 0, "reclaimed": 0}
+register_collector(
+    "dataset_shared_memory_total", "Shared memory dataset operations by result", "counter", ("result",),
+    lambda: [((name,), value) for name, value in stats.items()])
+
+def segment_name(file_id, part: str) -> str:
+    return f"{PREFIX}{file_id}_{part}"
+
+def _open(name: str, create: bool = False, size: int = 0):
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    # The segments outlive the worker that opened them, don't let the resource tracker unlink them at exit
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+def _unlink(name: str):
+    try:
+        # Tracked on open and untracked again by unlink()
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+def _exists(name: str) -> bool:
+    try:
+        _open(name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+def _close(segments: list):
+    """Unmap segments, deferring those still viewed by a frame to a later call"""
+    global _closing
+    pending = []
+    for shm in _closing + segments:
+        try:
+            shm.close()
+        except BufferError:
+            pending.append(shm)
+    _closing = pending
+
+def _read_header(meta) -> tuple:
+    length = int.from_bytes(meta.buf[:LENGTH_SIZE], "little")
+    pid = int.from_bytes(meta.buf[LENGTH_SIZE:HEADER_SIZE], "little")
+    return length, pid
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def detach(file_id):
+    """Drop this worker's mapping of file_id; frames already handed out stay valid"""
+    entry = _attached.pop(file_id, None)
+    if entry is None:
+        return
+    segments, frame, _ = entry
+    del frame, entry
+    _close(segments)
+    stats["detached"] += 1
+
+def attach(file_id):
+    """Read-only DataFrame over the published segments of file_id, or None if not published"""
+    if _closing:
+        _close([])
+    if file_id in _attached:
+        if not _exists(segment_name(file_id, "m")):
+            # Unpublished since, let it be loaded and published again
+            detach(file_id)
+            return None
+        _attached.move_to_end(file_id)
+        # Shallow copy: writes by the caller copy the column instead of failing on the read-only buffer
+        return _attached[file_id][1].copy(deep=False)
+    try:
+        meta = _open(segment_name(file_id, "m"))
+    except FileNotFoundError:
+        return None
+    length, _ = _read_header(meta)
+    if not length:
+        # Still being published, or left over by a dead publisher for publish() to reclaim
+        meta.close()
+        return None
+    manifest = json.loads(bytes(meta.buf[HEADER_SIZE:HEADER_SIZE + length]))
+    meta.close()
+    segments = []
+    data = {}
+    try:
+        for i, column in enumerate(manifest["columns"]):
+            arrays = {}
+            for suffix, spec in column["arrays"].items():
+                shm = _open(segment_name(file_id, f"{i}{suffix}"))
+                segments.append(shm)
+                shape = tuple(spec["shape"])
+                # frombuffer holds the buffer export, so closing a segment still viewed fails instead of unmapping it
+                array = np.frombuffer(shm.buf, dtype=np.dtype(spec["dtype"]), count=int(np.prod(shape))).reshape(shape)
+                array.flags.writeable = False
+                arrays[suffix] = array
+            data[column["name"]] = decode_column(column, arrays)
+    except FileNotFoundError:
+        # Unpublished while attaching; drop the views before unmapping
+        data = arrays = array = None
+        _close(segments)
+        return None
+    frame = pd.DataFrame(data, copy=False)
+    size = sum(shm.size for shm in segments)
+    _attached[file_id] = (segments, frame, size)
+    stats["attached"] += 1
+    _enforce_attached_budget(file_id)
+    return frame.copy(deep=False)
+
+def _enforce_attached_budget(keep):
+    while len(_attached) > 1 and sum(size for _, _, size in _attached.values()) > settings.DATASET_SHARED_MEMORY_MAX_BYTES:
+        file_id = next(iter(_attached))
+        if file_id == keep:
+            break
+        detach(file_id)
+
+def _reclaim(file_id) -> bool:
+    """Unlink an unfinished publication of file_id whose publisher has died"""
+    try:
+        meta = _open(segment_name(file_id, "m"))
+    except FileNotFoundError:
+        return True
+    length, pid = _read_header(meta)
+    # pid 0: created an instant ago, the publisher hasn't written its header yet
+    if length or not pid or _alive(pid):
+        meta.close()
+        return False
+    try:
+        # The manifest payload is written before any column, so it names the segments to unlink
+        manifest = json.loads(bytes(meta.buf[HEADER_SIZE:]).rstrip(b"\0"))
+        names = [segment_name(file_id, f"{i}{suffix}")
+                 for i, column in enumerate(manifest["columns"]) for suffix in column["arrays"]]
+    except ValueError:
+        names = []
+    meta.close()
+    for name in names + [segment_name(file_id, "m")]:
+        _unlink(name)
+    stats["reclaimed"] += 1
+    print(f"Reclaimed shared memory left by dead publisher {pid} of {file_id}")
+    return True
+
+def publish(file_id, df: pd.DataFrame) -> bool:
+    """Copy df into shared memory for the other workers; False if it is not published"""
+    if file_id in _published:
+        return False
+    columns = []
+    for col in df.columns:
+        encoded = encode_column(df[col])
+        if encoded is None:
+            return False
+        columns.append((col, *encoded))
+    size = sum(array.nbytes for _, _, arrays in columns for array in arrays.values())
+    if size > settings.DATASET_SHARED_MEMORY_MAX_BYTES:
+        return False
+    manifest = {"rows": len(df), "columns": []}
+    for i, (col, kind, arrays) in enumerate(columns):
+        manifest["columns"].append({
+            "name": str(col),
+            "dtype": str(df[col].dtype),
+            "kind": kind,
+            "arrays": {suffix: {"dtype": array.dtype.str, "shape": list(array.shape)} for suffix, array in arrays.items()},
+        })
+    payload = json.dumps(manifest).encode("utf-8")
+    meta = None
+    for _ in range(2):
+        try:
+            # Creating the manifest segment elects this worker as the publisher
+            meta = _open(segment_name(file_id, "m"), create=True, size=HEADER_SIZE + len(payload))
+            break
+        except FileExistsError:
+            if not _reclaim(file_id):
+                return False
+    if meta is None:
+        return False
+    names = [meta.name]
+    try:
+        meta.buf[LENGTH_SIZE:HEADER_SIZE] = os.getpid().to_bytes(HEADER_SIZE - LENGTH_SIZE, "little")
+        meta.buf[HEADER_SIZE:HEADER_SIZE + len(payload)] = payload
+        for i, (_, _, arrays) in enumerate(columns):
+            for suffix, array in arrays.items():
+                shm = _open(segment_name(file_id, f"{i}{suffix}"), create=True, size=max(array.nbytes, 1))
+                names.append(shm.name)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                shm.close()
+        # A non-zero length marks the publication complete
+        meta.buf[:LENGTH_SIZE] = len(payload).to_bytes(LENGTH_SIZE, "little")
+        meta.close()
+    except Exception:
+        meta.close()
+        for name in names:
+            _unlink(name)
+        raise
+    _published[file_id] = (names, size)
+    stats["published"] += 1
+    _enforce_budget()
+    return True
+
+def unpublish(file_id):
+    detach(file_id)
+    names, _ = _published.pop(file_id, ([], 0))
+    for name in names:
+        _unlink(name)
+    if names:
+        stats["unpublished"] += 1
+
+def _enforce_budget():
+    while len(_published) > 1 and sum(size for _, size in _published.values()) > settings.DATASET_SHARED_MEMORY_MAX_BYTES:
+        unpublish(next(iter(_published)))
+
+def unpublish_all():
+    for file_id in list(_published):
+        unpublish(file_id)
+
+def detach_all():
+    for file_id in list(_attached):
+        detach(file_id)
+    _close([])
@@ -0,0 +1,95 @@
+import numpy as np
+
+# Summary statistics of grouped chart data (one value per category or period),
+# computed with NumPy over every group rather than the top-N slice a chart shows.
+# A total, shares of it and concentration are only given when the values add up:
+# sums, counts or raw values, not averages or extremes per group. Shares and
+# concentration also need non-negative values with a positive total (e.g. sales,
+# not profit). Concentration is the Herfindahl-Hirschman
+# index, the sum of squared shares: 1/groups for equal groups, 1 for a single one.
+# It is labelled after normalizing for the number of groups, so four equal regions
+# read as unconcentrated although their HHI is 0.25.
+
+# Bands of the normalized HHI, as used for market concentration (1500 and 2500 on the 0-10000 scale)
+HHI_MODERATE = 0.15
+HHI_HIGH = 0.25
+
+# Aggregates whose per-group values add up to a meaningful total; None is raw values
+ADDITIVE_AGGS = (None, "sum", "count", "size")
+AGG_WORDS = {"mean": "average", "min": "minimum", "max": "maximum"}
+
+def summarize(labels, values, top: int = 3, agg: str = None) -> dict:
+    """Statistics of values (one per label, aggregated with agg); missing values are left out"""
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.asarray(labels, dtype=object)
+    present = ~np.isnan(values)
+    values, labels = values[present], labels[present]
+    if not len(values):
+        return {"count": 0}
+    order = np.argsort(-values, kind="stable")
+    summary = {
+        "count": len(values),
+        "mean": float(values.mean()),
+        "median": float(np.median(values)),
+        "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+        "min": float(values[order[-1]]),
+        "min_label": labels[order[-1]],
+        "max": float(values[order[0]]),
+        "max_label": labels[order[0]],
+        "top": [(labels[i], float(values[i])) for i in order[:top]],
+    }
+    if agg not in ADDITIVE_AGGS:
+        return summary
+    total = float(values.sum())
+    summary["total"] = total
+    if total > 0 and values.min() >= 0:
+        shares = values[order] / total
+        hhi = float(np.dot(shares, shares))
+        count = len(values)
+        normalized = (hhi - 1 / count) / (1 - 1 / count) if count > 1 else 1.0
+        summary.update({
+            "top_shares": shares[:top].tolist(),
+            "top_share": float(shares[:top].sum()),
+            "hhi": hhi,
+            "hhi_normalized": normalized,
+            "effective_groups": 1 / hhi,
+            "concentration": "high" if normalized >= HHI_HIGH else "moderate" if normalized >= HHI_MODERATE else "low",
+        })
+    return summary
+
+def describe_summary(summary: dict, value_label: str, shown: int = None, ranked: bool = True, agg: str = None) -> str:
+    """Bullet lines for an answer; ranked=False (time series) lists peak and low instead of leaders and shares"""
+    count = summary["count"]
+    if not count:
+        return ""
+    value_label = value_label.lower()
+    if agg not in ADDITIVE_AGGS:
+        value_label = f"{AGG_WORDS.get(agg, agg)} {value_label}"
+    lines = [f"• Total items analyzed: {count:,}"]
+    if shown and shown < count:
+        lines.append(f"• Showing top {shown} items by {value_label}")
+    if ranked and count >= 3:
+        lines.append("• Top 3 performers:")
+        for i, (label, value) in enumerate(summary["top"], 1):
+            share = f" ({summary['top_shares'][i - 1]:.1%} of total)" if "top_shares" in summary else ""
+            lines.append(f"  {i}. {label}: {value:,.2f}{share}")
+    elif not ranked:
+        lines.append(f"• Peak: {summary['max_label']} at {summary['max']:,.2f}")
+        lines.append(f"• Low: {summary['min_label']} at {summary['min']:,.2f}")
+    if "total" in summary:
+        lines.append(f"• Total {value_label}: {summary['total']:,.2f}")
+        lines.append(f"• Average {value_label}: {summary['mean']:,.2f}")
+        lines.append(f"• Median {value_label}: {summary['median']:,.2f}")
+    else:
+        # Averages or extremes of the items don't add up to a total
+        lines.append(f"• Mean of the items' {value_label}: {summary['mean']:,.2f}")
+        lines.append(f"• Median of the items' {value_label}: {summary['median']:,.2f}")
+    if count > 1:
+        lines.append(f"• Range: {summary['min']:,.2f} to {summary['max']:,.2f}")
+    if ranked and "hhi" in summary and count > 1:
+        top = len(summary["top_shares"])
+        lines.append(f"• Top {top} share of total: {summary['top_share']:.1%}")
+        lines.append(
+            f"• Concentration: {summary['concentration']} (HHI {summary['hhi']:.3f}, "
+            f"like {summary['effective_groups']:.1f} equal-sized items of {count:,})")
+    return "\n".join(lines)
@@ -1,11 +1,28 @@
 import pandas as pd
+import operator
 import io
+import types
 import base64
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
 import numpy as np
 from typing import Dict, Any
+from ..utils.tracing import traced
+
+def new_figure(figsize=(8, 5)):
+    """
+    Standalone Figure on its own Agg canvas. Avoids the global pyplot state, so it is
+    safe to use from several threads and is freed as soon as it goes out of scope.
+    matplotlib is imported lazily, it is only needed when an image is actually rendered.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+def figure_to_bytes(fig, fmt="png", dpi=100):
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches="tight")
+    return buf.getvalue()
 
 # PandasTool: wrapper functions to perform common operations
 class PandasTool:
@@ -53,40 +70,91 @@ class PandasTool:
 def df_to_base64_png_plot(df, plot_fn):
     """
     df: pd.DataFrame
-    plot_fn: function that takes (plt, df) and draws on plt
+    plot_fn: function that takes (ax, df) and draws on the matplotlib Axes
     returns: data:image/png;base64,...
     """
-    plt.clf()
-    plot_fn(plt, df)
-    buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    b64 = base64.b64encode(buf.read()).decode("utf-8")
+    fig = new_figure()
+    ax = fig.add_subplot()
+    plot_fn(ax, df)
+    fig.tight_layout()
+    b64 = base64.b64encode(figure_to_bytes(fig, "png")).decode("utf-8")
     return f"data:image/png;base64,{b64}"
 
-# Example plotting helpers (keeping for backward compatibility)
-def plot_bar_top_n(plt, df, x_col, y_col, n=10, title=None):
+def rotate_xticklabels(ax, rotation=45):
+    for label in ax.get_xticklabels():
+        label.set_rotation(rotation)
+        label.set_ha('right')
+
+def _target_axes(target):
+    """Axes to draw on; callers written for the old helpers pass the pyplot module, which gets a new figure as before"""
+    if isinstance(target, types.ModuleType):
+        return target.figure(figsize=(8, 5)).add_subplot()
+    return target
+
+# Example plotting helpers (keeping for backward compatibility: the first argument
+# is an Axes, or the pyplot module as in the original helpers)
+def plot_bar_top_n(ax, df, x_col, y_col, n=10, title=None):
+    ax = _target_axes(ax)
     top = df.sort_values(by=y_col, ascending=False).head(n)
-    plt.figure(figsize=(8,5))
-    plt.bar(top[x_col].astype(str), top[y_col])
-    plt.xticks(rotation=45, ha='right')
-    if title: plt.title(title)
+    ax.bar(top[x_col].astype(str), top[y_col])
+    rotate_xticklabels(ax)
+    if title: ax.set_title(title)
 
-def plot_line_time(plt, df, time_col, value_col, title=None):
+def plot_line_time(ax, df, time_col, value_col, title=None):
+    ax = _target_axes(ax)
     df_sorted = df.sort_values(by=time_col)
-    plt.figure(figsize=(8,5))
-    plt.plot(df_sorted[time_col], df_sorted[value_col], marker='o')
-    plt.xticks(rotation=45, ha='right')
-    if title: plt.title(title)
+    ax.plot(df_sorted[time_col], df_sorted[value_col], marker='o')
+    rotate_xticklabels(ax)
+    if title: ax.set_title(title)
+
+# Aggregates charts can apply per category; mean is derived from sum and count in rollups
+CHART_AGGS = ("sum", "mean", "count", "min", "max")
+TIME_GRAINS = ("month",)
+
+def group_keys(df, col, grain=None):
+    """Grouping key for a chart dimension: the column itself or its dates truncated to the grain"""
+    if grain == "month":
+        return pd.to_datetime(df[col], errors="coerce").dt.to_period("M").astype(str)
+    return df[col]
+
+def default_agg(df, x_col, agg=None, grain=None):
+    """Explicit aggregate, else sum when categories repeat (one bar per category), else None for raw rows"""
+    if agg:
+        return agg
+    if grain or df[x_col].duplicated().any():
+        return "sum"
+    return None
+
+def aggregate_by(df, x_col, y_col, agg, grain=None):
+    if agg not in CHART_AGGS:
+        raise ValueError(f"Unsupported aggregate '{agg}', use one of {', '.join(CHART_AGGS)}")
+    keys = group_keys(df, x_col, grain).rename(x_col)
+    return df[y_col].groupby(keys).agg(agg).reset_index()
+
+FILTER_FUNCS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le, "==": operator.eq, "!=": operator.ne}
+
+def filter_mask(df, filters) -> np.ndarray:
+    """Rows matching all [column, op, number] filters; non-numeric values never match"""
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in filters or []:
+        values = df[col] if pd.api.types.is_numeric_dtype(df[col]) else pd.to_numeric(df[col], errors="coerce")
+        mask &= FILTER_FUNCS[op](values, value).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+def apply_filters(df, filters):
+    return df[filter_mask(df, filters)] if filters else df
 
 # Chart data preparation functions for frontend rendering
-def prepare_bar_chart_data(df, x_col, y_col, n=10, title=None):
+@traced("chart_prepare")
+def prepare_bar_chart_data(df, x_col, y_col, n=10, title=None, agg=None):
     """
     Prepares bar chart data for frontend Chart.js rendering
     Returns structured JSON with chart specification
+    agg (sum, mean, count, min, max) charts one bar per x_col value instead of raw rows
     """
     try:
+        if agg:
+            df = aggregate_by(df, x_col, y_col, agg)
         # Get top N values
         top_data = df.sort_values(by=y_col, ascending=False).head(n)
         
@@ -163,12 +231,16 @@ def prepare_bar_chart_data(df, x_col, y_col, n=10, title=None):
     except Exception as e:
         return {"error": f"Failed to prepare bar chart data: {str(e)}"}
 
-def prepare_line_chart_data(df, time_col, value_col, title=None):
+@traced("chart_prepare")
+def prepare_line_chart_data(df, time_col, value_col, title=None, agg=None, grain=None):
     """
     Prepares line chart data for frontend Chart.js rendering
     Returns structured JSON with chart specification
+    grain="month" buckets time_col by month, aggregated with agg (sum by default)
     """
     try:
+        if agg or grain:
+            df = aggregate_by(df, time_col, value_col, agg or "sum", grain)
         # Sort by time column
         sorted_data = df.sort_values(by=time_col)
         
@@ -228,12 +300,16 @@ def prepare_line_chart_data(df, time_col, value_col, title=None):
     except Exception as e:
         return {"error": f"Failed to prepare line chart data: {str(e)}"}
 
-def prepare_pie_chart_data(df, label_col, value_col, title=None, n=10):
+@traced("chart_prepare")
+def prepare_pie_chart_data(df, label_col, value_col, title=None, n=10, agg=None):
     """
     Prepares pie chart data for frontend Chart.js rendering
     Returns structured JSON with chart specification
+    agg (sum, mean, count, min, max) gives one slice per label_col value instead of raw rows
     """
     try:
+        if agg:
+            df = aggregate_by(df, label_col, value_col, agg)
         # Get top N values for pie chart
         top_data = df.sort_values(by=value_col, ascending=False).head(n)
         
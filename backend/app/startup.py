@@ -0,0 +1,52 @@
+import importlib
+import time
+from contextlib import contextmanager
+
+# Heavy modules that stay out of the import path of app.main and are only
+# loaded by the first request that needs them, unless warm_up() runs first
+WARMUP_MODULES = [
+    "langchain.agents",
+    "langchain_core.prompts",
+    "langchain_google_genai",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+    f"{__package__}.services.agent_service",
+]
+
+startup_report = {"steps": [], "total_ms": 0.0}
+
+@contextmanager
+def timed(step: str):
+    """Record how long a startup step takes in startup_report"""
+    start = time.perf_counter()
+    entry = {"step": step}
+    try:
+        yield
+    except Exception as e:
+        entry["error"] = str(e)
+        raise
+    finally:
+        entry["ms"] = round((time.perf_counter() - start) * 1000, 2)
+        startup_report["steps"].append(entry)
+        startup_report["total_ms"] = round(startup_report["total_ms"] + entry["ms"], 2)
+
+def warm_up():
+    """Import the lazily loaded modules and create the LLM client ahead of the first request"""
+    for module in WARMUP_MODULES:
+        try:
+            with timed(f"import {module}"):
+                importlib.import_module(module)
+        except Exception as e:
+            print(f"Warm-up import of {module} failed: {e}")
+    try:
+        with timed("llm client"):
+            from .services.agent_service import get_llm_client
+            get_llm_client()
+    except Exception as e:
+        print(f"Warm-up of the LLM client failed: {e}")
+
+def print_startup_report():
+    print(f"Startup finished in {startup_report['total_ms']:.1f} ms")
+    for entry in startup_report["steps"]:
+        status = f" (failed: {entry['error']})" if "error" in entry else ""
+        print(f"  {entry['ms']:>9.1f} ms  {entry['step']}{status}")
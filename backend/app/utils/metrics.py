@@ -0,0 +1,154 @@
+import threading
+from typing import Callable, Dict, List, Tuple
+
+# Minimal in-process Prometheus metrics. Updates are O(1) dictionary operations under a
+# lock that is never held across I/O, so recording from request handlers, executor
+# threads or LangChain callbacks never blocks the event loop. /metrics renders the text
+# exposition format on demand.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+SIZE_BUCKETS = (1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10)
+
+_lock = threading.Lock()
+_registry = []
+_collectors = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts, sum, count]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (bucket_counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def register_collector(name: str, documentation: str, metric_type: str, labelnames: Tuple[str, ...], collect: Callable):
+    """Metric read at scrape time from existing state, e.g. the hit/miss dicts kept by each cache"""
+    _collectors.append((name, documentation, metric_type, tuple(labelnames), collect))
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for name, documentation, metric_type, labelnames, collect in _collectors:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for label_values, value in collect():
+            lines.append(f"{name}{_format_labels(labelnames, label_values)} {value}")
+    return "\n".join(lines) + "\n"
+
+# Metrics recorded across the app
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+analyze_duration = Histogram(
+    "analyze_duration_seconds", "POST /analyze latency by answer path (fast_path, agent, degraded, fallback, error)", ("path",))
+llm_calls_per_question = Histogram(
+    "llm_calls_per_question", "LLM calls made by the agent for one question", buckets=COUNT_BUCKETS)
+llm_tokens_per_question = Histogram(
+    "llm_tokens_per_question", "LLM tokens used for one question", ("direction",), buckets=TOKEN_BUCKETS)
+llm_calls_total = Counter("llm_calls_total", "LLM calls made by the agent", ("provider",))
+blob_uploads = Counter("dataset_blob_uploads_total", "Uploaded files by whether their content was already stored", ("result",))
+rollup_lookups = Counter("rollup_lookups_total", "Chart questions checked against materialized rollups", ("result",))
+dataset_load_duration = Histogram("dataset_load_seconds", "Time to load a dataset into a DataFrame")
+dataset_load_bytes = Histogram("dataset_load_bytes", "Size of loaded dataset files", buckets=SIZE_BUCKETS)
+dataset_memory_bytes = Histogram("dataset_memory_bytes", "In-memory size of loaded DataFrames", buckets=SIZE_BUCKETS)
+dataset_rows = Histogram("dataset_rows", "Rows of loaded DataFrames", buckets=SIZE_BUCKETS)
+
+def usage_callbacks():
+    """LangChain callback handler that sums token usage; read .calls/.input_tokens/.output_tokens after the run"""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class UsageCallbackHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.calls = 0
+            self.input_tokens = 0
+            self.output_tokens = 0
+
+        def on_llm_end(self, response, **kwargs):
+            self.calls += 1
+            try:
+                usage = response.generations[0][0].message.usage_metadata or {}
+            except (IndexError, AttributeError):
+                usage = {}
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+
+    return UsageCallbackHandler()
+
+def record_llm_usage(usage, provider: str):
+    llm_calls_per_question.observe(usage.calls)
+    llm_calls_total.inc(usage.calls, provider=provider)
+    llm_tokens_per_question.observe(usage.input_tokens, direction="input")
+    llm_tokens_per_question.observe(usage.output_tokens, direction="output")
+
+def answer_path(result: dict) -> str:
+    """Which path produced an analyze_question result"""
+    if result.get("degraded"):
+        return "degraded"
+    if "error" in result:
+        return "error"
+    if "agent_iterations" in result:
+        return "agent"
+    return "fast_path"
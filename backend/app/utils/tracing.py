@@ -0,0 +1,188 @@
+import contextvars
+import functools
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from uuid import UUID
+from ..config import settings
+
+# Lightweight request tracing. Spans follow the OpenTelemetry data model (trace/span
+# ids, parent ids, unix-nano timestamps, attributes) and each finished request trace
+# is exported to the console, a JSON-lines file, or replayed into whatever
+# OpenTelemetry SDK the deployment configured (TRACING_EXPORTER=otel). The same
+# spans feed the Server-Timing response header.
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+
+    def new_span(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> dict:
+        record = {
+            "name": name,
+            "trace_id": self.trace_id,
+            "span_id": os.urandom(8).hex(),
+            "parent_span_id": parent_id,
+            "start_time_unix_nano": time.time_ns(),
+            "end_time_unix_nano": None,
+            "attributes": dict(attributes),
+            "status": "OK",
+        }
+        self.spans.append(record)
+        return record
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: total duration per span name, in span start order"""
+        totals = {}
+        counts = {}
+        for record in self.spans:
+            if record["end_time_unix_nano"] is None or record["parent_span_id"] is None:
+                continue
+            metric = re.sub(r"[^A-Za-z0-9_]", "_", record["name"])
+            duration_ms = (record["end_time_unix_nano"] - record["start_time_unix_nano"]) / 1e6
+            totals[metric] = totals.get(metric, 0.0) + duration_ms
+            counts[metric] = counts.get(metric, 0) + 1
+        parts = []
+        for metric, duration_ms in totals.items():
+            entry = f"{metric};dur={duration_ms:.1f}"
+            if counts[metric] > 1:
+                entry += f';desc="{counts[metric]} calls"'
+            parts.append(entry)
+        root = self.spans[0] if self.spans else None
+        if root and root["end_time_unix_nano"]:
+            parts.append(f"total;dur={(root['end_time_unix_nano'] - root['start_time_unix_nano']) / 1e6:.1f}")
+        return ", ".join(parts)
+
+def start_trace(name: str) -> Optional[Trace]:
+    if not settings.TRACING_ENABLED:
+        return None
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span; a no-op outside a traced request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield {}
+        return
+    record = trace.new_span(name, _current_span.get(), attributes)
+    token = _current_span.set(record["span_id"])
+    try:
+        yield record["attributes"]
+    except BaseException as e:
+        record["status"] = "ERROR"
+        record["attributes"]["error"] = str(e)
+        raise
+    finally:
+        record["end_time_unix_nano"] = time.time_ns()
+        _current_span.reset(token)
+
+def traced(name: str):
+    """Decorator form of span() for plain functions"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def export_trace(trace: Trace):
+    exporter = settings.TRACING_EXPORTER.lower()
+    if exporter == "console":
+        for record in trace.spans:
+            duration_ms = ((record["end_time_unix_nano"] or time.time_ns()) - record["start_time_unix_nano"]) / 1e6
+            print(f"[trace {trace.trace_id[:8]}] {record['name']}: {duration_ms:.1f} ms {record['attributes'] or ''}")
+    elif exporter == "file":
+        with open(settings.TRACING_FILE_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"trace_id": trace.trace_id, "name": trace.name, "spans": trace.spans}, default=str) + "\n")
+    elif exporter == "otel":
+        _export_to_opentelemetry(trace)
+
+def _export_to_opentelemetry(trace: Trace):
+    try:
+        from opentelemetry import trace as otel_trace
+    except ImportError:
+        print("TRACING_EXPORTER=otel requires the opentelemetry-api package")
+        return
+    tracer = otel_trace.get_tracer("ai-data-analyst")
+    otel_spans = {}
+    for record in trace.spans:
+        parent = otel_spans.get(record["parent_span_id"])
+        context = otel_trace.set_span_in_context(parent) if parent is not None else None
+        attributes = {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in record["attributes"].items()}
+        otel_span = tracer.start_span(record["name"], context=context, attributes=attributes, start_time=record["start_time_unix_nano"])
+        if record["status"] == "ERROR":
+            otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR))
+        otel_spans[record["span_id"]] = otel_span
+    for record in reversed(trace.spans):
+        otel_spans[record["span_id"]].end(end_time=record["end_time_unix_nano"] or time.time_ns())
+
+def langchain_tracing_callbacks():
+    """LangChain callback handlers that record each LLM and tool call of the current request"""
+    trace = _current_trace.get()
+    if trace is None:
+        return []
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TracingCallbackHandler(BaseCallbackHandler):
+        # Spans are attached to the request trace directly since tool callbacks can
+        # run in executor threads that don't share the request's context
+        def __init__(self, parent_id: Optional[str]):
+            self.parent_id = parent_id
+            self.open_spans = {}
+
+        def _start(self, run_id: UUID, name: str, **attributes):
+            self.open_spans[run_id] = trace.new_span(name, self.parent_id, attributes)
+
+        def _end(self, run_id: UUID, error: BaseException = None, **attributes):
+            record = self.open_spans.pop(run_id, None)
+            if record is None:
+                return
+            record["end_time_unix_nano"] = time.time_ns()
+            record["attributes"].update(attributes)
+            if error is not None:
+                record["status"] = "ERROR"
+                record["attributes"]["error"] = str(error)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._start(run_id, "llm")
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(run_id, "llm")
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            usage = {}
+            try:
+                message = response.generations[0][0].message
+                usage = dict(getattr(message, "usage_metadata", None) or {})
+            except (IndexError, AttributeError):
+                pass
+            self._end(run_id, **usage)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+
+        def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+            self._start(run_id, f"tool.{(serialized or {}).get('name', 'unknown')}")
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+
+    return [TracingCallbackHandler(_current_span.get())]
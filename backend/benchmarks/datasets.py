@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Synthetic sales-style datasets for the benchmarks. Rows are generated and written in
+# chunks so even the 50M row file never has to fit in memory, and a fixed seed makes
+# every run produce byte-identical files.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CHUNK_ROWS = 1_000_000
+
+REGIONS = {
+    "West": ["California", "Washington", "Oregon", "Nevada", "Arizona", "Colorado", "Utah"],
+    "South": ["Texas", "Florida", "Georgia", "Tennessee", "Louisiana", "Alabama", "Kentucky"],
+    "Northeast": ["New York", "Pennsylvania", "Massachusetts", "New Jersey", "Connecticut", "Maine"],
+    "Midwest": ["Illinois", "Ohio", "Michigan", "Indiana", "Minnesota", "Wisconsin", "Missouri"],
+}
+CATEGORIES = {
+    "Furniture": ["Chairs", "Tables", "Bookcases", "Furnishings"],
+    "Office Supplies": ["Binders", "Paper", "Storage", "Art", "Labels", "Envelopes"],
+    "Technology": ["Phones", "Accessories", "Machines", "Copiers"],
+}
+
+def parse_size(size: str) -> int:
+    """"10k" -> 10000, "50m" -> 50000000"""
+    size = size.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(size[-1], 1)
+    return int(float(size.rstrip("km")) * multiplier)
+
+def size_label(rows: int) -> str:
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}m"
+    if rows >= 1_000 and rows % 1_000 == 0:
+        return f"{rows // 1_000}k"
+    return str(rows)
+
+def generate_chunk(rng: np.random.Generator, start: int, rows: int) -> pd.DataFrame:
+    states = [(state, region) for region, names in REGIONS.items() for state in names]
+    products = [(product, category) for category, names in CATEGORIES.items() for product in names]
+    state_idx = rng.integers(0, len(states), rows)
+    product_idx = rng.integers(0, len(products), rows)
+    quantity = rng.integers(1, 11, rows)
+    unit_price = rng.lognormal(3.5, 1.0, rows)
+    discount = rng.choice([0.0, 0.0, 0.0, 0.1, 0.2, 0.3, 0.5], rows)
+    sales = quantity * unit_price * (1 - discount)
+    profit = sales * rng.normal(0.12, 0.15, rows) - discount * unit_price
+    order_date = np.datetime64("2022-01-01") + rng.integers(0, 3 * 365, rows).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "order_id": np.arange(start, start + rows),
+        "order_date": order_date,
+        "region": np.array([region for _, region in states])[state_idx],
+        "state": np.array([state for state, _ in states])[state_idx],
+        "category": np.array([category for _, category in products])[product_idx],
+        "product": np.array([product for product, _ in products])[product_idx],
+        "quantity": quantity,
+        "sales": sales.round(2),
+        "profit": profit.round(2),
+        "discount": discount,
+    })
+
+def generate_sales_csv(rows: int, seed: int = 42, path: str = None) -> str:
+    """Write (or reuse) a synthetic sales CSV with the given number of rows; returns its path"""
+    path = path or os.path.join(DATA_DIR, f"sales_{size_label(rows)}_seed{seed}.csv")
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    tmp_path = path + ".tmp"
+    for start in range(0, rows, CHUNK_ROWS):
+        chunk = generate_chunk(rng, start, min(CHUNK_ROWS, rows - start))
+        chunk.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    # Only complete files are reused by later runs
+    os.replace(tmp_path, path)
+    return path
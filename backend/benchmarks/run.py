@@ -0,0 +1,242 @@
+"""
+Benchmarks for the analyze pipeline on synthetic sales datasets.
+
+    cd backend
+    python -m benchmarks.run --sizes 10k,100k,1m --repeat 5
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --tolerance 0.25
+
+Each benchmark is timed --repeat times after a warm-up call (p50/p95/p99/max), then
+run once more under tracemalloc for its peak Python/NumPy allocation. --compare
+exits with status 1 when a p50 or peak memory regressed beyond --tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+# The end-to-end benchmark must never reach a real provider or the Mongo server
+os.environ["LLM_PROVIDER"] = "FAKE"
+os.environ["LLM_FAKE_SCRIPT_PATH"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_script.json")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["TRACING_EXPORTER"] = "none"
+# The per-worker token bucket would throttle the tight benchmark loop
+os.environ["LLM_RESILIENCE_ENABLED"] = "false"
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import numpy as np
+import pandas as pd
+
+from .datasets import generate_sales_csv, parse_size, size_label
+
+DEFAULT_SIZES = "10k,100k"
+# GridFS default chunk size, for the in-memory download
+GRIDFS_CHUNK_SIZE = 255 * 1024
+QUESTIONS = [
+    "show me the top 10 states by sales",
+    "what are the columns?",
+    "what is the average profit?",
+    "is there a correlation between sales and profit?",
+    "compare each region's share of sales",
+]
+
+def measure(fn, repeat: int) -> dict:
+    # The app and the agent print progress on every call, keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _measure(fn, repeat)
+
+def _measure(fn, repeat: int) -> dict:
+    fn()  # warm-up: imports, caches, first-touch allocations
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "max_ms": max(timings),
+        "peak_mb": peak / 2**20,
+        "repeat": repeat,
+    }
+
+class FakeCollection:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one(self, *args, **kwargs):
+        return self.doc
+
+class FakeDB:
+    def __init__(self, doc):
+        self.datasets = FakeCollection(doc)
+
+async def asgi_post(app, path: str, params: dict) -> int:
+    """POST through the full ASGI app (middleware, routing, handler) without a server"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": urlencode(params).encode(), "headers": [],
+        "server": ("benchmark", 80), "client": ("benchmark", 0),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return next(m["status"] for m in messages if m["type"] == "http.response.start")
+
+def run_size(rows: int, repeat: int, loop, skip_e2e: bool) -> dict:
+    from app.services import dataset_service
+    from app.services.mongo_service import GridFSReader
+    from app.services.query_parser import parse_chart_query, should_use_direct_parsing, classify_query
+    from app.services.tools import PandasTool, prepare_bar_chart_data, prepare_line_chart_data, prepare_pie_chart_data
+
+    path = generate_sales_csv(rows)
+    with open(path, "rb") as f:
+        content = f.read()
+
+    # Serve the dataset from memory instead of GridFS, through the same streaming reader
+    class MemoryGridOut:
+        metadata = None
+
+        def __init__(self):
+            self.position = 0
+
+        async def readchunk(self):
+            chunk = content[self.position:self.position + GRIDFS_CHUNK_SIZE]
+            self.position += len(chunk)
+            return chunk
+
+    async def open_memory_reader(file_id):
+        return GridFSReader(MemoryGridOut(), asyncio.get_running_loop())
+    dataset_service.open_gridfs_reader = open_memory_reader
+    dataset_doc = {"_id": "benchmark", "file_id": "benchmark", "filename": os.path.basename(path)}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = loop.run_until_complete(dataset_service.load_dataset_to_df(dataset_doc))
+    columns = list(df.columns)
+    tool = PandasTool(df)
+
+    benchmarks = {
+        "load_dataset_to_df": lambda: loop.run_until_complete(dataset_service.load_dataset_to_df(dataset_doc)),
+        "query_parser": lambda: [
+            (should_use_direct_parsing(q), classify_query(q), parse_chart_query(q, columns)) for q in QUESTIONS
+        ],
+        "PandasTool.__init__": lambda: PandasTool(df),
+        "PandasTool.describe": lambda: tool.describe(["sales", "profit"]),
+        "PandasTool.describe_all": lambda: tool.describe(),
+        "PandasTool.group_agg": lambda: tool.group_agg(["region", "category"], {"sales": "sum", "profit": "mean"}),
+        "PandasTool.filter": lambda: tool.filter("quantity == 10 and discount == 0.5 and sales > 500"),
+        "PandasTool.top_n": lambda: tool.top_n("sales", 10),
+        "PandasTool.correlation": lambda: tool.correlation("sales", "profit"),
+        "prepare_bar_chart_data": lambda: prepare_bar_chart_data(df, "state", "sales", n=10),
+        "prepare_line_chart_data": lambda: prepare_line_chart_data(df, "order_date", "sales"),
+        "prepare_pie_chart_data": lambda: prepare_pie_chart_data(df, "region", "sales", n=7),
+    }
+
+    if not skip_e2e:
+        from app.main import app
+        from app.routers import analyze as analyze_router
+        analyze_router.get_db = lambda: FakeDB(dataset_doc)
+        for question in QUESTIONS:
+            def analyze(question=question):
+                status = loop.run_until_complete(asgi_post(app, "/analyze/", {"dataset_id": "0" * 24, "question": question}))
+                if status != 200:
+                    raise RuntimeError(f"/analyze returned {status} for {question!r}")
+            benchmarks[f"analyze: {question}"] = analyze
+
+    results = {}
+    for name, fn in benchmarks.items():
+        results[name] = measure(fn, repeat)
+        print_row(name, results[name])
+    return results
+
+def print_row(name: str, result: dict):
+    print(
+        f"  {name:<60} p50 {result['p50_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms  "
+        f"p99 {result['p99_ms']:>10.2f} ms  peak {result['peak_mb']:>9.1f} MB"
+    )
+
+def compare(results: dict, baseline: dict, tolerance: float, noise_ms: float = 1.0) -> list:
+    """Names of benchmarks whose p50 or peak memory grew by more than tolerance"""
+    regressions = []
+    print(f"\nComparison with baseline (tolerance {tolerance:.0%}):")
+    for key, result in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            print(f"  {key:<70} new")
+            continue
+        time_ratio = result["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        memory_ratio = result["peak_mb"] / base["peak_mb"] if base["peak_mb"] else 1.0
+        slower = time_ratio > 1 + tolerance and result["p50_ms"] - base["p50_ms"] > noise_ms
+        bigger = memory_ratio > 1 + tolerance and result["peak_mb"] - base["peak_mb"] > 1.0
+        status = "REGRESSION" if slower or bigger else "ok"
+        if status != "ok":
+            regressions.append(key)
+        print(f"  {key:<70} p50 x{time_ratio:.2f}  peak x{memory_ratio:.2f}  {status}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analyze pipeline on synthetic datasets")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated row counts, e.g. 10k,100k,1m,10m,50m")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-e2e", action="store_true", help="skip the end-to-end /analyze benchmarks")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    loop = asyncio.new_event_loop()
+    results = {}
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        print(f"\n== {size_label(rows)} rows ==")
+        for name, result in run_size(rows, args.repeat, loop, args.skip_e2e).items():
+            results[f"{size_label(rows)}/{name}"] = result
+    loop.close()
+
+    if args.save_baseline:
+        baseline = {
+            "meta": {
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": results,
+        }
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
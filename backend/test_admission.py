@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bson import ObjectId
+from app.config import settings
+from app.routers import analyze as analyze_router
+from app.services import admission
+from app.services.admission import admit, single_flight, WorkerSaturated
+
+class _Limits:
+    """Temporarily lower the admission settings"""
+
+    def __init__(self, **limits):
+        self.limits = limits
+
+    def __enter__(self):
+        self.saved = {name: getattr(settings, name) for name in self.limits}
+        for name, value in self.limits.items():
+            setattr(settings, name, value)
+
+    def __exit__(self, *exc):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+
+async def _saturate(hold: asyncio.Event):
+    """One running request and one waiting, with ANALYZE_MAX_CONCURRENT=1 and ANALYZE_MAX_QUEUED=1"""
+    async def request(key):
+        async with admit({key: 0}):
+            await hold.wait()
+    tasks = [asyncio.create_task(request("running")), asyncio.create_task(request("queued"))]
+    while len(admission._waiters) < 1:
+        await asyncio.sleep(0)
+    return tasks
+
+def test_queue_full_rejected_with_retry_after():
+    async def run():
+        hold = asyncio.Event()
+        tasks = await _saturate(hold)
+        try:
+            async with admit({"third": 0}):
+                raise AssertionError("admitted past a full queue")
+        except WorkerSaturated as e:
+            assert e.retry_after == settings.ANALYZE_RETRY_AFTER_S
+        hold.set()
+        await asyncio.gather(*tasks)
+        assert admission._running == 0 and not admission._waiters
+    with _Limits(ANALYZE_MAX_CONCURRENT=1, ANALYZE_MAX_QUEUED=1, ANALYZE_QUEUE_TIMEOUT_S=5.0):
+        asyncio.run(run())
+
+def test_analyze_returns_503_when_saturated():
+    dataset_id = ObjectId()
+    dataset_doc = {
+        "_id": dataset_id,
+        "filename": "sales.csv",
+        "rows": 1000,
+        "columns": [{"name": "region", "dtype": "str"}, {"name": "sales", "dtype": "float64"}],
+    }
+
+    class Datasets:
+        async def find_one(self, query):
+            return dataset_doc if query["_id"] == dataset_id else None
+
+    class Db:
+        datasets = Datasets()
+
+    async def run():
+        hold = asyncio.Event()
+        tasks = await _saturate(hold)
+        try:
+            response = await analyze_router.analyze(
+                dataset_id=str(dataset_id), question="what is the average sales?",
+                approximate=False, dataset_ids=None, if_none_match=None)
+        finally:
+            hold.set()
+            await asyncio.gather(*tasks)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(settings.ANALYZE_RETRY_AFTER_S)
+
+    get_db = analyze_router.get_db
+    analyze_router.get_db = lambda: Db()
+    try:
+        with _Limits(ANALYZE_MAX_CONCURRENT=1, ANALYZE_MAX_QUEUED=1, ANALYZE_QUEUE_TIMEOUT_S=5.0):
+            asyncio.run(run())
+    finally:
+        analyze_router.get_db = get_db
+
+def test_concurrent_loads_share_one_task():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def run():
+        joined = admission.load_stats["joined"]
+        first, second = await asyncio.gather(single_flight("key", load), single_flight("key", load))
+        assert first is second
+        assert len(calls) == 1
+        assert admission.load_stats["joined"] == joined + 1
+        # Finished loads are forgotten, the next caller loads again
+        assert "key" not in admission._loads
+        await single_flight("key", load)
+        assert len(calls) == 2
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_queue_full_rejected_with_retry_after()
+    test_analyze_returns_503_when_saturated()
+    test_concurrent_loads_share_one_task()
+    print("✅ admission tests passed")
@@ -0,0 +1,44 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.query_parser import parse_chart_query, parse_filters
+
+COLUMNS = ["Region", "State", "Year", "Sales", "Profit", "Discount"]
+
+def test_numeric_filters():
+    filters, _ = parse_filters("bar chart of sales by region where profit > 100", COLUMNS)
+    assert filters == [["Profit", ">", 100.0]]
+    filters, _ = parse_filters("top 5 states by sales with discount at least 0.2", COLUMNS)
+    assert filters == [["Discount", ">=", 0.2]]
+    filters, _ = parse_filters("sales by state with profit under 25", COLUMNS)
+    assert filters == [["Profit", "<", 25.0]]
+
+def test_time_spans_are_not_filters():
+    for question in [
+        "bar chart of sales over 2 years by region",
+        "show sales by year over 5 years as a bar chart",
+        "profit above 12 months ago by state",
+        "sales over 25 years by region",
+    ]:
+        filters, _ = parse_filters(question.lower(), COLUMNS)
+        assert filters == [], (question, filters)
+
+def test_time_span_questions_keep_the_fast_path():
+    parsed = parse_chart_query("bar chart of sales over 2 years by region", COLUMNS)
+    assert parsed and (parsed["x_col"], parsed["y_col"], parsed["filters"]) == ("Region", "Sales", [])
+    parsed = parse_chart_query("show sales by year over 5 years as a bar chart", COLUMNS)
+    assert parsed and parsed["filters"] == [] and " where " not in parsed["title"]
+    assert (parsed["x_col"], parsed["y_col"]) == ("Year", "Sales")
+
+def test_filtered_chart_title():
+    parsed = parse_chart_query("bar chart of sales by region where profit > 1000000", COLUMNS)
+    assert parsed["filters"] == [["Profit", ">", 1000000.0]]
+    assert parsed["title"].endswith(" where Profit > 1000000")
+
+if __name__ == "__main__":
+    test_numeric_filters()
+    test_time_spans_are_not_filters()
+    test_time_span_questions_keep_the_fast_path()
+    test_filtered_chart_title()
+    print("✅ query parser tests passed")
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+import uuid
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+from app.services import shared_datasets
+from app.services.shared_datasets import segment_name
+
+def _frame():
+    return pd.DataFrame({
+        "region": ["East", "West", "East", "South"],
+        "sales": [10.5, 20.0, 30.25, 40.0],
+        "quantity": [1, 2, 3, 4],
+    })
+
+def test_publish_attach_unpublish():
+    file_id = uuid.uuid4().hex
+    df = _frame()
+    assert shared_datasets.publish(file_id, df)
+    try:
+        attached = shared_datasets.attach(file_id)
+        pd.testing.assert_frame_equal(attached, df, check_dtype=False)
+        assert file_id in shared_datasets._attached
+        # Writes copy the column rather than touching the shared buffer
+        attached.loc[0, "sales"] = -1.0
+        assert shared_datasets.attach(file_id).loc[0, "sales"] == 10.5
+    finally:
+        shared_datasets.unpublish(file_id)
+    assert file_id not in shared_datasets._attached
+    assert not shared_datasets._exists(segment_name(file_id, "m"))
+    assert shared_datasets.attach(file_id) is None
+    # Frames handed out before unpublishing stay readable
+    assert attached["quantity"].tolist() == [1, 2, 3, 4]
+    del attached
+    shared_datasets._close([])
+    assert not shared_datasets._closing
+
+def test_attached_dataset_detached_once_unpublished_elsewhere():
+    file_id = uuid.uuid4().hex
+    assert shared_datasets.publish(file_id, _frame())
+    assert shared_datasets.attach(file_id) is not None
+    # Another worker's publication going away: the segments are unlinked but this worker stays attached
+    names, _ = shared_datasets._published.pop(file_id)
+    for name in names:
+        shared_datasets._unlink(name)
+    assert shared_datasets.attach(file_id) is None
+    assert file_id not in shared_datasets._attached
+
+def test_attached_bytes_bounded():
+    first, second = uuid.uuid4().hex, uuid.uuid4().hex
+    try:
+        assert shared_datasets.publish(first, _frame())
+        assert shared_datasets.publish(second, _frame())
+        assert shared_datasets.attach(first) is not None
+        size = shared_datasets._attached[first][2]
+        limit = shared_datasets.settings.DATASET_SHARED_MEMORY_MAX_BYTES
+        shared_datasets.settings.DATASET_SHARED_MEMORY_MAX_BYTES = size
+        try:
+            assert shared_datasets.attach(second) is not None
+        finally:
+            shared_datasets.settings.DATASET_SHARED_MEMORY_MAX_BYTES = limit
+        assert list(shared_datasets._attached) == [second]
+    finally:
+        shared_datasets.unpublish(first)
+        shared_datasets.unpublish(second)
+
+def test_stale_manifest_reclaimed():
+    file_id = uuid.uuid4().hex
+    # A publisher that died after creating its manifest, before marking it complete
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    meta = shared_datasets._open(segment_name(file_id, "m"), create=True, size=64)
+    meta.buf[shared_datasets.LENGTH_SIZE:shared_datasets.HEADER_SIZE] = child.pid.to_bytes(8, "little")
+    meta.close()
+    assert shared_datasets.attach(file_id) is None
+    try:
+        assert shared_datasets.publish(file_id, _frame())
+        assert shared_datasets.attach(file_id) is not None
+    finally:
+        shared_datasets.unpublish(file_id)
+
+def test_live_publisher_not_reclaimed():
+    file_id = uuid.uuid4().hex
+    meta = shared_datasets._open(segment_name(file_id, "m"), create=True, size=64)
+    meta.buf[shared_datasets.LENGTH_SIZE:shared_datasets.HEADER_SIZE] = os.getpid().to_bytes(8, "little")
+    try:
+        assert not shared_datasets.publish(file_id, _frame())
+    finally:
+        meta.close()
+        shared_datasets._unlink(segment_name(file_id, "m"))
+
+if __name__ == "__main__":
+    test_publish_attach_unpublish()
+    test_attached_dataset_detached_once_unpublished_elsewhere()
+    test_attached_bytes_bounded()
+    test_stale_manifest_reclaimed()
+    test_live_publisher_not_reclaimed()
+    print("✅ shared dataset tests passed")
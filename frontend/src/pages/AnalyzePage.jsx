@@ -14,8 +14,15 @@ const AnalyzePage = () => {
   useEffect(() => {
     const fetchDatasets = async () => {
       try {
-        const response = await axios.get('/files/list');
-        setDatasets(response.data.datasets);
+        // The list is paged; follow next_after_id so older datasets stay selectable
+        const all = [];
+        let afterId = null;
+        do {
+          const response = await axios.get('/files/list', { params: afterId ? { after_id: afterId } : {} });
+          all.push(...response.data.datasets);
+          afterId = response.data.next_after_id;
+        } while (afterId);
+        setDatasets(all);
       } catch (err) {
         setFetchError('Error fetching datasets: ' + err.message);
       }